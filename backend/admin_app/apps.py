@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class AdminAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'admin_app'
+
+    def ready(self):
+        # Register the statistics signal handlers
+        from . import signals  # noqa: F401
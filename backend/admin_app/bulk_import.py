@@ -0,0 +1,268 @@
+"""
+Bulk patient registration from CSV or JSON Lines.
+
+Rows go through the same field validation as AdminPatientRegistrationSerializer,
+but the per-row database checks are replaced by one lookup per batch, password
+hashing can be spread over a process pool, and each batch is written with
+bulk_create (User, PatientProfile, hms.Patient and the Patient group link)
+inside its own transaction. Only the import_patients command starts a pool
+(settings.BULK_IMPORT_HASH_WORKERS processes); the upload endpoint hashes in
+the web worker, which must not fork a pool of Django processes per request. Results are yielded one row at a time so callers
+can stream a report while the import is still running.
+
+bulk_create does not send post_save signals, so the patient statistics counter
+is bumped once per batch instead, and no auditlog entries are written for
+imported patients. A finished import queues one SystemLog entry and a full
+statistics refresh as background tasks.
+"""
+import csv
+import io
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.db import IntegrityError, transaction
+from rest_framework import serializers
+
+from hms.models import Patient
+from hms.search import build_search_text, local_index
+from patient_app.models import PatientProfile
+from . import statistics as stats
+from . import tasks
+from .serializers import AdminPatientRegistrationSerializer
+
+FORMATS = ('csv', 'jsonl')
+
+GENDER_ALIASES = {'M': 'Male', 'F': 'Female', 'O': 'Other'}
+
+
+class BulkPatientRowSerializer(AdminPatientRegistrationSerializer):
+    """Field validation for one import row; uniqueness is checked per batch by PatientImporter."""
+
+    def validate(self, data):
+        if data['password'] != data['confirm_password']:
+            raise serializers.ValidationError({"confirm_password": "Passwords don't match."})
+        return data
+
+
+def detect_format(filename='', content_type=''):
+    """Guess the input format from a file name or content type, defaulting to CSV."""
+    if filename.endswith(('.jsonl', '.ndjson')) or 'json' in (content_type or ''):
+        return 'jsonl'
+    return 'csv'
+
+
+def read_rows(stream, fmt):
+    """Yield one dict per input row from a text stream in the given format."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported format '{fmt}'. Use one of: {', '.join(FORMATS)}.")
+    if fmt == 'csv':
+        for row in csv.DictReader(stream):
+            # Empty CSV cells mean "not provided"
+            yield {key: value for key, value in row.items() if key and value not in (None, '')}
+    else:
+        for line in stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as exc:
+                row = {'__error__': f'Invalid JSON: {exc.msg}'}
+            yield row if isinstance(row, dict) else {'__error__': 'Each line must be a JSON object.'}
+
+
+def text_stream(binary_file, encoding='utf-8'):
+    """Wrap an uploaded (binary) file so read_rows can iterate decoded lines."""
+    return io.TextIOWrapper(binary_file, encoding=encoding, newline='')
+
+
+def _init_hash_worker():
+    # Worker processes started with "spawn" need the app registry before hashing
+    django.setup()
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class PatientImporter:
+    """
+    Validate and insert patient rows in batches.
+
+    Use as a context manager so the password hashing pool is shut down, and
+    iterate run(rows) to get one result dict per row:
+    {'row', 'username', 'status' ('created', 'valid' or 'error'), ...}.
+    """
+
+    def __init__(self, batch_size=None, workers=1, dry_run=False):
+        self.batch_size = batch_size or settings.BULK_IMPORT_BATCH_SIZE
+        self.workers = workers
+        self.dry_run = dry_run
+        self.created = 0
+        self.failed = 0
+        self.started = None
+        self._pool = None
+        self._patient_group = None
+
+    def __enter__(self):
+        if self.workers > 1 and not self.dry_run:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_hash_worker)
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started if self.started else 0.0
+
+    def run(self, rows):
+        self.started = time.monotonic()
+        self._patient_group = Group.objects.filter(name='Patient').first()
+        seen_usernames = set()
+        seen_reg_nums = set()
+        for batch in chunked(enumerate(rows, start=1), self.batch_size):
+            yield from self._process_batch(batch, seen_usernames, seen_reg_nums)
+        if self.created:
+            # Per-row audit entries and welcome emails are skipped for imports
+            tasks.record_system_log.enqueue(
+                f"Bulk import registered {self.created} patients ({self.failed} rows failed)"
+            )
+            tasks.refresh_statistics.enqueue()
+
+    def _process_batch(self, batch, seen_usernames, seen_reg_nums):
+        results = {}
+        valid = []
+        for row_number, row in batch:
+            if '__error__' in row:
+                results[row_number] = self._error(row_number, row, {'row': [row['__error__']]})
+                continue
+            serializer = BulkPatientRowSerializer(data=row)
+            if serializer.is_valid():
+                valid.append((row_number, serializer.validated_data))
+            else:
+                results[row_number] = self._error(row_number, row, serializer.errors)
+
+        # One query each for usernames and registration numbers already taken
+        taken_usernames = set(User.objects.filter(
+            username__in=[data['username'] for _, data in valid]
+        ).values_list('username', flat=True))
+        taken_reg_nums = set(Patient.objects.filter(
+            reg_num__in=[data['reg_num'] for _, data in valid]
+        ).values_list('reg_num', flat=True))
+
+        accepted = []
+        for row_number, data in valid:
+            if data['username'] in taken_usernames or data['username'] in seen_usernames:
+                results[row_number] = self._error(
+                    row_number, data, {'username': ['This username is already taken.']}
+                )
+            elif data['reg_num'] in taken_reg_nums or data['reg_num'] in seen_reg_nums:
+                results[row_number] = self._error(
+                    row_number, data, {'reg_num': ['This registration number is already registered.']}
+                )
+            else:
+                seen_usernames.add(data['username'])
+                seen_reg_nums.add(data['reg_num'])
+                accepted.append((row_number, data))
+
+        if accepted:
+            if self.dry_run:
+                for row_number, data in accepted:
+                    results[row_number] = {'row': row_number, 'username': data['username'], 'status': 'valid'}
+            else:
+                results.update(self._insert(accepted))
+
+        for row_number, _ in batch:
+            yield results[row_number]
+
+    def _hash_passwords(self, passwords):
+        if self._pool is None:
+            return [make_password(password) for password in passwords]
+        chunksize = max(1, len(passwords) // (self.workers * 4))
+        return list(self._pool.map(make_password, passwords, chunksize=chunksize))
+
+    def _insert(self, accepted):
+        hashes = self._hash_passwords([data['password'] for _, data in accepted])
+        try:
+            with transaction.atomic():
+                users = self._create_batch(accepted, hashes)
+        except IntegrityError:
+            # Another registration took a username or reg_num after the batch
+            # was checked; insert row by row so only the conflicting rows fail
+            return self._insert_one_by_one(accepted, hashes)
+        self.created += len(users)
+        return {
+            row_number: self._created(row_number, user)
+            for (row_number, _), user in zip(accepted, users)
+        }
+
+    def _insert_one_by_one(self, accepted, hashes):
+        results = {}
+        for (row_number, data), password_hash in zip(accepted, hashes):
+            try:
+                with transaction.atomic():
+                    [user] = self._create_batch([(row_number, data)], [password_hash])
+            except IntegrityError as exc:
+                results[row_number] = self._error(row_number, data, {'non_field_errors': [str(exc)]})
+            else:
+                self.created += 1
+                results[row_number] = self._created(row_number, user)
+        return results
+
+    def _create_batch(self, accepted, hashes):
+        users = User.objects.bulk_create([
+            User(
+                username=data['username'], email=data['email'], password=password_hash,
+                first_name=data['first_name'], last_name=data['last_name'],
+            )
+            for (_, data), password_hash in zip(accepted, hashes)
+        ])
+        profiles = []
+        patients = []
+        for (_, data), user in zip(accepted, users):
+            gender = GENDER_ALIASES.get(data['gender'], data['gender'])
+            profiles.append(PatientProfile(
+                user=user, date_of_birth=data['date_of_birth'], gender=gender,
+                contact_number=data.get('contact_number', ''), address=data.get('address', ''),
+            ))
+            patients.append(Patient(
+                user=user, reg_num=data['reg_num'], first_name=data['first_name'], last_name=data['last_name'],
+                gender=gender, date_of_birth=data['date_of_birth'],
+                contact_number=data.get('contact_number', ''),
+                email=data['email'] or f"{data['reg_num']}@giki.edu.pk",
+            ))
+        for patient, user in zip(patients, users):
+            patient.search_text = build_search_text(patient, user)
+        PatientProfile.objects.bulk_create(profiles)
+        Patient.objects.bulk_create(patients)
+        local_index.invalidate()
+        if self._patient_group is not None:
+            User.groups.through.objects.bulk_create([
+                User.groups.through(user_id=user.pk, group_id=self._patient_group.pk) for user in users
+            ])
+        stats.bump(stats.PATIENTS, len(patients))
+        return users
+
+    def _created(self, row_number, user):
+        return {'row': row_number, 'username': user.username, 'status': 'created', 'user_id': user.pk}
+
+    def _error(self, row_number, row, errors):
+        self.failed += 1
+        return {
+            'row': row_number,
+            'username': row.get('username'),
+            'status': 'error',
+            'errors': {field: [str(message) for message in messages] if isinstance(messages, (list, tuple))
+                       else [str(messages)] for field, messages in errors.items()},
+        }
@@ -2,8 +2,8 @@ from django import forms
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm
 from patient_app.models import PatientProfile
-from hms.models import Doctor
-from receptionist_app.models import Receptionist
+from hms.models import Doctor, Receptionist
+from .tasks import registration_completed
 
 class AdminUserRegistrationForm(forms.ModelForm):
     """Base form for admin to register users with username and password"""
@@ -78,6 +78,7 @@ class AdminPatientRegistrationForm(AdminUserRegistrationForm):
         
         if commit:
             patient.save()
+            registration_completed(user, 'Patient')
         
         return patient
 
@@ -113,6 +114,7 @@ class AdminDoctorRegistrationForm(AdminUserRegistrationForm):
         
         if commit:
             doctor.save()
+            registration_completed(user, 'Doctor')
         
         return doctor
 
@@ -136,6 +138,9 @@ class AdminReceptionistRegistrationForm(AdminUserRegistrationForm):
         
         receptionist = Receptionist(
             user=user,
+            first_name=user.first_name,
+            last_name=user.last_name,
+            email=user.email,
             contact_number=self.cleaned_data.get('contact_number'),
             address=self.cleaned_data.get('address'),
             date_of_birth=self.cleaned_data.get('date_of_birth')
@@ -143,5 +148,6 @@ class AdminReceptionistRegistrationForm(AdminUserRegistrationForm):
         
         if commit:
             receptionist.save()
+            registration_completed(user, 'Receptionist')
         
         return receptionist 
\ No newline at end of file
@@ -0,0 +1,53 @@
+import json
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from admin_app.bulk_import import FORMATS, PatientImporter, detect_format, read_rows
+
+
+class Command(BaseCommand):
+    help = (
+        'Registers patients in bulk from a CSV or JSON Lines file (use - for stdin). '
+        'Columns match the admin patient registration form. Writes one JSON result per row.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Input file, or - to read from stdin')
+        parser.add_argument('--format', choices=FORMATS, help='Input format (default: from the file extension)')
+        parser.add_argument('--batch-size', type=int, help='Rows validated and inserted per transaction')
+        parser.add_argument('--workers', type=int, help='Processes used to hash passwords (default: settings.BULK_IMPORT_HASH_WORKERS)')
+        parser.add_argument('--report', help='Write the per-row report to this file instead of stdout')
+        parser.add_argument('--dry-run', action='store_true', help='Validate rows without creating anything')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or detect_format(path)
+        try:
+            source = sys.stdin if path == '-' else open(path, encoding='utf-8', newline='')
+        except OSError as exc:
+            raise CommandError(f"Cannot read {path}: {exc}")
+        report = open(options['report'], 'w', encoding='utf-8') if options['report'] else self.stdout
+        workers = options['workers'] if options['workers'] is not None else settings.BULK_IMPORT_HASH_WORKERS
+
+        try:
+            with PatientImporter(
+                batch_size=options['batch_size'], workers=workers, dry_run=options['dry_run']
+            ) as importer:
+                for result in importer.run(read_rows(source, fmt)):
+                    report.write(json.dumps(result, default=str) + '\n')
+        finally:
+            if source is not sys.stdin:
+                source.close()
+            if report is not self.stdout:
+                report.close()
+
+        total = importer.created + importer.failed
+        rate = total / importer.elapsed * 60 if importer.elapsed else 0
+        style = self.style.SUCCESS if not importer.failed else self.style.WARNING
+        verb = 'validated' if options['dry_run'] else 'created'
+        self.stdout.write(style(
+            f"{total} rows processed in {importer.elapsed:.2f}s ({rate:.0f} rows/min): "
+            f"{total - importer.failed} {verb}, {importer.failed} failed."
+        ))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from admin_app.statistics import refresh_statistics
+from admin_app.tasks import schedule_reconciliation
+
+
+class Command(BaseCommand):
+    help = (
+        'Recomputes the cached report statistics from the source tables. '
+        'Corrects drift from bulk updates that bypass signals, and queues the periodic '
+        'reconciliation task if it is not waiting already.'
+    )
+
+    def handle(self, *args, **options):
+        count = refresh_statistics()
+        schedule_reconciliation()
+        self.stdout.write(self.style.SUCCESS(f"Statistics refreshed ({count} counters)."))
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-17 22:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatisticCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(max_length=50)),
+                ('dimension', models.CharField(blank=True, default='', max_length=100)),
+                ('value', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['metric', '-value'], name='statcounter_metric_value_idx')],
+                'unique_together': {('metric', 'dimension')},
+            },
+        ),
+    ]
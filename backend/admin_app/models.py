@@ -1,3 +1,47 @@
+from django.contrib.auth.models import User
 from django.db import models
 
-# Create your models here.
+
+class StatisticCounter(models.Model):
+    """
+    Pre-aggregated value backing the admin report and the statistics API.
+
+    Each row holds one metric (optionally broken down by a dimension such as an
+    appointment status or a doctor id). Rows are kept current by the signal
+    handlers in admin_app.signals and rebuilt by ``manage.py refresh_statistics``.
+    """
+    metric = models.CharField(max_length=50)
+    dimension = models.CharField(max_length=100, blank=True, default='')
+    value = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('metric', 'dimension')
+        indexes = [
+            models.Index(fields=['metric', '-value'], name='statcounter_metric_value_idx'),
+        ]
+
+    def __str__(self):
+        label = f"{self.metric}[{self.dimension}]" if self.dimension else self.metric
+        return f"{label} = {self.value}"
+
+
+class SystemLog(models.Model):
+    """Application-level log entry shown on the admin dashboard's logs tab."""
+    LEVEL_CHOICES = [
+        ('DEBUG', 'Debug'),
+        ('INFO', 'Info'),
+        ('WARNING', 'Warning'),
+        ('ERROR', 'Error'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='system_logs')
+    level = models.CharField(max_length=10, choices=LEVEL_CHOICES, default='INFO')
+    message = models.TextField()
+    timestamp = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['-timestamp']
+
+    def __str__(self):
+        return f"[{self.level}] {self.timestamp:%Y-%m-%d %H:%M} {self.message[:50]}"
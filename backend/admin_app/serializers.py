@@ -1,8 +1,13 @@
+import logging
+
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.db import transaction
 from patient_app.models import PatientProfile
-from hms.models import Doctor, Patient
-from receptionist_app.models import Receptionist
+from hms.models import Doctor, Patient, Receptionist
+from .tasks import registration_completed
+
+logger = logging.getLogger(__name__)
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -70,8 +75,6 @@ class AdminPatientRegistrationSerializer(AdminUserRegistrationSerializer):
         contact_number = validated_data.pop('contact_number', '')
         address = validated_data.pop('address', '')
         
-        print(f"Processing patient registration with gender: {gender}")
-        
         # Standardize gender value to match HMS Patient model choices
         # Make sure gender is one of 'Male', 'Female', 'Other'
         if gender in ['M', 'm']:
@@ -86,22 +89,21 @@ class AdminPatientRegistrationSerializer(AdminUserRegistrationSerializer):
         last_name = validated_data.get('last_name')
         email = validated_data.get('email')
         
-        # Create User instance with remaining validated_data
-        user = self.create_user(validated_data)
-        
-        # Create PatientProfile instance
-        patient_profile = PatientProfile.objects.create(
-            user=user,
-            date_of_birth=date_of_birth,
-            gender=gender,
-            contact_number=contact_number,
-            address=address
-        )
-        
-        # Create HMS Patient instance
-        from hms.models import Patient
-        try:
+        # User, PatientProfile and the canonical HMS Patient (linked to the
+        # user) are created together or not at all
+        with transaction.atomic():
+            user = self.create_user(validated_data)
+
+            patient_profile = PatientProfile.objects.create(
+                user=user,
+                date_of_birth=date_of_birth,
+                gender=gender,
+                contact_number=contact_number,
+                address=address
+            )
+
             hms_patient = Patient.objects.create(
+                user=user,
                 reg_num=reg_num,
                 first_name=first_name,
                 last_name=last_name,
@@ -110,16 +112,11 @@ class AdminPatientRegistrationSerializer(AdminUserRegistrationSerializer):
                 contact_number=contact_number,
                 email=email
             )
-            print(f"Created HMS Patient: {hms_patient.patient_id} - {hms_patient.first_name} {hms_patient.last_name}")
-        except Exception as e:
-            print(f"ERROR creating HMS Patient: {str(e)}")
-            # Log all field values for debugging
-            print(f"reg_num: {reg_num}, first_name: {first_name}, last_name: {last_name}")
-            print(f"gender: {gender}, date_of_birth: {date_of_birth}")
-            print(f"contact_number: {contact_number}, email: {email}")
-            # Still return the patient_profile even if HMS Patient creation fails
-        
-        print(f"Created User {user.id}, PatientProfile {patient_profile.user_id}")
+            registration_completed(user, 'Patient')
+        logger.debug(
+            "Created user, patient profile and HMS patient",
+            extra={'user_id': user.id, 'patient_id': hms_patient.patient_id},
+        )
         
         return patient_profile
     
@@ -141,33 +138,10 @@ class AdminPatientRegistrationSerializer(AdminUserRegistrationSerializer):
             'address': instance.address
         }
         
-        # Get the associated HMS Patient record
-        try:
-            # Try to find by reg_num using username, name match as fallback
-            hms_patient = Patient.objects.get(
-                reg_num=instance.user.username,
-                first_name=instance.user.first_name,
-                last_name=instance.user.last_name
-            )
-            patient_data['hms_patient_id'] = hms_patient.patient_id
-            patient_data['reg_num'] = hms_patient.reg_num
-        except Patient.DoesNotExist:
-            try:
-                # Try by name only as last resort
-                hms_patient = Patient.objects.filter(
-                    first_name=instance.user.first_name,
-                    last_name=instance.user.last_name
-                ).first()
-                if hms_patient:
-                    patient_data['hms_patient_id'] = hms_patient.patient_id
-                    patient_data['reg_num'] = hms_patient.reg_num
-                else:
-                    patient_data['hms_patient_id'] = None
-                    patient_data['reg_num'] = None
-            except Exception as e:
-                print(f"Error finding HMS Patient: {e}")
-                patient_data['hms_patient_id'] = None
-                patient_data['reg_num'] = None
+        # The HMS Patient is linked to the same user
+        hms_patient = getattr(instance.user, 'hms_patient', None)
+        patient_data['hms_patient_id'] = hms_patient.patient_id if hms_patient else None
+        patient_data['reg_num'] = hms_patient.reg_num if hms_patient else None
         
         return {**user_data, **patient_data}
 
@@ -194,6 +168,7 @@ class AdminDoctorRegistrationSerializer(AdminUserRegistrationSerializer):
             department=validated_data['department'],
             contact_number=validated_data.get('contact_number', '')
         )
+        registration_completed(user, 'Doctor')
         
         return doctor
     
@@ -233,13 +208,17 @@ class AdminReceptionistRegistrationSerializer(AdminUserRegistrationSerializer):
         # Create User instance
         user = self.create_user(validated_data)
         
-        # Create Receptionist instance
+        # Create the HMS Receptionist, the single receptionist record
         receptionist = Receptionist.objects.create(
             user=user,
+            first_name=user.first_name,
+            last_name=user.last_name,
+            email=user.email,
             contact_number=validated_data.get('contact_number', ''),
             address=validated_data.get('address', ''),
             date_of_birth=validated_data.get('date_of_birth')
         )
+        registration_completed(user, 'Receptionist')
         
         return receptionist
     
@@ -254,7 +233,7 @@ class AdminReceptionistRegistrationSerializer(AdminUserRegistrationSerializer):
         }
         
         receptionist_data = {
-            'receptionist_id': instance.pk,
+            'receptionist_id': instance.receptionist_id,
             'contact_number': instance.contact_number,
             'address': instance.address,
             'date_of_birth': instance.date_of_birth,
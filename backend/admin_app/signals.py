@@ -0,0 +1,85 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from hms.models import Appointment, Billing, Doctor, Patient
+from . import statistics as stats
+
+
+@receiver(pre_save, sender=Appointment)
+def remember_appointment_state(sender, instance, **kwargs):
+    """Keep the stored status/doctor so post_save can move the counters between buckets."""
+    instance._stats_previous = None
+    if instance.pk:
+        instance._stats_previous = sender.objects.filter(pk=instance.pk).values_list(
+            'status', 'doctor_id'
+        ).first()
+
+
+@receiver(post_save, sender=Appointment)
+def count_appointment_save(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_stats_previous', None)
+    if created or previous is None:
+        stats.bump(stats.APPOINTMENTS, 1)
+        stats.bump(stats.APPOINTMENTS_BY_STATUS, 1, instance.status)
+        stats.bump(stats.APPOINTMENTS_BY_DOCTOR, 1, instance.doctor_id)
+        return
+
+    old_status, old_doctor_id = previous
+    if old_status != instance.status:
+        stats.bump(stats.APPOINTMENTS_BY_STATUS, -1, old_status)
+        stats.bump(stats.APPOINTMENTS_BY_STATUS, 1, instance.status)
+    if old_doctor_id != instance.doctor_id:
+        stats.bump(stats.APPOINTMENTS_BY_DOCTOR, -1, old_doctor_id)
+        stats.bump(stats.APPOINTMENTS_BY_DOCTOR, 1, instance.doctor_id)
+
+
+@receiver(post_delete, sender=Appointment)
+def count_appointment_delete(sender, instance, **kwargs):
+    stats.bump(stats.APPOINTMENTS, -1)
+    stats.bump(stats.APPOINTMENTS_BY_STATUS, -1, instance.status)
+    stats.bump(stats.APPOINTMENTS_BY_DOCTOR, -1, instance.doctor_id)
+
+
+@receiver(pre_save, sender=Billing)
+def remember_billing_amount(sender, instance, **kwargs):
+    instance._stats_previous_amount = None
+    if instance.pk:
+        instance._stats_previous_amount = sender.objects.filter(pk=instance.pk).values_list(
+            'amount', flat=True
+        ).first()
+
+
+@receiver(post_save, sender=Billing)
+def count_billing_save(sender, instance, created, **kwargs):
+    previous_amount = getattr(instance, '_stats_previous_amount', None) or 0
+    stats.bump(stats.REVENUE, instance.amount - previous_amount)
+
+
+@receiver(post_delete, sender=Billing)
+def count_billing_delete(sender, instance, **kwargs):
+    stats.bump(stats.REVENUE, -instance.amount)
+
+
+@receiver(post_save, sender=Patient)
+def count_patient_save(sender, instance, created, **kwargs):
+    if created:
+        stats.bump(stats.PATIENTS, 1)
+
+
+@receiver(post_delete, sender=Patient)
+def count_patient_delete(sender, instance, **kwargs):
+    stats.bump(stats.PATIENTS, -1)
+
+
+@receiver(post_save, sender=Doctor)
+def count_doctor_save(sender, instance, created, **kwargs):
+    if created:
+        stats.bump(stats.DOCTORS, 1)
+
+
+@receiver(post_delete, sender=Doctor)
+def count_doctor_delete(sender, instance, **kwargs):
+    stats.bump(stats.DOCTORS, -1)
+    stats.StatisticCounter.objects.filter(
+        metric=stats.APPOINTMENTS_BY_DOCTOR, dimension=str(instance.doctor_id)
+    ).delete()
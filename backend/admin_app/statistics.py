@@ -0,0 +1,166 @@
+"""
+Incrementally maintained statistics for the admin report and statistics API.
+
+Counts and sums are stored in StatisticCounter rows. Signal handlers adjust
+them as appointments, bills, patients and doctors change, so readers never
+aggregate over the hot tables. Bulk ``update()``/``bulk_create`` calls bypass
+signals, so ``refresh_statistics`` recomputes everything from scratch; the
+admin_app.tasks.reconcile_statistics task does so every
+settings.STATISTICS_RECONCILE_SECONDS and queues its next run.
+
+Only a refresh writes the BUILT marker row. Until it exists the counters
+are not trusted: rows that bump() created on a deployment that had data
+before the counters did start from the delta. A read that finds no marker
+queues the build as a background task and returns empty statistics flagged
+as ``building`` rather than scanning the tables inside the request.
+"""
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+
+from hms.models import Appointment, Billing, Doctor, Patient
+from .models import StatisticCounter
+
+PATIENTS = 'patients'
+DOCTORS = 'doctors'
+APPOINTMENTS = 'appointments'
+REVENUE = 'revenue'
+APPOINTMENTS_BY_STATUS = 'appointments_by_status'
+APPOINTMENTS_BY_DOCTOR = 'appointments_by_doctor'
+# Written by refresh_statistics() only; see the module docstring
+BUILT = 'built'
+
+TOP_DOCTORS_LIMIT = 5
+
+
+def bump(metric, delta, dimension=''):
+    """Atomically add delta to a counter, creating the row if it is missing."""
+    if not delta:
+        return
+    dimension = str(dimension)
+    updated = StatisticCounter.objects.filter(metric=metric, dimension=dimension).update(
+        value=F('value') + delta
+    )
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            StatisticCounter.objects.create(metric=metric, dimension=dimension, value=delta)
+    except IntegrityError:
+        # Another request created the row first; apply our delta on top of it
+        StatisticCounter.objects.filter(metric=metric, dimension=dimension).update(
+            value=F('value') + delta
+        )
+
+
+def refresh_statistics():
+    """
+    Recompute every counter from the source tables and replace the stored values.
+
+    The counter rows are locked before counting, so a concurrent bump() either
+    committed its change before the counts are taken or waits and applies its
+    delta on top of the new values; none is lost.
+    """
+    with transaction.atomic():
+        list(StatisticCounter.objects.select_for_update().values_list('pk', flat=True))
+        counters = _count_sources()
+        StatisticCounter.objects.all().delete()
+        StatisticCounter.objects.bulk_create(counters)
+    return len(counters)
+
+
+def _count_sources():
+    status_counts = {status: 0 for status, _ in Appointment._meta.get_field('status').choices}
+    status_counts.update(
+        Appointment.objects.values_list('status').annotate(count=Count('pk')).order_by()
+    )
+    doctor_counts = Doctor.objects.annotate(appointment_count=Count('appointments')).values_list(
+        'doctor_id', 'appointment_count'
+    )
+
+    counters = [
+        StatisticCounter(metric=BUILT, value=1),
+        StatisticCounter(metric=PATIENTS, value=Patient.objects.count()),
+        StatisticCounter(metric=DOCTORS, value=Doctor.objects.count()),
+        StatisticCounter(metric=APPOINTMENTS, value=Appointment.objects.count()),
+        StatisticCounter(
+            metric=REVENUE,
+            value=Billing.objects.aggregate(total=Sum('amount'))['total'] or 0,
+        ),
+    ]
+    counters.extend(
+        StatisticCounter(metric=APPOINTMENTS_BY_STATUS, dimension=status, value=count)
+        for status, count in status_counts.items()
+    )
+    counters.extend(
+        StatisticCounter(metric=APPOINTMENTS_BY_DOCTOR, dimension=str(doctor_id), value=count)
+        for doctor_id, count in doctor_counts
+    )
+    return counters
+
+
+def get_statistics():
+    """
+    Return the report statistics from the counter table.
+
+    Reads a fixed number of small rows regardless of how many patients,
+    appointments or bills exist. Before the counters were first built this
+    queues the build (which also starts the periodic reconciliation) and
+    returns zeros with 'building' set.
+    """
+    counters = list(
+        StatisticCounter.objects.exclude(metric=APPOINTMENTS_BY_DOCTOR).values_list(
+            'metric', 'dimension', 'value'
+        )
+    )
+    if not any(metric == BUILT for metric, _, _ in counters):
+        from .tasks import schedule_build
+
+        schedule_build()
+        return {
+            'patients': 0,
+            'doctors': 0,
+            'appointments': 0,
+            'revenue': Decimal('0'),
+            'appointments_by_status': [],
+            'top_doctors': [],
+            'building': True,
+        }
+
+    totals = {}
+    by_status = []
+    for metric, dimension, value in counters:
+        if metric == APPOINTMENTS_BY_STATUS:
+            by_status.append({'status': dimension, 'count': int(value)})
+        else:
+            totals[metric] = value
+    by_status.sort(key=lambda item: item['count'], reverse=True)
+
+    top_counters = list(
+        StatisticCounter.objects.filter(metric=APPOINTMENTS_BY_DOCTOR)
+        .order_by('-value')[:TOP_DOCTORS_LIMIT]
+        .values_list('dimension', 'value')
+    )
+    doctors = Doctor.objects.in_bulk([int(doctor_id) for doctor_id, _ in top_counters])
+    top_doctors = []
+    for doctor_id, value in top_counters:
+        doctor = doctors.get(int(doctor_id))
+        if doctor is None:
+            continue
+        top_doctors.append({
+            'doctor_id': doctor.doctor_id,
+            'first_name': doctor.first_name,
+            'last_name': doctor.last_name,
+            'appointment_count': int(value),
+        })
+
+    return {
+        'patients': int(totals.get(PATIENTS, 0)),
+        'doctors': int(totals.get(DOCTORS, 0)),
+        'appointments': int(totals.get(APPOINTMENTS, 0)),
+        'revenue': totals.get(REVENUE, Decimal('0')),
+        'appointments_by_status': by_status,
+        'top_doctors': top_doctors,
+        'building': False,
+    }
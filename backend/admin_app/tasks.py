@@ -0,0 +1,70 @@
+"""Audit, notification and reporting work queued by the admin views (see task_queue)."""
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.mail import send_mail
+from django.utils import timezone
+
+from task_queue.models import Task
+from task_queue.registry import enqueue, task
+from . import statistics as stats
+from .models import SystemLog
+
+
+@task()
+def record_system_log(message, level='INFO', user_id=None):
+    SystemLog.objects.create(message=message, level=level, user_id=user_id)
+
+
+@task()
+def send_welcome_email(user_id, role):
+    user = User.objects.filter(pk=user_id).first()
+    if user is None or not user.email:
+        return
+    send_mail(
+        subject='Your hospital account is ready',
+        message=(
+            f"Hello {user.get_full_name() or user.username},\n\n"
+            f"A {role.lower()} account has been created for you. Your username is {user.username}."
+        ),
+        from_email=None,
+        recipient_list=[user.email],
+    )
+
+
+@task(priority=-10)
+def refresh_statistics():
+    stats.refresh_statistics()
+
+
+@task(priority=-10)
+def reconcile_statistics():
+    """Periodic rebuild of the counters, correcting drift from bulk updates; queues the next run."""
+    stats.refresh_statistics()
+    schedule_reconciliation()
+
+
+def schedule_build():
+    """Queue the first build of the counters now, unless one is already due."""
+    if Task.objects.filter(
+        name=reconcile_statistics.name, status__in=[Task.PENDING, Task.RUNNING], run_at__lte=timezone.now()
+    ).exists():
+        return
+    reconcile_statistics.enqueue()
+
+
+def schedule_reconciliation():
+    """Queue the next reconcile_statistics run unless one is already waiting."""
+    # Eager mode runs tasks right away, which would loop instead of waiting
+    if settings.TASK_QUEUE_EAGER or not settings.STATISTICS_RECONCILE_SECONDS:
+        return
+    if Task.objects.filter(name=reconcile_statistics.name, status=Task.PENDING).exists():
+        return
+    enqueue(reconcile_statistics.name, delay=timedelta(seconds=settings.STATISTICS_RECONCILE_SECONDS))
+
+
+def registration_completed(user, role):
+    """Queue the audit entry and welcome email for a newly registered account."""
+    record_system_log.enqueue(f"Registered {role.lower()} account '{user.username}'", user_id=user.pk)
+    send_welcome_email.enqueue(user.pk, role)
@@ -1,3 +1,274 @@
-from django.test import TestCase
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import override_settings
+from django.db.models import Count, Sum
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from hms.models import Appointment, Billing, Doctor, Patient
+from task_queue.models import Task
+from .models import StatisticCounter
+from .tasks import reconcile_statistics
+from .statistics import get_statistics, refresh_statistics
+
+
+class StatisticsCounterTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = User.objects.create_superuser(
+            username='stats_admin', password='adminpassword', email='stats_admin@example.com'
+        )
+        cls.doctor_one = Doctor.objects.create(
+            first_name='Ayesha', last_name='Khan', specialization='Cardiology', department='Cardiology'
+        )
+        cls.doctor_two = Doctor.objects.create(
+            first_name='Bilal', last_name='Ahmed', specialization='General', department='OPD'
+        )
+        cls.patient = Patient.objects.create(
+            reg_num='2021001', first_name='Sara', last_name='Ali', gender='Female',
+            date_of_birth=date(2002, 5, 1)
+        )
+
+    def _appointment(self, doctor, status_value='Scheduled'):
+        return Appointment.objects.create(
+            patient=self.patient, doctor=doctor, reason='Checkup', status=status_value,
+            appointment_date=timezone.now() + timedelta(days=1)
+        )
+
+    def assertMatchesSourceTables(self):
+        stats = get_statistics()
+        self.assertEqual(stats['patients'], Patient.objects.count())
+        self.assertEqual(stats['doctors'], Doctor.objects.count())
+        self.assertEqual(stats['appointments'], Appointment.objects.count())
+        self.assertEqual(stats['revenue'], Billing.objects.aggregate(total=Sum('amount'))['total'] or 0)
+        expected_statuses = dict(
+            Appointment.objects.values_list('status').annotate(count=Count('pk')).order_by()
+        )
+        actual_statuses = {item['status']: item['count'] for item in stats['appointments_by_status'] if item['count']}
+        self.assertEqual(actual_statuses, expected_statuses)
+
+    def test_counters_follow_appointment_and_billing_changes(self):
+        refresh_statistics()
+        first = self._appointment(self.doctor_one)
+        second = self._appointment(self.doctor_one)
+        self._appointment(self.doctor_two, 'Completed')
+        bill = Billing.objects.create(patient=self.patient, appointment=first, amount=Decimal('1500.00'))
+        self.assertMatchesSourceTables()
+
+        first.status = 'Completed'
+        first.save()
+        second.doctor = self.doctor_two
+        second.save()
+        bill.amount = Decimal('1200.50')
+        bill.save()
+        self.assertMatchesSourceTables()
+
+        second.delete()
+        bill.delete()
+        self.assertMatchesSourceTables()
+
+        top = {row['doctor_id']: row['appointment_count'] for row in get_statistics()['top_doctors']}
+        self.assertEqual(top, {self.doctor_one.doctor_id: 1, self.doctor_two.doctor_id: 1})
+
+    def test_reads_do_not_depend_on_table_size(self):
+        for _ in range(3):
+            self._appointment(self.doctor_one)
+        refresh_statistics()
+        with self.assertNumQueries(3):
+            get_statistics()
+        for _ in range(10):
+            self._appointment(self.doctor_two)
+        with self.assertNumQueries(3):
+            get_statistics()
+
+    def test_refresh_command_repairs_drift(self):
+        self._appointment(self.doctor_one)
+        refresh_statistics()
+        # Bulk updates bypass signals and leave the counters stale
+        Appointment.objects.update(status='Cancelled')
+        StatisticCounter.objects.filter(metric='patients').update(value=99)
+
+        out = StringIO()
+        call_command('refresh_statistics', stdout=out)
+        self.assertIn('Statistics refreshed', out.getvalue())
+        self.assertMatchesSourceTables()
+
+    @override_settings(TASK_QUEUE_EAGER=False, STATISTICS_RECONCILE_SECONDS=3600)
+    def test_counters_bumped_before_the_first_build_are_rebuilt(self):
+        # An existing deployment: rows exist, then saves bump counters that were never built
+        self._appointment(self.doctor_one)
+        self.assertTrue(StatisticCounter.objects.filter(metric='appointments').exists())
+        StatisticCounter.objects.all().delete()
+        Patient.objects.create(
+            reg_num='2021002', first_name='Umar', last_name='Shah', gender='Male', date_of_birth=date(2001, 1, 1)
+        )
+        self.assertEqual(StatisticCounter.objects.get(metric='patients').value, 1)
+
+        # Reads queue the build, once, instead of scanning the tables themselves
+        with self.assertNumQueries(3):
+            first = get_statistics()
+        self.assertEqual((first['building'], first['patients']), (True, 0))
+        get_statistics()
+        build = Task.objects.get(name=reconcile_statistics.name, status=Task.PENDING)
+        self.assertLessEqual(build.run_at, timezone.now())
+
+        reconcile_statistics()  # what the worker runs
+        build.delete()
+        self.assertMatchesSourceTables()
+        self.assertEqual(get_statistics()['patients'], 2)
+        self.assertFalse(get_statistics()['building'])
+
+        # The build queues the periodic reconciliation, once
+        call_command('refresh_statistics', stdout=StringIO())
+        queued = Task.objects.get(name=reconcile_statistics.name, status=Task.PENDING)
+        self.assertGreater(queued.run_at, timezone.now())
+
+    def test_statistics_api_requires_admin_and_returns_counters(self):
+        self._appointment(self.doctor_one)
+        refresh_statistics()
+        url = reverse('api_statistics')
+
+        response = self.client.get(url)
+        self.assertIn(response.status_code, (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN))
+
+        self.client.force_authenticate(user=self.admin_user)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total_appointments'], 1)
+        self.assertEqual(response.data['total_doctors'], 2)
+        self.assertEqual(response.data['appointments']['status_distribution']['Scheduled'], 1)
+
+    def test_admin_report_renders_from_counters(self):
+        self._appointment(self.doctor_one)
+        refresh_statistics()
+        self.client.force_login(self.admin_user)
+        response = self.client.get(reverse('admin:appointment_report'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertContains(response, 'Dr. Ayesha Khan')
+
+
+import json
+import os
+import tempfile
+from unittest import mock
+
+from django.contrib.auth.models import Group
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+
+from patient_app.models import PatientProfile
+
+
+def patient_row(index, **overrides):
+    row = {
+        'username': f'student{index}', 'password': 'Semester#2025', 'confirm_password': 'Semester#2025',
+        'email': f'student{index}@example.com', 'first_name': 'Student', 'last_name': str(index),
+        'date_of_birth': '2005-09-01', 'gender': 'F', 'reg_num': f'2025{index:04d}',
+    }
+    row.update(overrides)
+    return row
+
+
+def as_jsonl(rows):
+    return ''.join(json.dumps(row) + '\n' for row in rows)
+
+
+class BulkPatientImportTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = User.objects.create_superuser(
+            username='import_admin', password='adminpassword', email='import_admin@example.com'
+        )
+        cls.patient_group = Group.objects.create(name='Patient')
+        User.objects.create_user(username='student3', password='password123')
+        cls.url = reverse('admin_app_api:admin_api_bulk_import_patients')
+
+    def _upload(self, content, name='patients.jsonl', **params):
+        self.client.force_authenticate(user=self.admin_user)
+        upload = SimpleUploadedFile(name, content.encode())
+        query = '&'.join(f'{key}={value}' for key, value in params.items())
+        response = self.client.post(f'{self.url}?{query}', {'file': upload}, format='multipart')
+        lines = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        return response, lines[:-1], lines[-1]['summary']
+
+    def test_import_streams_per_row_report(self):
+        refresh_statistics()
+        rows = [patient_row(i) for i in range(1, 6)]
+        rows[1]['confirm_password'] = 'typo'                 # row 2: invalid
+        rows.append(patient_row(7, reg_num=rows[0]['reg_num']))  # row 6: reg_num repeated in file
+
+        response, results, summary = self._upload(as_jsonl(rows))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual([result['status'] for result in results],
+                         ['created', 'error', 'error', 'created', 'created', 'error'])
+        self.assertIn('confirm_password', results[1]['errors'])
+        self.assertIn('username', results[2]['errors'])  # student3 already exists
+        self.assertIn('reg_num', results[5]['errors'])
+        self.assertEqual((summary['created'], summary['failed']), (3, 3))
+
+        user = User.objects.get(username='student1')
+        self.assertTrue(user.check_password('Semester#2025'))
+        self.assertEqual(PatientProfile.objects.get(user=user).gender, 'Female')
+        self.assertEqual(Patient.objects.get(reg_num='20250001').email, 'student1@example.com')
+        self.assertEqual(self.patient_group.user_set.count(), 3)
+        self.assertEqual(get_statistics()['patients'], Patient.objects.count())
+
+    def test_csv_import_and_dry_run(self):
+        rows = [patient_row(i) for i in range(10, 13)]
+        header = list(rows[0])
+        csv_content = ','.join(header) + '\n' + ''.join(','.join(row[key] for key in header) + '\n' for row in rows)
+
+        _, results, summary = self._upload(csv_content, name='patients.csv', dry_run='true')
+        self.assertEqual([result['status'] for result in results], ['valid'] * 3)
+        self.assertFalse(User.objects.filter(username='student10').exists())
+
+        _, results, summary = self._upload(csv_content, name='patients.csv')
+        self.assertEqual(summary['created'], 3)
+        self.assertTrue(Patient.objects.filter(reg_num='20250012').exists())
+
+    def test_queries_per_batch_do_not_grow_with_rows(self):
+        # The first import also creates the patients counter row
+        self._upload(as_jsonl([patient_row(19)]))
+        with CaptureQueriesContext(connection) as small:
+            self._upload(as_jsonl(patient_row(i) for i in range(20, 22)))
+        with CaptureQueriesContext(connection) as large:
+            self._upload(as_jsonl(patient_row(i) for i in range(30, 50)))
+        self.assertEqual(User.objects.filter(username__startswith='student').count(), 24)
+        self.assertEqual(len(small), len(large))
+
+    @override_settings(BULK_IMPORT_HASH_WORKERS=4)
+    def test_upload_hashes_in_the_web_worker(self):
+        with mock.patch('admin_app.bulk_import.ProcessPoolExecutor') as pool:
+            _, results, summary = self._upload(as_jsonl([patient_row(70)]))
+        pool.assert_not_called()
+        self.assertEqual(summary['created'], 1)
+
+    def test_requires_admin(self):
+        response = self.client.post(self.url, {'file': SimpleUploadedFile('p.jsonl', b'')}, format='multipart')
+        self.assertIn(response.status_code, (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN))
+
+    def test_management_command_writes_report(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, 'patients.jsonl')
+            report = os.path.join(directory, 'report.jsonl')
+            with open(source, 'w') as handle:
+                handle.write(as_jsonl([patient_row(60), patient_row(61, gender='unknown')]))
+
+            out = StringIO()
+            call_command('import_patients', source, '--report', report, '--workers', '2', '--batch-size', '1',
+                         stdout=out)
+
+            with open(report) as handle:
+                results = [json.loads(line) for line in handle]
+        self.assertEqual([result['status'] for result in results], ['created', 'error'])
+        self.assertIn('1 created, 1 failed', out.getvalue())
+        self.assertTrue(User.objects.get(username='student60').check_password('Semester#2025'))
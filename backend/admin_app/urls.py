@@ -24,6 +24,11 @@ def list_endpoints(request):
             "path": "/api/admin/register/receptionist/",
             "method": "POST",
             "description": "API endpoint to register a receptionist"
+        },
+        {
+            "path": "/api/admin/api/import/patients/",
+            "method": "POST",
+            "description": "Bulk patient registration from a CSV or JSON Lines upload"
         }
     ]
     return JsonResponse({"endpoints": endpoints})
@@ -50,6 +55,7 @@ urlpatterns = [
     path('no-csrf-patient-register/', views.patient_register_no_csrf, name='patient_register_no_csrf'),
     path('api/register/doctor/', views.admin_api_register_doctor, name='admin_api_register_doctor'),
     path('api/register/receptionist/', views.admin_api_register_receptionist, name='admin_api_register_receptionist'),
+    path('api/import/patients/', views.admin_api_bulk_import_patients, name='admin_api_bulk_import_patients'),
     path('no-csrf-doctor-register/', views.doctor_register_no_csrf, name='no_csrf_doctor_register'),
     path('no-csrf-receptionist-register/', views.receptionist_register_no_csrf, name='no_csrf_receptionist_register'),
 ] 
\ No newline at end of file
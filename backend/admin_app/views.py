@@ -3,7 +3,9 @@ from django.contrib import messages
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.models import User, Group
 from django.views.decorators.csrf import csrf_exempt
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+import json
+import logging
 
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
@@ -20,6 +22,10 @@ from .serializers import (
     AdminDoctorRegistrationSerializer,
     AdminReceptionistRegistrationSerializer
 )
+from .statistics import get_statistics
+from .bulk_import import FORMATS, PatientImporter, detect_format, read_rows, text_stream
+
+logger = logging.getLogger(__name__)
 
 # Helper function to check if user is admin
 def is_admin(user):
@@ -110,10 +116,7 @@ def admin_register_receptionist_view(request):
 def admin_api_register_patient(request):
     """Register a new patient and create associated user account"""
     try:
-        print("Patient registration request data:", request.data)
-        print("Request headers:", {k: v for k, v in request.headers.items()})
-        print("Request cookies:", request.COOKIES)
-        print("Request method:", request.method)
+        logger.debug("Patient registration requested")
         
         # Check for existing username to provide a clear error
         username = request.data.get('username', '')
@@ -137,7 +140,7 @@ def admin_api_register_patient(request):
         if serializer.is_valid():
             try:
                 patient = serializer.save()
-                print(f"Patient registration successful: {patient.user.username}")
+                logger.info("Patient registered", extra={'user_id': patient.user_id})
                 
                 # Optional: Add user to 'Patient' group if you have it
                 try:
@@ -152,17 +155,14 @@ def admin_api_register_patient(request):
                     'data': serializer.data
                 }, status=status.HTTP_201_CREATED)
             except Exception as e:
-                import traceback
-                print(f"Exception during patient save: {str(e)}")
-                print(traceback.format_exc())
+                logger.exception("Patient registration failed while saving")
                 return Response({
                     'status': 'error',
                     'message': 'Server error during patient creation',
                     'detail': str(e)
                 }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
-        # Print validation errors for debugging
-        print("Patient validation errors:", serializer.errors)
+        logger.info("Patient registration rejected", extra={'invalid_fields': sorted(serializer.errors)})
         
         return Response({
             'status': 'error',
@@ -170,9 +170,7 @@ def admin_api_register_patient(request):
             'errors': serializer.errors
         }, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
-        import traceback
-        print(f"Exception in patient registration: {str(e)}")
-        print(traceback.format_exc())
+        logger.exception("Patient registration failed")
         return Response({
             'status': 'error',
             'message': 'Server error during registration',
@@ -185,7 +183,7 @@ def admin_api_register_patient(request):
 # @permission_classes([IsAuthenticated, IsAdminUser])
 def admin_api_register_doctor(request):
     try:
-        print("Doctor registration request data:", request.data)
+        logger.debug("Doctor registration requested")
         serializer = AdminDoctorRegistrationSerializer(data=request.data)
         if serializer.is_valid():
             doctor = serializer.save()
@@ -202,8 +200,7 @@ def admin_api_register_doctor(request):
                 'data': serializer.data
             }, status=status.HTTP_201_CREATED)
         
-        # Print validation errors for debugging
-        print("Validation errors:", serializer.errors)
+        logger.info("Doctor registration rejected", extra={'invalid_fields': sorted(serializer.errors)})
         
         return Response({
             'status': 'error',
@@ -211,7 +208,7 @@ def admin_api_register_doctor(request):
             'errors': serializer.errors
         }, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
-        print(f"Exception in doctor registration: {str(e)}")
+        logger.exception("Doctor registration failed")
         return Response({
             'status': 'error',
             'message': 'Server error during registration',
@@ -224,7 +221,7 @@ def admin_api_register_doctor(request):
 # @permission_classes([IsAuthenticated, IsAdminUser])
 def admin_api_register_receptionist(request):
     try:
-        print("Receptionist registration request data:", request.data)
+        logger.debug("Receptionist registration requested")
         serializer = AdminReceptionistRegistrationSerializer(data=request.data)
         if serializer.is_valid():
             receptionist = serializer.save()
@@ -241,8 +238,7 @@ def admin_api_register_receptionist(request):
                 'data': serializer.data
             }, status=status.HTTP_201_CREATED)
         
-        # Print validation errors for debugging
-        print("Receptionist validation errors:", serializer.errors)
+        logger.info("Receptionist registration rejected", extra={'invalid_fields': sorted(serializer.errors)})
         
         return Response({
             'status': 'error',
@@ -250,7 +246,7 @@ def admin_api_register_receptionist(request):
             'errors': serializer.errors
         }, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
-        print(f"Exception in receptionist registration: {str(e)}")
+        logger.exception("Receptionist registration failed")
         return Response({
             'status': 'error',
             'message': 'Server error during registration',
@@ -264,13 +260,70 @@ def system_statistics(request):
     """
     View for displaying system statistics in the admin dashboard
     """
-    # Here you would typically gather statistics data
-    # For now, we'll just render the template
     return render(request, 'admin_app/hms_dashboard.html', {
         'active_tab': 'statistics',
-        'page_title': 'System Statistics'
+        'page_title': 'System Statistics',
+        'statistics': get_statistics(),
     })
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def statistics_api(request):
+    """
+    JSON statistics for the admin dashboard, read from the pre-aggregated counters
+    """
+    stats = get_statistics()
+    return Response({
+        'total_patients': stats['patients'],
+        'total_doctors': stats['doctors'],
+        'total_appointments': stats['appointments'],
+        'total_revenue': stats['revenue'],
+        'appointments': {
+            'status_distribution': {
+                item['status']: item['count'] for item in stats['appointments_by_status']
+            },
+        },
+        'top_doctors': stats['top_doctors'],
+        # True until the counters are first built in the background
+        'building': stats['building'],
+    })
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def admin_api_bulk_import_patients(request):
+    """
+    Register many patients from an uploaded CSV or JSON Lines file ('file' field).
+    Streams back one JSON line per input row, followed by a summary line.
+    Pass ?format=csv|jsonl to override detection and ?dry_run=true to only validate.
+    """
+    upload = request.FILES.get('file')
+    if upload is None:
+        return Response({
+            'status': 'error',
+            'message': "Upload the CSV or JSON Lines file in a 'file' field."
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    fmt = request.query_params.get('format') or detect_format(upload.name, upload.content_type)
+    if fmt not in FORMATS:
+        return Response({
+            'status': 'error',
+            'message': f"Unsupported format '{fmt}'. Use one of: {', '.join(FORMATS)}."
+        }, status=status.HTTP_400_BAD_REQUEST)
+    dry_run = request.query_params.get('dry_run', '').lower() in ('1', 'true', 'yes')
+
+    def report():
+        with PatientImporter(dry_run=dry_run) as importer:
+            for result in importer.run(read_rows(text_stream(upload.file), fmt)):
+                yield json.dumps(result, default=str) + '\n'
+            yield json.dumps({'summary': {
+                'created': importer.created,
+                'failed': importer.failed,
+                'dry_run': dry_run,
+                'seconds': round(importer.elapsed, 3),
+            }}) + '\n'
+
+    return StreamingHttpResponse(report(), content_type='application/x-ndjson')
+
 @login_required
 @user_passes_test(is_admin)
 def system_logs(request):
@@ -297,8 +350,7 @@ def patient_register_no_csrf(request):
         }, status=405)
     
     try:
-        print("CSRF-free patient registration endpoint called")
-        print("Request headers:", {k: v for k, v in request.headers.items()})
+        logger.debug("CSRF-free patient registration requested")
         
         # First, try a raw SQL ALTER TABLE to fix the gender column
         try:
@@ -307,23 +359,18 @@ def patient_register_no_csrf(request):
                 # Check the current column definition
                 cursor.execute("SELECT column_name, data_type, character_maximum_length FROM information_schema.columns WHERE table_name = 'hms_patient' AND column_name = 'gender';")
                 column_info = cursor.fetchall()
-                print("Current gender column definition:", column_info)
                 
                 # Only try to alter if it's varchar(1)
                 if column_info and len(column_info) > 0:
                     col, dtype, length = column_info[0]
                     if dtype == 'character varying' and length == 1:
                         # Try to alter the column if needed
-                        print("Altering gender column from varchar(1) to varchar(10)...")
                         cursor.execute("ALTER TABLE hms_patient ALTER COLUMN gender TYPE varchar(10);")
-                        print("Successfully altered gender column to varchar(10)")
-                    else:
-                        print(f"No need to alter gender column - current type: {dtype}({length})")
+                        logger.warning("Altered hms_patient.gender from varchar(1) to varchar(10)")
                 else:
-                    print("Could not find gender column in hms_patient table")
-        except Exception as e:
-            print("Error altering gender column:", str(e))
-            print("Will attempt to use single-letter gender codes as fallback")
+                    logger.debug("Could not find gender column in hms_patient table")
+        except Exception:
+            logger.debug("Could not check the hms_patient.gender column; single-letter codes remain the fallback", exc_info=True)
         
         # Parse JSON body
         import json
@@ -335,8 +382,6 @@ def patient_register_no_csrf(request):
                 'message': 'Invalid JSON in request body'
             }, status=400)
         
-        print("Patient registration request data:", data)
-        
         # Check for existing username
         username = data.get('username', '')
         if username and User.objects.filter(username=username).exists():
@@ -360,7 +405,7 @@ def patient_register_no_csrf(request):
         if serializer.is_valid():
             try:
                 patient = serializer.save()
-                print(f"Patient registration successful: {patient.user.username}")
+                logger.info("Patient registered", extra={'user_id': patient.user_id})
                 
                 # Optional: Add user to 'Patient' group if you have it
                 try:
@@ -375,9 +420,7 @@ def patient_register_no_csrf(request):
                     'data': serializer.data
                 }, status=201)
             except Exception as e:
-                import traceback
-                print(f"Exception during patient save: {str(e)}")
-                print(traceback.format_exc())
+                logger.exception("Patient registration failed while saving")
                 return JsonResponse({
                     'status': 'error',
                     'message': 'Server error during patient creation',
@@ -385,7 +428,7 @@ def patient_register_no_csrf(request):
                 }, status=500)
         
         # Return validation errors
-        print("Patient validation errors:", serializer.errors)
+        logger.info("Patient registration rejected", extra={'invalid_fields': sorted(serializer.errors)})
         return JsonResponse({
             'status': 'error',
             'message': 'Invalid data provided',
@@ -393,9 +436,7 @@ def patient_register_no_csrf(request):
         }, status=400)
     
     except Exception as e:
-        import traceback
-        print(f"Exception in patient registration: {str(e)}")
-        print(traceback.format_exc())
+        logger.exception("Patient registration failed")
         return JsonResponse({
             'status': 'error',
             'message': 'Server error during registration',
@@ -415,8 +456,7 @@ def doctor_register_no_csrf(request):
         }, status=405)
     
     try:
-        print("CSRF-free doctor registration endpoint called")
-        print("Request headers:", {k: v for k, v in request.headers.items()})
+        logger.debug("CSRF-free doctor registration requested")
         
         # Parse JSON body
         import json
@@ -428,8 +468,6 @@ def doctor_register_no_csrf(request):
                 'message': 'Invalid JSON in request body'
             }, status=400)
         
-        print("Doctor registration request data:", data)
-        
         # Check for existing username
         username = data.get('username', '')
         if username and User.objects.filter(username=username).exists():
@@ -444,7 +482,7 @@ def doctor_register_no_csrf(request):
         if serializer.is_valid():
             try:
                 doctor = serializer.save()
-                print(f"Doctor registration successful: {doctor.user.username}")
+                logger.info("Doctor registered", extra={'user_id': doctor.user_id})
                 
                 # Optional: Add user to 'Doctor' group if you have it
                 try:
@@ -459,9 +497,7 @@ def doctor_register_no_csrf(request):
                     'data': serializer.data
                 }, status=201)
             except Exception as e:
-                import traceback
-                print(f"Exception during doctor save: {str(e)}")
-                print(traceback.format_exc())
+                logger.exception("Doctor registration failed while saving")
                 return JsonResponse({
                     'status': 'error',
                     'message': 'Server error during doctor creation',
@@ -469,7 +505,7 @@ def doctor_register_no_csrf(request):
                 }, status=500)
         
         # Return validation errors
-        print("Doctor validation errors:", serializer.errors)
+        logger.info("Doctor registration rejected", extra={'invalid_fields': sorted(serializer.errors)})
         return JsonResponse({
             'status': 'error',
             'message': 'Invalid data provided',
@@ -477,9 +513,7 @@ def doctor_register_no_csrf(request):
         }, status=400)
     
     except Exception as e:
-        import traceback
-        print(f"Exception in doctor registration: {str(e)}")
-        print(traceback.format_exc())
+        logger.exception("Doctor registration failed")
         return JsonResponse({
             'status': 'error',
             'message': 'Server error during registration',
@@ -499,8 +533,7 @@ def receptionist_register_no_csrf(request):
         }, status=405)
     
     try:
-        print("CSRF-free receptionist registration endpoint called")
-        print("Request headers:", {k: v for k, v in request.headers.items()})
+        logger.debug("CSRF-free receptionist registration requested")
         
         # Parse JSON body
         import json
@@ -512,8 +545,6 @@ def receptionist_register_no_csrf(request):
                 'message': 'Invalid JSON in request body'
             }, status=400)
         
-        print("Receptionist registration request data:", data)
-        
         # Check for existing username
         username = data.get('username', '')
         if username and User.objects.filter(username=username).exists():
@@ -537,8 +568,6 @@ def receptionist_register_no_csrf(request):
                     last_name=''
                 )
                 
-                print(f"User created: {user.username}")
-                
                 # Create HMS Receptionist record with all the details
                 from hms.models import Receptionist as HMSReceptionist
                 try:
@@ -551,11 +580,9 @@ def receptionist_register_no_csrf(request):
                         address=data.get('address', ''),
                         date_of_birth=data.get('date_of_birth')
                     )
-                    print(f"Created HMS Receptionist: {hms_receptionist.receptionist_id} - {hms_receptionist.first_name} {hms_receptionist.last_name}")
+                    logger.info("Receptionist registered", extra={'user_id': user.id})
                 except Exception as e:
-                    import traceback
-                    print(f"ERROR creating HMS Receptionist: {str(e)}")
-                    print(traceback.format_exc())
+                    logger.exception("Creating the HMS receptionist record failed")
                     # If HMS Receptionist creation fails, delete the user
                     user.delete()
                     return JsonResponse({
@@ -564,15 +591,6 @@ def receptionist_register_no_csrf(request):
                         'detail': str(e)
                     }, status=500)
                 
-                # Also create the receptionist_app Receptionist for compatibility
-                from receptionist_app.models import Receptionist
-                app_receptionist = Receptionist.objects.create(
-                    user=user,
-                    contact_number=data.get('contact_number', ''),
-                    address=data.get('address', ''),
-                    date_of_birth=data.get('date_of_birth')
-                )
-                
                 # Optional: Add user to 'Receptionist' group if you have it
                 try:
                     from django.contrib.auth.models import Group
@@ -602,9 +620,7 @@ def receptionist_register_no_csrf(request):
                     'data': response_data
                 }, status=201)
             except Exception as e:
-                import traceback
-                print(f"Exception during receptionist save: {str(e)}")
-                print(traceback.format_exc())
+                logger.exception("Receptionist registration failed while saving")
                 return JsonResponse({
                     'status': 'error',
                     'message': 'Server error during receptionist creation',
@@ -612,7 +628,7 @@ def receptionist_register_no_csrf(request):
                 }, status=500)
         
         # Return validation errors
-        print("Receptionist validation errors:", serializer.errors)
+        logger.info("Receptionist registration rejected", extra={'invalid_fields': sorted(serializer.errors)})
         return JsonResponse({
             'status': 'error',
             'message': 'Invalid data provided',
@@ -620,9 +636,7 @@ def receptionist_register_no_csrf(request):
         }, status=400)
     
     except Exception as e:
-        import traceback
-        print(f"Exception in receptionist registration: {str(e)}")
-        print(traceback.format_exc())
+        logger.exception("Receptionist registration failed")
         return JsonResponse({
             'status': 'error',
             'message': 'Server error during registration',
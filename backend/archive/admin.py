@@ -0,0 +1,10 @@
+from django.contrib import admin
+
+from .models import ArchivedRecord
+
+
+@admin.register(ArchivedRecord)
+class ArchivedRecordAdmin(admin.ModelAdmin):
+    list_display = ('model', 'object_id', 'patient_id', 'doctor_id', 'occurred_at', 'archived_at')
+    list_filter = ('model',)
+    readonly_fields = ('model', 'object_id', 'patient_id', 'doctor_id', 'occurred_at', 'archived_at', 'data')
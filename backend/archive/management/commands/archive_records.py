@@ -0,0 +1,63 @@
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from archive.pipeline import DESTINATIONS, POLICIES, TABLE, archive_rows
+
+AGE = re.compile(r'^(\d+)([dwmy]?)$')
+DAYS_PER_UNIT = {'': 1, 'd': 1, 'w': 7, 'm': 30, 'y': 365}
+
+
+def parse_age(value):
+    """'90', '90d', '12w', '18m' or '2y' as a timedelta (months are 30 days, years 365)."""
+    match = AGE.match(value.strip().lower())
+    if not match:
+        raise CommandError(f"Invalid --older-than {value!r}; use e.g. 365d, 18m or 2y.")
+    return timedelta(days=int(match.group(1)) * DAYS_PER_UNIT[match.group(2)])
+
+
+class Command(BaseCommand):
+    help = (
+        'Moves completed or cancelled patient appointments and completed lab test orders older than '
+        '--older-than out of the hot tables, in batches. Safe to stop and re-run.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than', default=settings.ARCHIVE_OLDER_THAN,
+            help='Archive rows older than this, e.g. 365d, 18m or 2y (default: ARCHIVE_OLDER_THAN).',
+        )
+        parser.add_argument(
+            '--to', choices=DESTINATIONS, default=TABLE, dest='destination',
+            help="'table' keeps rows readable with ?include_archived=true; 'jsonl' writes gzip files "
+                 "under ARCHIVE_DIR (default: table).",
+        )
+        parser.add_argument(
+            '--model', action='append', choices=sorted(POLICIES), dest='models',
+            help='Only archive this model (repeatable; default: all).',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=settings.ARCHIVE_BATCH_SIZE,
+            help='Rows copied and deleted per transaction (default: ARCHIVE_BATCH_SIZE).',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Only count the rows that would be archived.')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - parse_age(options['older_than'])
+        self.stdout.write(f"Archiving rows older than {cutoff:%Y-%m-%d %H:%M} to {options['destination']}.")
+
+        for label, policy in POLICIES.items():
+            if options['models'] and label not in options['models']:
+                continue
+            archived = archive_rows(
+                policy, cutoff, destination=options['destination'], batch_size=max(1, options['batch_size']),
+                dry_run=options['dry_run'],
+                progress=lambda total, label=label: self.stdout.write(f'{label}: {total} archived so far'),
+            )
+            verb = 'would be archived' if options['dry_run'] else 'archived'
+            self.stdout.write(f'{label}: {archived} rows {verb}.')
+
+        self.stdout.write(self.style.SUCCESS('Dry run complete.' if options['dry_run'] else 'Archive run complete.'))
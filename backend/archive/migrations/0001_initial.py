@@ -0,0 +1,37 @@
+# Generated by Django 5.2.1 on 2026-10-17 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=100)),
+                ('object_id', models.BigIntegerField()),
+                ('patient_id', models.BigIntegerField(blank=True, null=True)),
+                ('doctor_id', models.BigIntegerField(blank=True, null=True)),
+                ('occurred_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('data', models.JSONField()),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['model', 'patient_id', '-occurred_at'], name='archived_patient_idx'),
+                    models.Index(fields=['model', 'doctor_id', '-occurred_at'], name='archived_doctor_idx'),
+                    models.Index(fields=['model', '-occurred_at', '-object_id'], name='archived_occurred_idx'),
+                ],
+                'constraints': [
+                    models.UniqueConstraint(fields=('model', 'object_id'), name='archived_record_unique'),
+                ],
+            },
+        ),
+    ]
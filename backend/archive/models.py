@@ -0,0 +1,40 @@
+from django.db import models
+
+
+class ArchivedRecordQuerySet(models.QuerySet):
+    def of(self, model):
+        return self.filter(model=model._meta.label)
+
+
+class ArchivedRecord(models.Model):
+    """
+    A row moved out of a hot table by ``manage.py archive_records``.
+
+    ``data`` holds the row's column values by attribute name, so the original
+    instance can be rebuilt for the ViewSets' ``?include_archived=true`` read
+    path (see archive.reads). The patient and doctor ids and the row's time
+    are copied into their own columns so archived rows can be filtered and
+    paged the way the hot table is.
+    """
+    model = models.CharField(max_length=100)
+    object_id = models.BigIntegerField()
+    patient_id = models.BigIntegerField(null=True, blank=True)
+    doctor_id = models.BigIntegerField(null=True, blank=True)
+    occurred_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    data = models.JSONField()
+
+    objects = ArchivedRecordQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['model', 'object_id'], name='archived_record_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['model', 'patient_id', '-occurred_at'], name='archived_patient_idx'),
+            models.Index(fields=['model', 'doctor_id', '-occurred_at'], name='archived_doctor_idx'),
+            models.Index(fields=['model', '-occurred_at', '-object_id'], name='archived_occurred_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model} #{self.object_id} (archived)"
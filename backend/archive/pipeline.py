@@ -0,0 +1,173 @@
+"""
+Moving closed rows out of the hot tables.
+
+POLICIES lists what may be archived: completed or cancelled patient
+appointments and completed lab test orders whose time is older than the
+cutoff. archive_rows() works through the matching rows in primary key
+batches; each batch is copied to the destination and deleted from the hot
+table in one transaction, so a run can be stopped and restarted at any
+point. Destinations:
+
+* 'table': ArchivedRecord rows, which the ViewSets can still read with
+  ``?include_archived=true`` (see archive.reads);
+* 'jsonl': gzip-compressed JSON lines under settings.ARCHIVE_DIR, one file
+  per model and run and one gzip member per batch, for cold storage
+  outside the database. A batch is written and fsynced before its rows
+  are deleted; a crash in between leaves the rows in place, so the next
+  run writes them again (deduplicate by "id" when restoring).
+
+Hot rows are deleted without model signals: archived lab orders keep their
+stored result documents (``gc_documents --recount`` counts the references
+in ArchivedRecord rows, not those in JSON lines files), and admin
+statistics only count hms appointments, which are not archived. Appointments still referenced by a lab order in
+the hot table are skipped until that order is archived too, so no hot row
+points at an archived one.
+"""
+import gzip
+import json
+import os
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from patient_app.models import Appointment, PatientLabTestOrder, ReminderDelivery
+from .models import ArchivedRecord
+
+TABLE = 'table'
+JSONL = 'jsonl'
+DESTINATIONS = (TABLE, JSONL)
+
+
+@dataclass(frozen=True)
+class ArchivePolicy:
+    model: type
+    time_field: str
+    statuses: tuple
+    patient_field: str
+    doctor_field: str
+    # (model, foreign key attname) rows deleted along with the archived rows
+    dependents: tuple = field(default=())
+
+    @property
+    def label(self):
+        return self.model._meta.label
+
+    def candidates(self, cutoff):
+        """Rows that may be archived: closed and older than cutoff."""
+        return self.model.objects.filter(**{
+            'status__in': self.statuses,
+            f'{self.time_field}__lt': cutoff,
+        })
+
+
+class AppointmentPolicy(ArchivePolicy):
+    def candidates(self, cutoff):
+        # Keep appointments that a lab order in the hot table still points at
+        return super().candidates(cutoff).filter(
+            ~Exists(PatientLabTestOrder.objects.filter(appointment_id=OuterRef('pk')))
+        )
+
+
+POLICIES = {
+    policy.label: policy for policy in (
+        # Lab orders first, so their appointments are free to go in the same run
+        ArchivePolicy(
+            PatientLabTestOrder, 'order_datetime', ('COMPLETED',), 'patient_id', 'ordered_by_doctor_id',
+        ),
+        # 'Cancelled' is what the appointment cancel action writes
+        AppointmentPolicy(
+            Appointment, 'appointment_datetime', ('COMPLETED', 'CANCELLED', 'Cancelled'), 'patient_id', 'doctor_id',
+            dependents=((ReminderDelivery, 'appointment_id'),),
+        ),
+    )
+}
+
+
+def row_data(instance):
+    """Column values by attribute name, as JSON-compatible values."""
+    values = {
+        f.attname: f.get_prep_value(f.value_from_object(instance)) for f in instance._meta.concrete_fields
+    }
+    return json.loads(json.dumps(values, cls=DjangoJSONEncoder))
+
+
+def restore_instance(record):
+    """The archived row as an unsaved model instance (for reading, not saving)."""
+    model = POLICIES[record.model].model
+    instance = model(**{
+        f.attname: f.to_python(record.data.get(f.attname)) for f in model._meta.concrete_fields
+    })
+    instance._state.adding = False
+    return instance
+
+
+def to_record(policy, instance):
+    return ArchivedRecord(
+        model=policy.label,
+        object_id=instance.pk,
+        patient_id=getattr(instance, policy.patient_field),
+        doctor_id=getattr(instance, policy.doctor_field),
+        occurred_at=getattr(instance, policy.time_field),
+        data=row_data(instance),
+    )
+
+
+class JSONLWriter:
+    """Appends each batch as its own gzip member, flushed to disk before returning."""
+
+    def __init__(self, policy, started):
+        directory = os.path.join(settings.ARCHIVE_DIR, policy.label.lower())
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f'{started:%Y%m%dT%H%M%S}.jsonl.gz')
+
+    def write(self, rows):
+        with open(self.path, 'ab') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb') as stream:
+                for row in rows:
+                    stream.write(json.dumps(row, sort_keys=True).encode() + b'\n')
+            raw.flush()
+            os.fsync(raw.fileno())
+
+
+def archive_rows(policy, cutoff, destination=TABLE, batch_size=None, dry_run=False, progress=None):
+    """
+    Archive policy's rows older than cutoff; returns how many were (or, with
+    dry_run, would be) archived. progress is called with the running total
+    after each batch.
+    """
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+    candidates = policy.candidates(cutoff)
+    if dry_run:
+        return candidates.count()
+
+    writer = JSONLWriter(policy, timezone.now()) if destination == JSONL else None
+    total, last_pk = 0, None
+    while True:
+        with transaction.atomic():
+            batch = candidates.order_by('pk').select_for_update(skip_locked=True, of=('self',))
+            if last_pk is not None:
+                batch = batch.filter(pk__gt=last_pk)
+            batch = list(batch[:batch_size])
+            if not batch:
+                break
+            ids = [instance.pk for instance in batch]
+            if writer is None:
+                ArchivedRecord.objects.bulk_create(
+                    [to_record(policy, instance) for instance in batch], ignore_conflicts=True
+                )
+            else:
+                writer.write([row_data(instance) for instance in batch])
+            for dependent, attname in policy.dependents:
+                dependent.objects.filter(**{f'{attname}__in': ids}).delete()
+            # Without signals or Collector: nothing else refers to these rows
+            doomed = policy.model.objects.filter(pk__in=ids)
+            doomed._raw_delete(doomed.db)
+        total += len(batch)
+        last_pk = ids[-1]
+        if progress is not None:
+            progress(total)
+    return total
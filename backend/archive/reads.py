@@ -0,0 +1,132 @@
+"""
+``?include_archived=true`` on the list and retrieve actions of a ViewSet.
+
+Detail requests fall back to the ArchivedRecord of the same id when the
+hot table has no such row, looked up among the records the user may list
+(some ViewSets leave detail visibility to object permissions alone, which
+are then also checked on the rebuilt instance). List requests merge the hot rows and the archived rows
+visible to the user (ArchiveReadMixin.get_archived_queryset) in the
+ViewSet's cursor_ordering, newest first, with a keyset cursor of its own:
+each page fetches one page of each side after the cursor and keeps the
+first page_size of the merge. Archived items carry ``"archived": true``.
+"""
+import base64
+import heapq
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Q, prefetch_related_objects
+from django.http import Http404
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .pipeline import restore_instance
+
+INCLUDE_ARCHIVED_PARAM = 'include_archived'
+CURSOR_PARAM = 'archive_cursor'
+
+
+def _encode_cursor(position):
+    moment, pk = position
+    return base64.urlsafe_b64encode(f'{moment.isoformat()}|{pk}'.encode()).decode()
+
+
+def _decode_cursor(value):
+    try:
+        moment, pk = base64.urlsafe_b64decode(value.encode()).decode().split('|')
+        position = parse_datetime(moment), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise NotFound('Invalid cursor.')
+    if position[0] is None:
+        raise NotFound('Invalid cursor.')
+    return position
+
+
+class ArchiveReadMixin:
+    """
+    Serve archived rows to requests with ``?include_archived=true``.
+
+    Subclasses must implement get_archived_queryset() to return the
+    ArchivedRecord rows the user may list, mirroring get_queryset()'s role
+    filtering, and set cursor_ordering to (newest time first, newest id
+    first), e.g. ('-appointment_datetime', '-id'); a class missing either
+    fails when it is defined. Related objects listed in archived_related are
+    loaded in bulk for the rebuilt instances.
+    """
+    archived_related = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if not callable(getattr(cls, 'get_archived_queryset', None)):
+            raise ImproperlyConfigured(f'{cls.__qualname__} must implement get_archived_queryset().')
+        ordering = getattr(cls, 'cursor_ordering', ())
+        if len(ordering) != 2 or not all(field.startswith('-') for field in ordering):
+            raise ImproperlyConfigured(
+                f'{cls.__qualname__}.cursor_ordering must be (newest time first, newest id first).'
+            )
+
+    def include_archived(self):
+        return self.request.query_params.get(INCLUDE_ARCHIVED_PARAM, '').lower() in ('1', 'true', 'yes')
+
+    def retrieve(self, request, *args, **kwargs):
+        if not self.include_archived():
+            return super().retrieve(request, *args, **kwargs)
+        try:
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            pass
+        record = self.get_archived_queryset().filter(
+            object_id=self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        ).first()
+        if record is None:
+            raise NotFound()
+        instance = self.restore([record])[0]
+        self.check_object_permissions(request, instance)
+        data = self.get_serializer(instance).data
+        data['archived'] = True
+        return Response(data)
+
+    def list(self, request, *args, **kwargs):
+        if not self.include_archived():
+            return super().list(request, *args, **kwargs)
+
+        time_field = self.cursor_ordering[0].lstrip('-')
+        pk_field = self.cursor_ordering[1].lstrip('-')
+        page_size = self.paginator.get_page_size(request)
+        position = request.query_params.get(CURSOR_PARAM)
+        position = _decode_cursor(position) if position else None
+
+        hot = self.filter_queryset(self.get_queryset()).order_by(*self.cursor_ordering)
+        archived = self.get_archived_queryset().order_by('-occurred_at', '-object_id')
+        if position is not None:
+            moment, pk = position
+            hot = hot.filter(Q(**{f'{time_field}__lt': moment}) | Q(**{time_field: moment, f'{pk_field}__lt': pk}))
+            archived = archived.filter(Q(occurred_at__lt=moment) | Q(occurred_at=moment, object_id__lt=pk))
+
+        hot_rows = [(getattr(row, time_field), row.pk, False, row) for row in hot[:page_size + 1]]
+        records = list(archived[:page_size + 1])
+        archived_rows = [
+            (record.occurred_at, record.object_id, True, instance)
+            for record, instance in zip(records, self.restore(records))
+        ]
+        merged = list(heapq.merge(hot_rows, archived_rows, key=lambda row: (row[0], row[1]), reverse=True))
+        page = merged[:page_size]
+
+        results = []
+        for (_, _, is_archived, _), data in zip(page, self.get_serializer([row[3] for row in page], many=True).data):
+            data['archived'] = is_archived
+            results.append(data)
+        next_url = None
+        if len(merged) > page_size:
+            last_time, last_pk = page[-1][0], page[-1][1]
+            next_url = replace_query_param(
+                request.build_absolute_uri(), CURSOR_PARAM, _encode_cursor((last_time, last_pk))
+            )
+        return Response({'next': next_url, 'previous': None, 'results': results})
+
+    def restore(self, records):
+        instances = [restore_instance(record) for record in records]
+        if instances and self.archived_related:
+            prefetch_related_objects(instances, *self.archived_related)
+        return instances
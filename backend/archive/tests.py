@@ -0,0 +1,182 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from hms.models import Doctor
+from patient_app.models import Appointment, DocumentBlob, PatientLabTestOrder, PatientProfile, ReminderDelivery
+from patient_app.storage import document_storage
+from .management.commands.archive_records import parse_age
+from .models import ArchivedRecord
+from .reads import ArchiveReadMixin
+
+
+class ArchiveRecordsTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = Doctor.objects.create(first_name='Archive', last_name='Doctor', specialization='General')
+        cls.patient_user = User.objects.create_user(username='archive_patient', password='password123')
+        cls.patient = PatientProfile.objects.create(user=cls.patient_user, date_of_birth='1990-01-01')
+        cls.other_user = User.objects.create_user(username='archive_other', password='password123')
+        PatientProfile.objects.create(user=cls.other_user, date_of_birth='1990-01-01')
+        cls.now = timezone.now()
+
+    def appointment(self, days_ago, status='COMPLETED'):
+        return Appointment.objects.create(
+            patient=self.patient, doctor=self.doctor, status=status,
+            appointment_datetime=self.now - timedelta(days=days_ago),
+        )
+
+    def lab_order(self, days_ago, status='COMPLETED', appointment=None):
+        order = PatientLabTestOrder.objects.create(
+            patient=self.patient, ordered_by_doctor=self.doctor, appointment=appointment,
+            test_name='CBC', status=status,
+        )
+        # order_datetime is auto_now_add
+        PatientLabTestOrder.objects.filter(pk=order.pk).update(order_datetime=self.now - timedelta(days=days_ago))
+        return order
+
+    def archive(self, *args):
+        out = StringIO()
+        call_command('archive_records', *args, stdout=out)
+        return out.getvalue()
+
+    def test_moves_closed_rows_older_than_cutoff(self):
+        old_done = self.appointment(400)
+        old_cancelled = self.appointment(500, status='CANCELLED')
+        # As written by the cancel action
+        cancelled_by_patient = self.appointment(500, status='Cancelled')
+        old_open = self.appointment(400, status='SCHEDULED')
+        recent = self.appointment(10)
+        ReminderDelivery.objects.create(appointment=old_done)
+        order = self.lab_order(400)
+
+        self.archive('--older-than', '365d', '--batch-size', '1')
+
+        self.assertEqual(
+            set(Appointment.objects.values_list('pk', flat=True)), {old_open.pk, recent.pk}
+        )
+        self.assertFalse(PatientLabTestOrder.objects.exists())
+        self.assertFalse(ReminderDelivery.objects.exists())
+        record = ArchivedRecord.objects.of(Appointment).get(object_id=old_done.pk)
+        self.assertEqual(record.patient_id, self.patient.pk)
+        self.assertEqual(record.doctor_id, self.doctor.pk)
+        self.assertEqual(record.data['status'], 'COMPLETED')
+        self.assertTrue(ArchivedRecord.objects.of(Appointment).filter(object_id=old_cancelled.pk).exists())
+        self.assertTrue(ArchivedRecord.objects.of(Appointment).filter(object_id=cancelled_by_patient.pk).exists())
+        self.assertTrue(ArchivedRecord.objects.of(PatientLabTestOrder).filter(object_id=order.pk).exists())
+
+    def test_keeps_appointments_referenced_by_hot_lab_orders(self):
+        referenced = self.appointment(400)
+        self.lab_order(400, status='IN_PROGRESS', appointment=referenced)
+
+        self.archive('--older-than', '1y')
+
+        self.assertTrue(Appointment.objects.filter(pk=referenced.pk).exists())
+        self.assertFalse(ArchivedRecord.objects.exists())
+
+    def test_gc_recount_keeps_documents_of_archived_orders(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(self.settings(MEDIA_ROOT=media_root))
+        order = self.lab_order(400)
+        order.refresh_from_db()
+        order.result_document.save('result.pdf', ContentFile(b'%PDF-1.4 archived result'))
+        name = order.result_document.name
+
+        self.archive('--older-than', '1y')
+        self.assertFalse(PatientLabTestOrder.objects.exists())
+        DocumentBlob.objects.update(ref_count=0)
+        call_command('gc_documents', '--recount', '--grace-hours', '0', stdout=StringIO())
+
+        self.assertEqual(DocumentBlob.objects.get(name=name).ref_count, 1)
+        self.assertTrue(document_storage().exists(name))
+
+    def test_dry_run_only_counts(self):
+        self.appointment(400)
+
+        output = self.archive('--older-than', '1y', '--dry-run')
+
+        self.assertIn('patient_app.Appointment: 1 rows would be archived.', output)
+        self.assertEqual(Appointment.objects.count(), 1)
+        self.assertFalse(ArchivedRecord.objects.exists())
+
+    def test_jsonl_destination_writes_gzip_lines(self):
+        old = self.appointment(400)
+        with tempfile.TemporaryDirectory() as directory, override_settings(ARCHIVE_DIR=directory):
+            self.archive('--older-than', '1y', '--to', 'jsonl', '--model', 'patient_app.Appointment')
+            folder = os.path.join(directory, 'patient_app.appointment')
+            files = os.listdir(folder)
+            with gzip.open(os.path.join(folder, files[0]), 'rt') as stream:
+                rows = [json.loads(line) for line in stream]
+
+        self.assertEqual([row['id'] for row in rows], [old.pk])
+        self.assertFalse(Appointment.objects.exists())
+        self.assertFalse(ArchivedRecord.objects.exists())
+
+    def test_parse_age(self):
+        self.assertEqual(parse_age('2y'), timedelta(days=730))
+        self.assertEqual(parse_age('90'), timedelta(days=90))
+        self.assertEqual(parse_age('6W'), timedelta(days=42))
+        with self.assertRaises(CommandError):
+            parse_age('two years')
+
+    def test_list_merges_archived_rows_in_order(self):
+        archived = [self.appointment(400 + i) for i in range(3)]
+        self.archive('--older-than', '1y')
+        hot = [self.appointment(i + 1, status='SCHEDULED') for i in range(2)]
+        self.client.force_authenticate(user=self.patient_user)
+        url = reverse('appointment-list')
+
+        response = self.client.get(url, {'include_archived': 'true', 'page_size': 3})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data['results']
+        self.assertEqual([item['id'] for item in results], [hot[0].pk, hot[1].pk, archived[0].pk])
+        self.assertEqual([item['archived'] for item in results], [False, False, True])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual([item['id'] for item in response.data['results']], [archived[1].pk, archived[2].pk])
+        self.assertIsNone(response.data['next'])
+
+        # Without the flag only the hot rows are listed
+        response = self.client.get(url)
+        self.assertEqual({item['id'] for item in response.data['results']}, {hot[0].pk, hot[1].pk})
+
+    def test_retrieve_archived_row(self):
+        old = self.appointment(400)
+        self.archive('--older-than', '1y')
+        url = reverse('appointment-detail', args=[old.pk])
+
+        self.client.force_authenticate(user=self.patient_user)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(url, {'include_archived': 'true'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['id'], old.pk)
+        self.assertTrue(response.data['archived'])
+
+        self.client.force_authenticate(user=self.other_user)
+        response = self.client.get(url, {'include_archived': 'true'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_viewset_without_archive_hooks_fails_when_defined(self):
+        with self.assertRaisesMessage(ImproperlyConfigured, 'get_archived_queryset'):
+            class NoHook(ArchiveReadMixin):
+                cursor_ordering = ('-appointment_datetime', '-id')
+
+        with self.assertRaisesMessage(ImproperlyConfigured, 'cursor_ordering'):
+            class NoOrdering(ArchiveReadMixin):
+                def get_archived_queryset(self):
+                    return ArchivedRecord.objects.none()
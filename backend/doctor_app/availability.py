@@ -0,0 +1,119 @@
+"""
+Free-slot computation for doctors based on their weekly DoctorSchedule.
+
+A schedule window (e.g. Monday 09:00-13:00) is split into fixed-length slots
+of settings.APPOINTMENT_SLOT_MINUTES. A slot is free while fewer than
+settings.APPOINTMENT_SLOT_CAPACITY active appointments start inside it, and
+a day has no free slots once it holds max_appointments active appointments. Appointments for every requested
+doctor are fetched with a single range query and merged, in time order,
+against the generated slots.
+"""
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from patient_app.models import Appointment
+
+# Appointments in these states do not hold a slot ('Cancelled' is what the
+# appointment cancel action writes)
+INACTIVE_APPOINTMENT_STATUSES = ('CANCELLED', 'Cancelled')
+
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+
+@dataclass(frozen=True)
+class Slot:
+    start: datetime
+    end: datetime
+
+
+def get_slot_length():
+    return timedelta(minutes=getattr(settings, 'APPOINTMENT_SLOT_MINUTES', 30))
+
+
+def get_slot_capacity():
+    return getattr(settings, 'APPOINTMENT_SLOT_CAPACITY', 1)
+
+
+def schedule_slots(schedule, day):
+    """Yield the slots of a schedule window on the given date."""
+    slot_length = get_slot_length()
+    slot_start = timezone.make_aware(datetime.combine(day, schedule.start_time))
+    window_end = timezone.make_aware(datetime.combine(day, schedule.end_time))
+    while slot_start + slot_length <= window_end:
+        yield Slot(slot_start, slot_start + slot_length)
+        slot_start += slot_length
+
+
+def day_bounds(day):
+    """Return the aware [start, end) datetimes of a local date."""
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    end = timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+    return start, end
+
+
+def active_appointments(doctor_ids, range_start, range_end):
+    return Appointment.objects.filter(
+        doctor_id__in=doctor_ids,
+        appointment_datetime__gte=range_start,
+        appointment_datetime__lt=range_end,
+    ).exclude(status__in=INACTIVE_APPOINTMENT_STATUSES)
+
+
+def compute_free_slots(schedules, date_from, date_to, now=None):
+    """
+    Return {doctor_id: [Slot, ...]} with the free future slots of the given
+    schedules between date_from and date_to (both inclusive).
+
+    Costs two queries however many doctors or days are requested: one for the
+    schedules and one range query for the appointments of all their doctors.
+    """
+    now = now or timezone.now()
+    schedules = list(schedules.filter(is_available=True))
+    if not schedules or date_to < date_from:
+        return {}
+
+    schedules_by_doctor = defaultdict(dict)
+    for schedule in schedules:
+        schedules_by_doctor[schedule.doctor_id][schedule.day_of_week] = schedule
+
+    range_start, _ = day_bounds(date_from)
+    _, range_end = day_bounds(date_to)
+    booked = defaultdict(list)
+    for doctor_id, appointment_datetime in active_appointments(
+        schedules_by_doctor.keys(), range_start, range_end
+    ).order_by('doctor_id', 'appointment_datetime').values_list('doctor_id', 'appointment_datetime'):
+        booked[doctor_id].append(appointment_datetime)
+
+    slot_capacity = get_slot_capacity()
+    free_slots = {}
+    for doctor_id, weekly_schedule in schedules_by_doctor.items():
+        appointment_times = booked[doctor_id]
+        position = 0
+        doctor_slots = []
+        day = date_from
+        while day <= date_to:
+            _, day_end = day_bounds(day)
+            schedule = weekly_schedule.get(WEEKDAYS[day.weekday()])
+            # Appointments already sorted by time; take the ones on this day
+            day_times = []
+            while position < len(appointment_times) and appointment_times[position] < day_end:
+                day_times.append(appointment_times[position])
+                position += 1
+
+            if schedule is not None and len(day_times) < schedule.max_appointments:
+                index = 0
+                for slot in schedule_slots(schedule, day):
+                    while index < len(day_times) and day_times[index] < slot.start:
+                        index += 1
+                    taken = 0
+                    while index + taken < len(day_times) and day_times[index + taken] < slot.end:
+                        taken += 1
+                    if taken < slot_capacity and slot.start >= now:
+                        doctor_slots.append(slot)
+            day += timedelta(days=1)
+        free_slots[doctor_id] = doctor_slots
+    return free_slots
@@ -0,0 +1,130 @@
+"""
+Per-doctor daily schedules built from hms appointments.
+
+daily_schedule() returns one entry per day of a date range for one doctor:
+the day's appointments (with patient names) grouped into time blocks of
+settings.SCHEDULE_BLOCK_MINUTES, plus counts per status. Each (doctor, day)
+entry is cached in the API cache; the days missing from it are loaded with
+a single range query on (doctor, appointment_date), which the
+hms_appt_doctor_date_idx index serves and which only touches the partitions
+of the requested months, so a dashboard costs the same however many
+appointments the hospital holds.
+
+Saving or deleting an appointment forgets the cached days it was on before
+and after the change (see hms.signals). Queryset update() and bulk
+operations send no signals; settings.SCHEDULE_CACHE_TTL bounds how long such
+changes stay invisible.
+"""
+from collections import Counter
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from hms.models import Appointment
+
+CACHE_KEY = 'doctor-schedule:v1:{doctor_id}:{day}'
+
+# Statuses that no longer occupy the doctor's time
+INACTIVE_STATUSES = ('Cancelled',)
+
+
+def _cache():
+    return caches[settings.API_CACHE_ALIAS]
+
+
+def cache_key(doctor_id, day):
+    return CACHE_KEY.format(doctor_id=doctor_id, day=day.isoformat())
+
+
+def get_block_length():
+    return timedelta(minutes=getattr(settings, 'SCHEDULE_BLOCK_MINUTES', 60))
+
+
+def block_start(moment, block_length):
+    """Start of the block (counted from local midnight) that moment falls in."""
+    local = timezone.localtime(moment)
+    midnight = local.replace(hour=0, minute=0, second=0, microsecond=0)
+    return midnight + (local - midnight) // block_length * block_length
+
+
+def build_day(doctor_id, day, rows):
+    """The schedule entry of one day from its appointment rows, in time order."""
+    block_length = get_block_length()
+    blocks = []
+    for row in rows:
+        start = block_start(row['appointment_date'], block_length)
+        if not blocks or blocks[-1]['start'] != start:
+            blocks.append({'start': start, 'end': start + block_length, 'count': 0, 'appointments': []})
+        blocks[-1]['count'] += 1
+        blocks[-1]['appointments'].append({
+            'appointment_id': row['appointment_id'],
+            'appointment_date': row['appointment_date'],
+            'patient': row['patient_id'],
+            'patient_name': f"{row['patient__first_name']} {row['patient__last_name']}",
+            'reason': row['reason'],
+            'status': row['status'],
+        })
+    by_status = Counter(row['status'] for row in rows)
+    return {
+        'doctor': doctor_id,
+        'date': day,
+        'counts': {
+            'total': len(rows),
+            'active': len(rows) - sum(by_status[status] for status in INACTIVE_STATUSES),
+            'by_status': dict(by_status),
+        },
+        'blocks': blocks,
+    }
+
+
+def load_days(doctor_id, days):
+    """Build the entries of days (sorted) with one query over the range they span."""
+    range_start = timezone.make_aware(datetime.combine(days[0], time.min))
+    range_end = timezone.make_aware(datetime.combine(days[-1] + timedelta(days=1), time.min))
+    rows_by_day = {day: [] for day in days}
+    rows = Appointment.objects.filter(doctor_id=doctor_id).in_range(range_start, range_end).order_by(
+        'appointment_date', 'appointment_id'
+    ).values(
+        'appointment_id', 'appointment_date', 'reason', 'status',
+        'patient_id', 'patient__first_name', 'patient__last_name',
+    )
+    for row in rows:
+        day = timezone.localdate(row['appointment_date'])
+        # Days between the missing ones are in the range but already cached
+        if day in rows_by_day:
+            rows_by_day[day].append(row)
+    return {day: build_day(doctor_id, day, day_rows) for day, day_rows in rows_by_day.items()}
+
+
+def daily_schedule(doctor_id, date_from, date_to):
+    """
+    Return the schedule entries of doctor_id for every day from date_from to
+    date_to (both inclusive), days without appointments included.
+
+    Costs one cache round trip, plus one query when any day is not cached.
+    """
+    days = [date_from + timedelta(days=offset) for offset in range((date_to - date_from).days + 1)]
+    keys = {cache_key(doctor_id, day): day for day in days}
+    found = _cache().get_many(keys)
+    entries = {keys[key]: entry for key, entry in found.items()}
+
+    missing = [day for day in days if day not in entries]
+    if missing:
+        loaded = load_days(doctor_id, missing)
+        _cache().set_many(
+            {cache_key(doctor_id, day): entry for day, entry in loaded.items()}, settings.SCHEDULE_CACHE_TTL
+        )
+        entries.update(loaded)
+    return [entries[day] for day in days]
+
+
+def forget_days(pairs):
+    """Drop the cached entries of the given (doctor_id, appointment datetime) pairs."""
+    keys = {
+        cache_key(doctor_id, timezone.localdate(moment))
+        for doctor_id, moment in pairs if doctor_id is not None and moment is not None
+    }
+    if keys:
+        _cache().delete_many(list(keys))
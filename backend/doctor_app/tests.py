@@ -1,3 +1,270 @@
-from django.test import TestCase
+from datetime import date, datetime, time, timedelta
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from hms.models import Appointment as HospitalAppointment, Doctor, Patient
+from patient_app.models import Appointment, PatientProfile
+from .availability import compute_free_slots
+from .models import DoctorSchedule
+from .schedule import daily_schedule
+
+
+def next_weekday(weekday):
+    """Return the next date (after today) falling on the given weekday (0 = Monday)."""
+    today = timezone.localdate()
+    return today + timedelta(days=(weekday - today.weekday() - 1) % 7 + 1)
+
+
+@override_settings(APPOINTMENT_SLOT_MINUTES=30)
+class DoctorAvailabilityTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='slot_admin', password='adminpassword')
+        patient_user = User.objects.create_user(username='slot_patient', password='patientpassword')
+        cls.patient = PatientProfile.objects.create(user=patient_user)
+
+        cls.doctor = Doctor.objects.create(
+            first_name='Ayesha', last_name='Khan', specialization='Cardiology', department='Cardiology'
+        )
+        cls.other_doctor = Doctor.objects.create(
+            first_name='Bilal', last_name='Ahmed', specialization='Cardiology', department='Cardiology'
+        )
+        cls.opd_doctor = Doctor.objects.create(
+            first_name='Zain', last_name='Raza', specialization='General', department='OPD'
+        )
+        # Monday 09:00-11:00 gives four 30 minute slots
+        cls.schedule = DoctorSchedule.objects.create(
+            doctor=cls.doctor, day_of_week='monday', start_time=time(9), end_time=time(11), max_appointments=3
+        )
+        DoctorSchedule.objects.create(
+            doctor=cls.other_doctor, day_of_week='monday', start_time=time(14), end_time=time(15)
+        )
+        DoctorSchedule.objects.create(
+            doctor=cls.opd_doctor, day_of_week='monday', start_time=time(9), end_time=time(10)
+        )
+        cls.monday = next_weekday(0)
+
+    def setUp(self):
+        self.client.force_authenticate(user=self.user)
+
+    def at(self, hour, minute=0):
+        return timezone.make_aware(datetime.combine(self.monday, time(hour, minute)))
+
+    def book(self, hour, minute=0, status='SCHEDULED', doctor=None):
+        return Appointment.objects.create(
+            patient=self.patient, doctor=doctor or self.doctor,
+            appointment_datetime=self.at(hour, minute), status=status,
+        )
+
+    def slot_starts(self, response):
+        return [slot['start'] for slot in response.data['slots']]
+
+    def test_booked_slots_are_excluded(self):
+        self.book(9, 30)
+        self.book(10, 0, status='CANCELLED')
+
+        response = self.client.get(
+            reverse('doctor-schedule-slots', args=[self.schedule.pk]),
+            {'from': self.monday.isoformat(), 'to': self.monday.isoformat()},
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            self.slot_starts(response),
+            [self.at(9).isoformat(), self.at(10).isoformat(), self.at(10, 30).isoformat()],
+        )
+
+    def test_full_day_has_no_slots(self):
+        for hour, minute in [(9, 0), (9, 30), (10, 0)]:
+            self.book(hour, minute)
+
+        free_slots = compute_free_slots(DoctorSchedule.objects.filter(pk=self.schedule.pk), self.monday, self.monday)
+
+        self.assertEqual(free_slots[self.doctor.pk], [])
+
+    def test_past_slots_are_skipped(self):
+        free_slots = compute_free_slots(
+            DoctorSchedule.objects.filter(pk=self.schedule.pk), self.monday, self.monday, now=self.at(10)
+        )
+
+        self.assertEqual([slot.start for slot in free_slots[self.doctor.pk]], [self.at(10), self.at(10, 30)])
+
+    def test_slots_cover_every_matching_weekday_in_range(self):
+        response = self.client.get(
+            reverse('doctor-schedule-slots', args=[self.schedule.pk]),
+            {'from': self.monday.isoformat(), 'to': (self.monday + timedelta(days=7)).isoformat()},
+        )
+
+        self.assertEqual(len(response.data['slots']), 8)
+
+    def test_department_availability_uses_constant_queries(self):
+        self.book(9, 0)
+        self.book(14, 0, doctor=self.other_doctor)
+        params = {'department': 'Cardiology', 'from': self.monday.isoformat(), 'to': self.monday.isoformat()}
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('doctor-schedule-availability'), params)
+        baseline = len(queries)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        slots_by_doctor = {entry['doctor']: len(entry['slots']) for entry in response.data}
+        self.assertEqual(slots_by_doctor, {self.doctor.pk: 3, self.other_doctor.pk: 1})
+
+        extra_doctor = Doctor.objects.create(
+            first_name='Hina', last_name='Iqbal', specialization='Cardiology', department='Cardiology'
+        )
+        DoctorSchedule.objects.create(doctor=extra_doctor, day_of_week='monday', start_time=time(9), end_time=time(12))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('doctor-schedule-availability'), params)
+
+        self.assertEqual(len(response.data), 3)
+        self.assertEqual(len(queries), baseline)
+
+    def test_invalid_range_is_rejected(self):
+        url = reverse('doctor-schedule-slots', args=[self.schedule.pk])
+
+        self.assertEqual(self.client.get(url, {'from': 'next monday'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            self.client.get(url, {'from': '2025-02-10', 'to': '2025-02-01'}).status_code,
+            status.HTTP_400_BAD_REQUEST,
+        )
+        self.assertEqual(
+            self.client.get(url, {'from': '2025-01-01', 'to': '2025-12-31'}).status_code,
+            status.HTTP_400_BAD_REQUEST,
+        )
+
+
+@override_settings(SCHEDULE_BLOCK_MINUTES=60)
+class DailyScheduleTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor_user = User.objects.create_user(username='schedule_doctor', password='password123')
+        cls.doctor = Doctor.objects.create(
+            user=cls.doctor_user, first_name='Sana', last_name='Malik', specialization='General', department='OPD'
+        )
+        cls.other_doctor = Doctor.objects.create(
+            first_name='Omar', last_name='Farooq', specialization='General', department='OPD'
+        )
+        cls.patient = Patient.objects.create(
+            reg_num='2024001', first_name='Hamza', last_name='Ali', gender='Male', date_of_birth='1995-05-05'
+        )
+        cls.day = date(2030, 3, 4)
+
+    def setUp(self):
+        caches[settings.API_CACHE_ALIAS].clear()
+
+    def at(self, hour, minute=0, day=None):
+        return timezone.make_aware(datetime.combine(day or self.day, time(hour, minute)))
+
+    def book(self, hour, minute=0, status='Scheduled', doctor=None, day=None):
+        return HospitalAppointment.objects.create(
+            patient=self.patient, doctor=doctor or self.doctor, appointment_date=self.at(hour, minute, day),
+            reason='Checkup', status=status,
+        )
+
+    def test_groups_the_doctors_day_into_blocks(self):
+        first = self.book(9)
+        second = self.book(9, 40, status='Cancelled')
+        third = self.book(11, 15)
+        self.book(9, doctor=self.other_doctor)
+        self.book(9, day=self.day + timedelta(days=1))
+
+        entry, = daily_schedule(self.doctor.pk, self.day, self.day)
+
+        self.assertEqual(entry['counts'], {
+            'total': 3, 'active': 2, 'by_status': {'Scheduled': 2, 'Cancelled': 1},
+        })
+        self.assertEqual(
+            [(block['start'], block['count']) for block in entry['blocks']], [(self.at(9), 2), (self.at(11), 1)]
+        )
+        self.assertEqual(
+            [item['appointment_id'] for block in entry['blocks'] for item in block['appointments']],
+            [first.pk, second.pk, third.pk],
+        )
+        self.assertEqual(entry['blocks'][0]['appointments'][0]['patient_name'], 'Hamza Ali')
+
+    def test_range_costs_one_query_then_none(self):
+        self.book(9)
+        self.book(10, day=self.day + timedelta(days=2))
+        date_to = self.day + timedelta(days=6)
+
+        with CaptureQueriesContext(connection) as queries:
+            days = daily_schedule(self.doctor.pk, self.day, date_to)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual([entry['counts']['total'] for entry in days], [1, 0, 1, 0, 0, 0, 0])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(daily_schedule(self.doctor.pk, self.day, date_to), days)
+        self.assertEqual(len(queries), 0)
+
+    def test_appointment_changes_invalidate_cached_days(self):
+        next_day = self.day + timedelta(days=1)
+        appointment = self.book(9)
+        daily_schedule(self.doctor.pk, self.day, next_day)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book(14)
+        self.assertEqual(daily_schedule(self.doctor.pk, self.day, self.day)[0]['counts']['total'], 2)
+
+        # Moving an appointment refreshes the day it left and the day it moved to
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.appointment_date = self.at(9, day=next_day)
+            appointment.save()
+        today, tomorrow = daily_schedule(self.doctor.pk, self.day, next_day)
+        self.assertEqual((today['counts']['total'], tomorrow['counts']['total']), (1, 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.delete()
+        self.assertEqual(daily_schedule(self.doctor.pk, next_day, next_day)[0]['counts']['total'], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.patient.first_name = 'Hamid'
+            self.patient.save()
+        block = daily_schedule(self.doctor.pk, self.day, self.day)[0]['blocks'][0]
+        self.assertEqual(block['appointments'][0]['patient_name'], 'Hamid Ali')
+
+    def test_daily_endpoint_serves_the_logged_in_doctor(self):
+        self.book(9)
+        self.book(9, doctor=self.other_doctor)
+        self.client.force_authenticate(user=self.doctor_user)
+
+        # ?doctor= is ignored for doctors
+        response = self.client.get(reverse('schedule-daily'), {
+            'from': self.day.isoformat(), 'to': self.day.isoformat(), 'doctor': self.other_doctor.pk,
+        })
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['doctor'], self.doctor.pk)
+        self.assertEqual(response.data['days'][0]['counts']['total'], 1)
+
+    def test_schedule_list_is_limited_to_the_doctor(self):
+        own = self.book(9)
+        self.book(10, doctor=self.other_doctor)
+        self.book(9, day=self.day + timedelta(days=10))
+        self.client.force_authenticate(user=self.doctor_user)
+
+        response = self.client.get(reverse('schedule-list'), {'from': self.day.isoformat(), 'to': self.day.isoformat()})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        results = response.data['results'] if isinstance(response.data, dict) else response.data
+        self.assertEqual([item['appointment_id'] for item in results], [own.pk])
+
+    def test_dashboard_renders_one_day(self):
+        self.book(9)
+        self.book(9, day=self.day + timedelta(days=1))
+        self.client.force_login(self.doctor_user)
+
+        response = self.client.get(reverse('doctor_app:doctor_daily_schedule'), {'date': self.day.isoformat()})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.context['schedule']['counts']['total'], 1)
+        self.assertContains(response, 'Hamza Ali')
@@ -1,11 +1,39 @@
 from django.shortcuts import render,redirect
 from hms.models import Appointment,Patient,LabTestOrder  # Import the Appointment model
 from django.contrib.auth.decorators import login_required # Import login_required
+from django.core.exceptions import PermissionDenied
 from .forms import DoctorProfileForm,LabTestOrderForm
+from datetime import date, datetime, time, timedelta
+from django.utils import timezone
 from rest_framework import viewsets, filters
+from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied as APIPermissionDenied, ValidationError
+from rest_framework.response import Response
 from hms.models import Doctor
 from .models import DoctorSchedule
 from .serializers import DoctorProfileSerializer, ScheduleSerializer, DoctorScheduleSerializer
+from .availability import compute_free_slots
+from .schedule import daily_schedule
+from hms.caching import DOCTOR_SCHEDULES, DOCTORS, CachedResponseMixin
+from hms.roles import ADMIN, DOCTOR, RECEPTIONIST, get_role, resolve_identity
+
+# Longest date range a single availability or schedule request may cover
+MAX_SLOT_RANGE_DAYS = 62
+
+
+def get_date_range(params):
+    """Parse ?from=&to= (YYYY-MM-DD); defaults to the next 7 days starting today."""
+    try:
+        date_from = date.fromisoformat(params['from']) if params.get('from') else timezone.localdate()
+        date_to = date.fromisoformat(params['to']) if params.get('to') else date_from + timedelta(days=6)
+    except ValueError:
+        raise ValidationError({'detail': 'Invalid date format. Please use YYYY-MM-DD.'})
+    if date_to < date_from:
+        raise ValidationError({'detail': "'to' must not be before 'from'."})
+    if (date_to - date_from).days >= MAX_SLOT_RANGE_DAYS:
+        raise ValidationError({'detail': f'Date range may not exceed {MAX_SLOT_RANGE_DAYS} days.'})
+    return date_from, date_to
+
 
 @login_required
 def doctor_index(request):
@@ -15,9 +43,20 @@ def doctor_index(request):
 
 @login_required 
 def doctor_daily_schedule_view(request):
-    """View to display a doctor's daily schedule (initially showing all appointments)."""
-    appointments = Appointment.objects.all()  # Fetch all appointments for now
-    context = {'appointments': appointments}
+    """The logged-in doctor's appointments of one day (?date=YYYY-MM-DD, default today), in time blocks."""
+    identity = resolve_identity(request.user)
+    if identity is None or identity.doctor_id is None:
+        raise PermissionDenied
+    try:
+        day = date.fromisoformat(request.GET['date']) if request.GET.get('date') else timezone.localdate()
+    except ValueError:
+        day = timezone.localdate()
+    schedule = daily_schedule(identity.doctor_id, day, day)[0]
+    context = {
+        'schedule': schedule,
+        'previous_day': day - timedelta(days=1),
+        'next_day': day + timedelta(days=1),
+    }
     return render(request, 'doctor_app/doctor_daily_schedule.html', context)
 
    
@@ -30,7 +69,8 @@ def doctor_profile_view(request):
 
 @login_required
 def doctor_patient_list(request):
-    patients = Patient.objects.filter(appointments__doctor=request.user.doctor).distinct()
+    # Patients from both appointment tables, resolved to the canonical hms.Patient
+    patients = Patient.objects.seen_by(request.user.doctor)
     return render(request, 'doctor_app/doctor_patient_list.html', {'patients': patients})
 
 
@@ -60,7 +100,8 @@ def order_lab_test(request):
         form = LabTestOrderForm()
     return render(request, 'doctor_app/order_lab_test.html', {'form': form})
 
-class DoctorProfileViewSet(viewsets.ModelViewSet):
+class DoctorProfileViewSet(CachedResponseMixin, viewsets.ModelViewSet):
+    cache_namespaces = (DOCTORS,)
     queryset = Doctor.objects.all()
     serializer_class = DoctorProfileSerializer
 
@@ -68,18 +109,108 @@ class ScheduleViewSet(viewsets.ModelViewSet):
     serializer_class = ScheduleSerializer
     
     def get_queryset(self):
-        return Appointment.objects.all().order_by('appointment_date')
+        # Doctors see their own appointments; admins and receptionists see
+        # everyone's, or one doctor's with ?doctor=
+        user = self.request.user
+        role = get_role(user)
+        if role == DOCTOR:
+            queryset = Appointment.objects.filter(doctor_id=resolve_identity(user).doctor_id)
+        elif role in (ADMIN, RECEPTIONIST):
+            queryset = Appointment.objects.all()
+            if self.request.query_params.get('doctor'):
+                queryset = queryset.filter(doctor_id=self.request.query_params['doctor'])
+        else:
+            return Appointment.objects.none()
+        if self.action == 'list' and ('from' in self.request.query_params or 'to' in self.request.query_params):
+            date_from, date_to = get_date_range(self.request.query_params)
+            queryset = queryset.in_range(
+                timezone.make_aware(datetime.combine(date_from, time.min)),
+                timezone.make_aware(datetime.combine(date_to + timedelta(days=1), time.min)),
+            )
+        return queryset.select_related('patient').order_by('appointment_date')
+
+    @action(detail=False, methods=['get'])
+    def daily(self, request):
+        """
+        The doctor's appointments per day over ?from=&to=, grouped into time
+        blocks with per-day counts (see doctor_app.schedule). Doctors get their
+        own schedule; admins and receptionists pass ?doctor=.
+        """
+        role = get_role(request.user)
+        if role == DOCTOR:
+            doctor_id = resolve_identity(request.user).doctor_id
+        elif role in (ADMIN, RECEPTIONIST):
+            try:
+                doctor_id = int(request.query_params['doctor'])
+            except (KeyError, ValueError):
+                raise ValidationError({'doctor': 'A doctor id is required.'})
+        else:
+            raise APIPermissionDenied()
+        date_from, date_to = get_date_range(request.query_params)
+        return Response({
+            'doctor': doctor_id,
+            'from': date_from,
+            'to': date_to,
+            'days': daily_schedule(doctor_id, date_from, date_to),
+        })
 
 # Add the new viewset for doctor schedules
-class DoctorScheduleViewSet(viewsets.ModelViewSet):
+class DoctorScheduleViewSet(CachedResponseMixin, viewsets.ModelViewSet):
+    cache_namespaces = (DOCTOR_SCHEDULES,)
     serializer_class = DoctorScheduleSerializer
     queryset = DoctorSchedule.objects.all()
     filter_backends = [filters.SearchFilter]
     search_fields = ['doctor__doctor_id', 'day_of_week']
     
     def get_queryset(self):
-        queryset = DoctorSchedule.objects.all()
+        queryset = DoctorSchedule.objects.select_related('doctor')
         doctor_id = self.request.query_params.get('doctor')
         if doctor_id:
             queryset = queryset.filter(doctor__doctor_id=doctor_id)
-        return queryset
\ No newline at end of file
+        department = self.request.query_params.get('department')
+        if department:
+            queryset = queryset.filter(doctor__department=department)
+        return queryset
+
+    def get_slot_range(self):
+        return get_date_range(self.request.query_params)
+
+    @staticmethod
+    def serialize_slots(slots):
+        return [{'start': slot.start.isoformat(), 'end': slot.end.isoformat()} for slot in slots]
+
+    @action(detail=True, methods=['get'])
+    def slots(self, request, pk=None):
+        """Free slots within this schedule window over the requested date range."""
+        schedule = self.get_object()
+        date_from, date_to = self.get_slot_range()
+        free_slots = compute_free_slots(DoctorSchedule.objects.filter(pk=schedule.pk), date_from, date_to)
+        return Response({
+            'schedule_id': schedule.schedule_id,
+            'doctor': schedule.doctor_id,
+            'from': date_from,
+            'to': date_to,
+            'slots': self.serialize_slots(free_slots.get(schedule.doctor_id, [])),
+        })
+
+    @action(detail=False, methods=['get'])
+    def availability(self, request):
+        """
+        Free slots for every doctor matching ?doctor= or ?department= over the
+        requested date range, computed with one appointment query for all of them.
+        """
+        date_from, date_to = self.get_slot_range()
+        schedules = self.get_queryset()
+        doctors = {schedule.doctor_id: schedule.doctor for schedule in schedules}
+        free_slots = compute_free_slots(schedules, date_from, date_to)
+        return Response([
+            {
+                'doctor': doctor_id,
+                'doctor_name': f"{doctors[doctor_id].first_name} {doctors[doctor_id].last_name}",
+                'department': doctors[doctor_id].department,
+                'from': date_from,
+                'to': date_to,
+                'slots': self.serialize_slots(slots),
+            }
+            for doctor_id, slots in free_slots.items()
+        ])
\ No newline at end of file
@@ -5,9 +5,10 @@ import csv
 from django.http import HttpResponse
 from django.urls import path
 from django.shortcuts import render
-from django.db.models import Count, Sum
 from django.utils.html import format_html
 from django.urls import reverse
+from admin_app.statistics import get_statistics
+from .replicas import use_replica
 
 # Auditlog registrations
 auditlog.register(Patient)
@@ -50,24 +51,14 @@ class AppointmentAdmin(admin.ModelAdmin):
         return custom_urls + urls
     
     def report_view(self, request):
-        # Generate comprehensive report data
-        report_data = {
-            'patients': Patient.objects.count(),
-            'doctors': Doctor.objects.count(),
-            'appointments': Appointment.objects.count(),
-            'revenue': Billing.objects.aggregate(Sum('amount'))['amount__sum'] or 0,
-            'appointments_by_status': list(
-                Appointment.objects.values('status')
-                .annotate(count=Count('status'))
-                .order_by('-count')
-            ),
-            'top_doctors': list(
-                Doctor.objects.annotate(appointment_count=Count('appointments'))
-                .order_by('-appointment_count')[:5]
-            ),
-            'recent_bills': Billing.objects.select_related('patient')
-                               .order_by('-bill_date')[:10]
-        }
+        # Totals, status breakdown and top doctors come from the pre-aggregated
+        # counters in admin_app.statistics instead of scanning the tables;
+        # all of it is read from the replica when one is configured
+        with use_replica(request):
+            report_data = get_statistics()
+            report_data['recent_bills'] = list(
+                Billing.objects.select_related('patient').order_by('-bill_date')[:10]
+            )
         return render(request, 'admin/appointment_report.html', report_data)
     
     def generate_report(self, request, queryset):
@@ -0,0 +1,126 @@
+"""
+Response caching for read-mostly reference endpoints (doctors, schedules).
+
+Each cached response is keyed by the current version of the namespaces it
+depends on (e.g. 'doctors'). Saving or deleting a Doctor or DoctorSchedule
+bumps the matching version (see hms.signals), which makes every older entry
+unreachable without having to find and delete it. The version numbers also
+make up the response ETag, so a client revalidating with If-None-Match gets
+a 304 from one cache lookup, without touching the database or rendering.
+
+Hits, misses and 304s are counted per namespace in this process and are
+reported by /api/diagnostics/.
+"""
+import hashlib
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.response import Response
+
+DOCTORS = 'doctors'
+DOCTOR_SCHEDULES = 'doctor_schedules'
+
+VERSION_KEY = 'api-cache:version:{namespace}'
+RESPONSE_KEY = 'api-cache:response:{fingerprint}'
+
+
+class CacheStats:
+    """Thread-safe per-namespace hit/miss/not-modified counters."""
+
+    def __init__(self):
+        self._counts = defaultdict(lambda: {'hits': 0, 'misses': 0, 'not_modified': 0})
+        self._lock = threading.Lock()
+
+    def record(self, namespace, outcome):
+        with self._lock:
+            self._counts[namespace][outcome] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {namespace: dict(counts) for namespace, counts in self._counts.items()}
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+
+stats = CacheStats()
+
+
+def _cache():
+    return caches[settings.API_CACHE_ALIAS]
+
+
+def get_versions(namespaces):
+    """Return {namespace: version}, creating missing versions in the same round trip."""
+    keys = {VERSION_KEY.format(namespace=namespace): namespace for namespace in namespaces}
+    found = _cache().get_many(keys)
+    versions = {}
+    for key, namespace in keys.items():
+        if key not in found:
+            # Start from the clock rather than 1 so a version evicted from the
+            # cache can never line up with responses cached under an old one
+            _cache().add(key, time.time_ns(), None)
+            found[key] = _cache().get(key)
+        versions[namespace] = found[key]
+    return versions
+
+
+def bump_version(namespace):
+    """Invalidate every cached response that depends on namespace."""
+    key = VERSION_KEY.format(namespace=namespace)
+    try:
+        _cache().incr(key)
+    except ValueError:
+        _cache().set(key, time.time_ns(), None)
+
+
+class CachedResponseMixin:
+    """
+    Serve list and retrieve responses of a ViewSet from the shared cache.
+
+    Set cache_namespaces to the namespaces whose changes invalidate the
+    responses. Responses are shared between users, so only use this on
+    endpoints whose output does not depend on who is asking; permission
+    checks still run before the cache is consulted.
+    """
+    cache_namespaces = ()
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        namespace = '+'.join(self.cache_namespaces)
+        versions = get_versions(self.cache_namespaces)
+        fingerprint = hashlib.sha1(repr((
+            type(self).__module__, type(self).__qualname__, self.action, sorted(kwargs.items()),
+            sorted(request.query_params.lists()), request.accepted_renderer.format, sorted(versions.items()),
+        )).encode()).hexdigest()
+        etag = f'W/"{fingerprint}"'
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+
+        if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+            stats.record(namespace, 'not_modified')
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        key = RESPONSE_KEY.format(fingerprint=fingerprint)
+        data = _cache().get(key)
+        if data is not None:
+            stats.record(namespace, 'hits')
+            response = Response(data, headers={**headers, 'X-Cache': 'HIT'})
+        else:
+            stats.record(namespace, 'misses')
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            _cache().set(key, response.data, settings.API_CACHE_TTL)
+            for header, value in {**headers, 'X-Cache': 'MISS'}.items():
+                response[header] = value
+        return response
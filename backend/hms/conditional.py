@@ -0,0 +1,78 @@
+"""
+Conditional GET support for ViewSets over models with an updated_at column.
+
+A list response is validated by an ETag over the newest updated_at and the row
+count of the user's filtered queryset (one aggregate query). A detail response
+is validated by the object's own updated_at, sent as ETag and Last-Modified. A
+request whose If-None-Match / If-Modified-Since still matches gets a 304 before
+anything is fetched for the page or serialized.
+
+Lists get no Last-Modified: deleting the newest row, or a second write within
+the same second, leaves the newest whole-second updated_at unchanged (or makes
+it earlier), so If-Modified-Since alone would answer 304 for a changed list.
+
+Only the row's own updated_at is tracked: a change to a related row (e.g. a
+doctor's name shown in a record) does not change the validators.
+"""
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+
+class ConditionalGetMixin:
+    """Add ETag validation to the list action and ETag/Last-Modified to retrieve."""
+    updated_field = 'updated_at'
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        summary = queryset.select_related(None).order_by().aggregate(
+            last_modified=Max(self.updated_field), count=Count('pk')
+        )
+        etag, _ = self.get_validators(summary['last_modified'], summary['count'])
+        validators = (etag, None)
+        not_modified = self.get_not_modified_response(request, *validators)
+        if not_modified is not None:
+            return not_modified
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            response = self.get_paginated_response(self.get_serializer(page, many=True).data)
+        else:
+            response = Response(self.get_serializer(queryset, many=True).data)
+        return self.set_validators(response, *validators)
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        validators = self.get_validators(getattr(instance, self.updated_field), instance.pk)
+        not_modified = self.get_not_modified_response(request, *validators)
+        if not_modified is not None:
+            return not_modified
+        return self.set_validators(Response(self.get_serializer(instance).data), *validators)
+
+    def get_validators(self, last_modified, *parts):
+        """Return (etag, last_modified) for the current request and the given state."""
+        request = self.request
+        fingerprint = hashlib.sha1(repr((
+            type(self).__qualname__, self.action, request.user.pk, sorted(request.query_params.lists()),
+            request.accepted_renderer.format, last_modified and last_modified.isoformat(), parts,
+        )).encode()).hexdigest()
+        return f'W/"{fingerprint}"', last_modified
+
+    def get_not_modified_response(self, request, etag, last_modified):
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is not None:
+            self.set_validators(response, etag, last_modified)
+        return response
+
+    @staticmethod
+    def set_validators(response, etag, last_modified):
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified.timestamp())
+        # Per-user data: browsers may keep it but must revalidate every time
+        response['Cache-Control'] = 'private, no-cache'
+        return response
@@ -0,0 +1,182 @@
+"""
+Health probes and the diagnostics snapshot.
+
+/api/health/live/ answers without touching the database, so a liveness probe
+only restarts a process that has stopped serving requests. /api/health/ready/
+runs ``SELECT 1`` and checks the connection pool (when one is configured),
+so a load balancer stops routing to a process whose database is unreachable
+or whose pool is saturated.
+
+/api/diagnostics/ reads its row counts from a snapshot cached for
+settings.DIAGNOSTICS_SNAPSHOT_TTL seconds, so a probe usually costs one
+``SELECT 1`` plus a cache read. When the snapshot is stale, the one request
+that wins a cache lock rebuilds it inline and every other request keeps
+getting the stale copy meanwhile; the probe is unauthenticated, so it does
+not write task rows that would pile up without a worker. On PostgreSQL the
+counts are the planner's pg_class.reltuples estimates, read in a single
+query instead of a COUNT(*) per table; counts_estimated tells per table
+whether its count is an estimate or exact. Snapshots are built from the
+read replica when one is configured (see hms.replicas).
+"""
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import DatabaseError, connections, router
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import Appointment, Doctor, Patient, Receptionist
+from .replicas import monitor, replica_alias, use_replica
+
+SNAPSHOT_KEY = 'hms:diagnostics:snapshot'
+REFRESH_LOCK_KEY = 'hms:diagnostics:refreshing'
+# Let another request refresh after this many seconds if a refresh never finished
+REFRESH_LOCK_TIMEOUT = 300
+
+COUNTED_MODELS = {
+    'users': User,
+    'doctors': Doctor,
+    'patients': Patient,
+    'appointments': Appointment,
+    'receptionists': Receptionist,
+}
+
+
+def _cache():
+    return caches[settings.API_CACHE_ALIAS]
+
+
+def check_database(alias='default'):
+    """Run SELECT 1 on the alias; returns the error message, or None when it answered."""
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+    except DatabaseError as e:
+        return str(e)
+    return None
+
+
+def pool_status(alias='default'):
+    """Statistics of the alias's psycopg connection pool, or None without one."""
+    pool = getattr(connections[alias], 'pool', None)
+    if pool is None:
+        return None
+    stats = pool.get_stats()
+    size, available = stats.get('pool_size', 0), stats.get('pool_available', 0)
+    return {
+        'min_size': pool.min_size,
+        'max_size': pool.max_size,
+        'size': size,
+        'in_use': size - available,
+        'available': available,
+        'waiting': stats.get('requests_waiting', 0),
+        # Cumulative since the pool started
+        'requests': stats.get('requests_num', 0),
+        'wait_ms': stats.get('requests_wait_ms', 0),
+        'timeouts': stats.get('requests_errors', 0),
+    }
+
+
+def readiness(alias='default'):
+    """Return (ready, details) for the readiness probe."""
+    error = check_database(alias)
+    pool = pool_status(alias)
+    details = {'database': 'ok' if error is None else error}
+    if pool is not None:
+        details['pool'] = pool
+        limit = settings.HEALTH_POOL_MAX_WAITING
+        if limit and pool['waiting'] > limit:
+            details['pool_error'] = f"{pool['waiting']} requests waiting for a database connection"
+    return error is None and 'pool_error' not in details, details
+
+
+def estimated_counts():
+    """Row counts per COUNTED_MODELS key, and per key whether the count is a planner estimate."""
+    connection = connections[router.db_for_read(User)]
+    counts = {}
+    if connection.vendor == 'postgresql':
+        tables = {model._meta.db_table: key for key, model in COUNTED_MODELS.items()}
+        with connection.cursor() as cursor:
+            # Partitioned parents (see hms.partitioning) hold no rows and are
+            # never analyzed, so their estimate is the sum of their partitions'
+            cursor.execute(
+                "SELECT parent.relname, CASE WHEN parent.relkind = 'p' THEN ("
+                "  SELECT COALESCE(SUM(GREATEST(child.reltuples, 0)), 0) FROM pg_inherits"
+                "  JOIN pg_class child ON child.oid = pg_inherits.inhrelid"
+                "  WHERE pg_inherits.inhparent = parent.oid"
+                ") ELSE parent.reltuples END::bigint FROM pg_class parent "
+                "WHERE parent.relkind IN ('r', 'p') AND parent.relname = ANY(%s) "
+                "AND pg_table_is_visible(parent.oid)",
+                [list(tables)],
+            )
+            for table, estimate in cursor.fetchall():
+                # -1 (or 0 for a table that was never analyzed) means no statistics yet
+                if estimate > 0:
+                    counts[tables[table]] = estimate
+    estimated = {key: key in counts for key in COUNTED_MODELS}
+    for key, model in COUNTED_MODELS.items():
+        if key not in counts:
+            counts[key] = model.objects.count()
+    return counts, estimated
+
+
+def build_snapshot():
+    counts, estimated = estimated_counts()
+    user_types = User.objects.aggregate(
+        staff_users=Count('pk', filter=Q(is_staff=True)),
+        superusers=Count('pk', filter=Q(is_superuser=True)),
+    )
+    return {
+        'generated_at': timezone.now().isoformat(),
+        'refreshed_at': time.time(),
+        'counts': counts,
+        'counts_estimated': estimated,
+        'user_types': {
+            **user_types,
+            'regular_users': max(counts['users'] - user_types['staff_users'], 0),
+        },
+        'samples': {
+            'doctors': list(Doctor.objects.all()[:3].values('doctor_id', 'first_name', 'last_name', 'specialization')),
+            'patients': list(Patient.objects.all()[:3].values('patient_id', 'first_name', 'last_name')),
+        },
+    }
+
+
+def replica_status():
+    """The replica alias and its last measured lag, or None without a replica."""
+    alias = replica_alias()
+    if alias is None:
+        return None
+    lag = monitor.status(alias)
+    return {
+        'alias': alias,
+        'lag_seconds': None if lag is None else round(lag, 3),
+        'max_lag_seconds': settings.DB_REPLICA_MAX_LAG,
+    }
+
+
+def refresh_snapshot():
+    with use_replica():
+        snapshot = build_snapshot()
+    # Kept well past its TTL so readers can serve it while it is being refreshed
+    _cache().set(SNAPSHOT_KEY, snapshot, settings.DIAGNOSTICS_SNAPSHOT_TTL * 10)
+    return snapshot
+
+
+def get_snapshot():
+    """The cached snapshot, rebuilt inline by one request at a time once stale."""
+    cache = _cache()
+    snapshot = cache.get(SNAPSHOT_KEY)
+    if snapshot is None:
+        return refresh_snapshot()
+    if time.time() - snapshot['refreshed_at'] >= settings.DIAGNOSTICS_SNAPSHOT_TTL:
+        # One refresh at a time, however many probes notice the snapshot is stale
+        if cache.add(REFRESH_LOCK_KEY, True, REFRESH_LOCK_TIMEOUT):
+            try:
+                snapshot = refresh_snapshot()
+            finally:
+                cache.delete(REFRESH_LOCK_KEY)
+    return snapshot
@@ -0,0 +1,203 @@
+"""
+One identity row per person.
+
+hms.Patient is the canonical patient record and is linked to the login account
+through Patient.user. patient_app.PatientProfile shares that user as its
+primary key, so the two rows of one person map to each other by user id
+without any extra table. The same goes for staff: hms.Receptionist (linked
+through Receptionist.user) is the canonical receptionist record, and the
+older receptionist_app.Receptionist rows are no longer written.
+
+The merge functions link and fill in the rows created before this was the
+case. They take an app registry so the data migration can run them against
+historical models, and they work in primary key batches, each in its own
+short transaction, so no table stays locked for the length of the merge.
+"""
+import logging
+import re
+
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+# hms.Patient only accepts the long gender names
+GENDER_NAMES = {'M': 'Male', 'F': 'Female', 'O': 'Other'}
+
+
+def _batches(queryset, batch_size):
+    """Yield lists of rows in primary key order, batch_size at a time."""
+    last_pk = None
+    while True:
+        batch_queryset = queryset.order_by('pk')
+        if last_pk is not None:
+            batch_queryset = batch_queryset.filter(pk__gt=last_pk)
+        batch = list(batch_queryset[:batch_size])
+        if not batch:
+            return
+        last_pk = batch[-1].pk
+        yield batch
+
+
+def _fill_blanks(target, source, fields):
+    """Copy fields that are empty on target from source; return whether anything changed."""
+    changed = False
+    for target_field, source_field in fields:
+        value = getattr(source, source_field)
+        if value not in (None, '') and getattr(target, target_field) in (None, ''):
+            setattr(target, target_field, value)
+            changed = True
+    return changed
+
+
+def _digits(value):
+    return re.sub(r'\D', '', value or '')
+
+
+def _corroborates(patient, profile):
+    """Whether an identifier besides the name agrees: date of birth or phone number."""
+    if profile.date_of_birth and patient.date_of_birth == profile.date_of_birth:
+        return True
+    phone = _digits(profile.contact_number)
+    return bool(phone) and phone == _digits(patient.contact_number)
+
+
+def _needs_review(review, counts, profile, reason, patients=()):
+    entry = {
+        'user_id': profile.pk,
+        'username': profile.user.username,
+        'reason': reason,
+        'patient_ids': [patient.pk for patient in patients],
+    }
+    logger.warning("Patient identity needs review: %s", entry)
+    counts['review'] += 1
+    if review is not None:
+        review.append(entry)
+
+
+def merge_patient_identities(apps, batch_size=500, review=None):
+    """
+    Link every PatientProfile to its hms.Patient and fill in fields missing
+    on either side. Unlinked patients are matched by registration number
+    (the patient's username), then by first and last name when exactly one
+    same-named patient also has the profile's date of birth or phone number.
+    Profiles without any match get a new hms.Patient when the date of birth
+    and gender needed for it are known.
+
+    A name match without a second identifier, or a new patient whose
+    registration number is taken, is neither linked nor created: it is
+    logged and appended to the review list (when given) for someone to
+    resolve by hand. Returns counts of what was done.
+    """
+    PatientProfile = apps.get_model('patient_app', 'PatientProfile')
+    Patient = apps.get_model('hms', 'Patient')
+    counts = {'linked': 0, 'created': 0, 'updated': 0, 'unmatched': 0, 'review': 0}
+
+    for profiles in _batches(PatientProfile.objects.select_related('user'), batch_size):
+        with transaction.atomic():
+            patients = {
+                patient.user_id: patient
+                for patient in Patient.objects.filter(user_id__in=[profile.pk for profile in profiles])
+            }
+            unlinked = [profile for profile in profiles if profile.pk not in patients]
+            # New patients get the username as reg_num, cut to the column's length
+            same_reg_num = list(Patient.objects.filter(
+                reg_num__in=[profile.user.username[:20] for profile in unlinked]
+            ))
+            taken_reg_nums = {patient.reg_num for patient in same_reg_num}
+            by_reg_num = {patient.reg_num: patient for patient in same_reg_num if patient.user_id is None}
+            by_name = {}
+            for patient in Patient.objects.filter(
+                user__isnull=True,
+                first_name__in={profile.user.first_name for profile in unlinked},
+                last_name__in={profile.user.last_name for profile in unlinked},
+            ):
+                by_name.setdefault((patient.first_name, patient.last_name), []).append(patient)
+
+            linked, created, claimed = [], [], set()
+            for profile in unlinked:
+                user = profile.user
+                candidate = by_reg_num.get(user.username)
+                if candidate is None and user.first_name:
+                    matches = by_name.get((user.first_name, user.last_name), [])
+                    confirmed = [patient for patient in matches if _corroborates(patient, profile)]
+                    if len(confirmed) == 1:
+                        candidate = confirmed[0]
+                    elif matches:
+                        # A name alone could attach someone else's records to this login
+                        _needs_review(review, counts, profile, 'name match without a second identifier', matches)
+                        continue
+                reg_num = user.username[:20]
+                if candidate is not None and candidate.pk not in claimed:
+                    claimed.add(candidate.pk)
+                    candidate.user_id = profile.pk
+                    patients[profile.pk] = candidate
+                    linked.append(candidate)
+                elif not (profile.date_of_birth and profile.gender):
+                    counts['unmatched'] += 1
+                elif reg_num in taken_reg_nums:
+                    _needs_review(review, counts, profile, 'registration number already taken')
+                else:
+                    taken_reg_nums.add(reg_num)
+                    created.append(Patient(
+                        user_id=profile.pk, reg_num=reg_num,
+                        first_name=user.first_name, last_name=user.last_name,
+                        gender=GENDER_NAMES.get(profile.gender, profile.gender),
+                        date_of_birth=profile.date_of_birth, contact_number=profile.contact_number,
+                        email=user.email or None,
+                    ))
+
+            changed_patients, changed_profiles = [], []
+            for profile in profiles:
+                patient = patients.get(profile.pk)
+                if patient is None:
+                    continue
+                if _fill_blanks(patient, profile, [('contact_number', 'contact_number')]):
+                    changed_patients.append(patient)
+                if _fill_blanks(profile, patient, [
+                    ('date_of_birth', 'date_of_birth'), ('gender', 'gender'), ('contact_number', 'contact_number'),
+                ]):
+                    changed_profiles.append(profile)
+
+            Patient.objects.bulk_update(linked, ['user'])
+            Patient.objects.bulk_create(created)
+            Patient.objects.bulk_update(changed_patients, ['contact_number'])
+            PatientProfile.objects.bulk_update(changed_profiles, ['date_of_birth', 'gender', 'contact_number'])
+            counts['linked'] += len(linked)
+            counts['created'] += len(created)
+            counts['updated'] += len(changed_patients) + len(changed_profiles)
+    return counts
+
+
+def merge_receptionist_identities(apps, batch_size=500):
+    """
+    Make sure every receptionist_app.Receptionist has an hms.Receptionist for
+    the same user, creating or filling it in from the old row and the user.
+    """
+    AppReceptionist = apps.get_model('receptionist_app', 'Receptionist')
+    Receptionist = apps.get_model('hms', 'Receptionist')
+    counts = {'created': 0, 'updated': 0}
+
+    for old_rows in _batches(AppReceptionist.objects.select_related('user'), batch_size):
+        with transaction.atomic():
+            existing = {
+                receptionist.user_id: receptionist
+                for receptionist in Receptionist.objects.filter(user_id__in=[row.user_id for row in old_rows])
+            }
+            created, changed = [], []
+            for row in old_rows:
+                receptionist = existing.get(row.user_id)
+                if receptionist is None:
+                    created.append(Receptionist(
+                        user_id=row.user_id, first_name=row.user.first_name, last_name=row.user.last_name,
+                        email=row.user.email or None, contact_number=row.contact_number, address=row.address,
+                        date_of_birth=row.date_of_birth, is_active=row.is_active,
+                    ))
+                elif _fill_blanks(receptionist, row, [
+                    ('contact_number', 'contact_number'), ('address', 'address'), ('date_of_birth', 'date_of_birth'),
+                ]):
+                    changed.append(receptionist)
+            Receptionist.objects.bulk_create(created)
+            Receptionist.objects.bulk_update(changed, ['contact_number', 'address', 'date_of_birth'])
+            counts['created'] += len(created)
+            counts['updated'] += len(changed)
+    return counts
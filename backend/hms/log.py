@@ -0,0 +1,211 @@
+"""
+Structured logging: JSON output, request-id correlation, sampling of noisy
+call sites and non-blocking handlers.
+
+settings.LOGGING_CONFIG points Django at configure(), which applies
+settings.LOGGING and then moves every handler behind a QueueHandler, so the
+logging call in a request thread only puts the record on a queue and a
+QueueListener thread does the formatting and I/O. Handler filters (such as
+SamplingFilter) are moved onto the QueueHandler, so dropped records are
+never queued. RequestIdMiddleware stores the request id in a context
+variable and the record factory copies it onto every record logged while
+the request is handled.
+
+Log records should not carry request bodies, headers, cookies or other
+patient details; log ids and field names instead.
+"""
+import atexit
+import json
+import logging
+import logging.config
+import queue
+import re
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from django.conf import settings
+
+request_id_var = ContextVar('request_id', default=None)
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+# Client supplied ids are echoed into logs and responses, so keep them tame
+VALID_REQUEST_ID = re.compile(r'^[A-Za-z0-9._:-]{1,64}$')
+
+# Attributes every LogRecord has; anything else was passed with extra={...}
+RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {
+    'message', 'asctime', 'request_id', 'taskName',
+}
+
+_listeners = []
+_factory_installed = False
+
+
+def get_request_id():
+    return request_id_var.get()
+
+
+def _record_request_id(record):
+    # django.request logs after the middleware has returned, but passes the request along
+    request_id = getattr(record, 'request_id', None)
+    if request_id is None:
+        request_id = getattr(getattr(record, 'request', None), 'request_id', None)
+    return request_id
+
+
+class RequestIdMiddleware:
+    """
+    Tag each request with an id for log correlation.
+
+    Uses the incoming X-Request-ID header when it looks sane (so ids from a
+    proxy or the frontend carry through), otherwise generates one, and
+    returns it in the response's X-Request-ID header. Should come first in
+    MIDDLEWARE so everything logged while handling the request carries it.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        incoming = request.headers.get(REQUEST_ID_HEADER, '')
+        request.request_id = incoming if VALID_REQUEST_ID.match(incoming) else uuid.uuid4().hex
+        token = request_id_var.set(request.request_id)
+        try:
+            response = self.get_response(request)
+        finally:
+            request_id_var.reset(token)
+        response[REQUEST_ID_HEADER] = request.request_id
+        return response
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, including any extra={...} fields."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': _record_request_id(record),
+        }
+        entry.update(
+            (key, value) for key, value in vars(record).items()
+            if key not in RECORD_ATTRIBUTES and not key.startswith('_')
+        )
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc_info'] = record.exc_text
+        if record.stack_info:
+            entry['stack_info'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Rate-limit records per call site.
+
+    Each (logger, message template) pair may log ``rate`` records per second
+    with bursts of up to ``burst``; further records are dropped and the next
+    one let through carries a ``suppressed`` count. Records at ``level`` or
+    above are never dropped, so warnings and errors always get through.
+    A rate of 0 disables sampling.
+    """
+
+    # Forget call sites beyond this many, so formatted messages can't grow the table forever
+    MAX_KEYS = 10000
+
+    def __init__(self, rate=10, burst=None, level='WARNING'):
+        super().__init__()
+        self.rate = float(rate)
+        self.burst = float(burst or max(self.rate, 1))
+        self.level = logging.getLevelName(level) if isinstance(level, str) else level
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if self.rate <= 0 or record.levelno >= self.level:
+            return True
+        key = (record.name, record.msg if isinstance(record.msg, str) else type(record.msg))
+        now = time.monotonic()
+        with self.lock:
+            if len(self.buckets) >= self.MAX_KEYS and key not in self.buckets:
+                self.buckets.clear()
+            tokens, updated, suppressed = self.buckets.get(key, (self.burst, now, 0))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens < 1:
+                self.buckets[key] = (tokens, now, suppressed + 1)
+                return False
+            self.buckets[key] = (tokens - 1, now, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class NonBlockingHandler(QueueHandler):
+    """QueueHandler that keeps exception details intact for the formatter on the other side."""
+
+    def prepare(self, record):
+        # Resolve everything that can't cross threads (or is expensive to
+        # keep alive), but leave the formatting to the target handler
+        record = logging.makeLogRecord(vars(record))
+        record.request_id = _record_request_id(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _record_factory(factory):
+    def make_record(*args, **kwargs):
+        record = factory(*args, **kwargs)
+        record.request_id = request_id_var.get()
+        return record
+    return make_record
+
+
+def configure(config):
+    """LOGGING_CONFIG callable: dictConfig, then put every handler behind a queue."""
+    global _factory_installed
+    logging.config.dictConfig(config)
+    if not _factory_installed:
+        logging.setLogRecordFactory(_record_factory(logging.getLogRecordFactory()))
+        _factory_installed = True
+    if settings.LOGGING_ASYNC:
+        _use_queues([logging.getLogger()] + [logging.getLogger(name) for name in config.get('loggers', {})])
+
+
+def _use_queues(loggers):
+    stop_listeners()
+    queued = {}
+    for logger in loggers:
+        for index, handler in enumerate(logger.handlers):
+            if isinstance(handler, QueueHandler):
+                continue
+            if handler not in queued:
+                # One listener thread per target handler, so each record still
+                # reaches exactly the handlers its logger was configured with
+                records = queue.SimpleQueue()
+                queue_handler = NonBlockingHandler(records)
+                queue_handler.setLevel(handler.level)
+                queue_handler.filters, handler.filters = handler.filters, []
+                listener = QueueListener(records, handler, respect_handler_level=True)
+                listener.start()
+                _listeners.append(listener)
+                queued[handler] = queue_handler
+            logger.handlers[index] = queued[handler]
+
+
+def stop_listeners():
+    """Flush queued records and stop the listener threads."""
+    while _listeners:
+        _listeners.pop().stop()
+
+
+atexit.register(stop_listeners)
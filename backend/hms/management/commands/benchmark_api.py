@@ -0,0 +1,73 @@
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from hms.metrics import percentile
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures the latency of an API endpoint on a running server. Start the server with "
+        "each connection setting in turn and compare the runs, e.g. DB_CONN_MAX_AGE=0 (a new "
+        "connection per request), the default connection reuse, and DB_POOL=True."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='/api/doctors/', help='Endpoint to request (default: /api/doctors/).')
+        parser.add_argument(
+            '--base-url', default='http://127.0.0.1:8000', help='Server to benchmark (default: http://127.0.0.1:8000).'
+        )
+        parser.add_argument('--requests', type=int, default=500, help='Measured requests (default: 500).')
+        parser.add_argument('--concurrency', type=int, default=4, help='Requests in flight at once (default: 4).')
+        parser.add_argument(
+            '--warmup', type=int, default=20,
+            help='Unmeasured requests sent first, so caches and connections are warm (default: 20).',
+        )
+        parser.add_argument(
+            '--header', action='append', default=[], metavar='NAME:VALUE',
+            help='Extra request header, e.g. a session cookie. May be repeated.',
+        )
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests and --concurrency must be at least 1.')
+        url = options['base_url'].rstrip('/') + options['path']
+        headers = dict(header.split(':', 1) for header in options['header'])
+        headers = {name.strip(): value.strip() for name, value in headers.items()}
+
+        def fetch(_):
+            request = urllib.request.Request(url, headers=headers)
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=30) as response:
+                    response.read()
+                    ok = response.status < 400
+            except (urllib.error.URLError, OSError):
+                ok = False
+            return time.perf_counter() - start, ok
+
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            warmup = list(executor.map(fetch, range(options['warmup'])))
+            if warmup and not any(ok for _, ok in warmup):
+                raise CommandError(f'No successful responses from {url}; is the server running?')
+            started = time.perf_counter()
+            results = list(executor.map(fetch, range(options['requests'])))
+            elapsed = time.perf_counter() - started
+
+        durations = sorted(duration for duration, ok in results if ok)
+        errors = len(results) - len(durations)
+        if not durations:
+            raise CommandError(f'All {errors} requests to {url} failed.')
+
+        self.stdout.write(f"{url}: {len(results)} requests, concurrency {options['concurrency']}")
+        self.stdout.write(f"  throughput  {len(results) / elapsed:8.1f} req/s")
+        self.stdout.write(f"  mean        {statistics.mean(durations) * 1000:8.2f} ms")
+        for quantile in (50, 95, 99):
+            self.stdout.write(f"  p{quantile:<10} {percentile(durations, quantile) * 1000:8.2f} ms")
+        self.stdout.write(f"  max         {durations[-1] * 1000:8.2f} ms")
+        if errors:
+            self.stdout.write(self.style.WARNING(f'  {errors} requests failed'))
@@ -0,0 +1,117 @@
+import json
+from datetime import datetime, time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from hms.models import Doctor, LabTestOrder, Patient
+from patient_app.models import Appointment, MedicalRecord, PatientLabTestOrder, PatientProfile
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs EXPLAIN on the canonical query of each list ViewSet and flags "
+        "sequential scans that the planner expects to read more than --threshold rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threshold',
+            type=int,
+            default=1000,
+            help='Flag sequential scans estimated to read more than this many rows (default: 1000).',
+        )
+        parser.add_argument(
+            '--page-size',
+            type=int,
+            default=50,
+            help='LIMIT applied to the list queries, matching the API page size (default: 50).',
+        )
+        parser.add_argument(
+            '--fail-on-seqscan',
+            action='store_true',
+            help='Exit with an error if any query is flagged. Useful in CI.',
+        )
+
+    def get_canonical_queries(self, page_size):
+        """Return (label, queryset) pairs mirroring what the ViewSets run for a list page."""
+        doctor_id = Doctor.objects.values_list('pk', flat=True).first() or 0
+        profile_id = PatientProfile.objects.values_list('pk', flat=True).first() or 0
+        day_start = timezone.make_aware(datetime.combine(timezone.localdate() + timedelta(days=1), time.min))
+
+        return [
+            ('appointments (doctor)',
+             Appointment.objects.filter(doctor_id=doctor_id).with_related()
+             .order_by('-appointment_datetime', '-id')[:page_size]),
+            ('appointments (patient)',
+             Appointment.objects.filter(patient_id=profile_id).with_related()
+             .order_by('-appointment_datetime', '-id')[:page_size]),
+            ('appointments (reminders)',
+             Appointment.objects.filter(
+                 status='SCHEDULED',
+                 appointment_datetime__gte=day_start,
+                 appointment_datetime__lt=day_start + timedelta(days=1),
+             ).with_related()),
+            ('medical-records (doctor)',
+             MedicalRecord.objects.filter(doctor_id=doctor_id).order_by('-created_at', '-id')[:page_size]),
+            ('medical-records (patient)',
+             MedicalRecord.objects.filter(patient_id=profile_id).order_by('-created_at', '-id')[:page_size]),
+            ('patient-lab-tests (doctor)',
+             PatientLabTestOrder.objects.filter(ordered_by_doctor_id=doctor_id)
+             .order_by('-order_datetime', '-id')[:page_size]),
+            ('patient-lab-tests (patient)',
+             PatientLabTestOrder.objects.filter(patient_id=profile_id)
+             .order_by('-order_datetime', '-id')[:page_size]),
+            ('lab-tests',
+             LabTestOrder.objects.select_related('doctor', 'patient').order_by('-requested_at', '-id')[:page_size]),
+            ('hms-patients',
+             Patient.objects.order_by('-registration_date', '-patient_id')[:page_size]),
+        ]
+
+    def find_seq_scans(self, plan, threshold):
+        """Walk a PostgreSQL JSON plan and return (relation, estimated rows) for large Seq Scans."""
+        flagged = []
+        if plan.get('Node Type') == 'Seq Scan' and plan.get('Plan Rows', 0) > threshold:
+            flagged.append((plan.get('Relation Name'), plan.get('Plan Rows')))
+        for child in plan.get('Plans', []):
+            flagged.extend(self.find_seq_scans(child, threshold))
+        return flagged
+
+    def handle(self, *args, **options):
+        threshold = options['threshold']
+        is_postgres = connection.vendor == 'postgresql'
+        if not is_postgres:
+            self.stdout.write(self.style.WARNING(
+                f"Row estimates are only available on PostgreSQL; printing raw {connection.vendor} plans."
+            ))
+
+        flagged_queries = 0
+        for label, queryset in self.get_canonical_queries(options['page_size']):
+            self.stdout.write(self.style.MIGRATE_HEADING(label))
+            if is_postgres:
+                explained = json.loads(queryset.explain(format='json'))
+                # Depending on the driver the plan comes back wrapped in a list
+                if isinstance(explained, list):
+                    explained = explained[0]
+                plan = explained['Plan']
+                seq_scans = self.find_seq_scans(plan, threshold)
+                if seq_scans:
+                    flagged_queries += 1
+                    for relation, rows in seq_scans:
+                        self.stdout.write(self.style.ERROR(f"  Seq Scan on {relation} (~{rows} rows)"))
+                else:
+                    self.stdout.write(self.style.SUCCESS(
+                        f"  OK: {plan.get('Node Type')} (cost {plan.get('Total Cost')})"
+                    ))
+            else:
+                for line in queryset.explain().splitlines():
+                    self.stdout.write(f"  {line}")
+
+        if flagged_queries:
+            message = f"{flagged_queries} query(ies) fall back to sequential scans above {threshold} rows."
+            if options['fail_on_seqscan']:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(message))
+        elif is_postgres:
+            self.stdout.write(self.style.SUCCESS("No large sequential scans found."))
@@ -0,0 +1,94 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from hms.partitioning import (
+    DEFAULT_SUFFIX, PARTITION_KEYS, apply_statements, create_partition_sql, default_partition_rows,
+    detach_partition_sql, existing_partitions, is_partitioned, partition_name, partition_references,
+    partitioned_models, plan_partitions,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Creates the monthly partitions of the appointment and audit log tables for the coming months '
+        'and detaches partitions past the retention period that no other rows reference. '
+        'Run daily or monthly; safe to re-run.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ahead', type=int, default=settings.PARTITION_MONTHS_AHEAD,
+            help='Months after the current one to create partitions for (default: PARTITION_MONTHS_AHEAD).',
+        )
+        parser.add_argument(
+            '--retain', type=int, default=settings.PARTITION_RETENTION_MONTHS,
+            help='Months to keep attached, including the current one; 0 keeps all (default: PARTITION_RETENTION_MONTHS).',
+        )
+        parser.add_argument(
+            '--archive-schema', default=settings.PARTITION_ARCHIVE_SCHEMA,
+            help='Schema that detached partitions are moved to (default: PARTITION_ARCHIVE_SCHEMA).',
+        )
+        parser.add_argument(
+            '--drop', action='store_true',
+            help='Drop detached partitions instead of moving them to the archive schema.',
+        )
+        parser.add_argument(
+            '--model', action='append', choices=sorted(PARTITION_KEYS), dest='models',
+            help='Only manage this model (repeatable; default: all partitioned models).',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Print the SQL without running it.')
+        parser.add_argument('--database', default='default', help='Database alias (default: default).')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor != 'postgresql':
+            raise CommandError('Table partitioning needs PostgreSQL.')
+
+        today = timezone.now()
+        models = [
+            model for model in partitioned_models()
+            if not options['models'] or model._meta.label in options['models']
+        ]
+        for model in models:
+            label = model._meta.label
+            if not is_partitioned(connection, model):
+                self.stderr.write(self.style.WARNING(f'{label}: table is not partitioned; run migrate first.'))
+                continue
+
+            create, detach = plan_partitions(
+                existing_partitions(connection, model), today, max(options['ahead'], 0), max(options['retain'], 0)
+            )
+            for month in create:
+                self.apply(connection, options['dry_run'], create_partition_sql(model, month))
+                self.stdout.write(f'{label}: created {partition_name(model, month)}')
+            for month in detach:
+                references = partition_references(connection, model, month)
+                if references:
+                    self.stderr.write(self.style.WARNING(
+                        f'{label}: kept {partition_name(model, month)}: rows in {", ".join(references)} still '
+                        f'point at it; archive or delete them first.'
+                    ))
+                    continue
+                self.apply(connection, options['dry_run'], detach_partition_sql(
+                    model, month, archive_schema=options['archive_schema'], drop=options['drop']
+                ))
+                self.stdout.write(f'{label}: detached {partition_name(model, month)}')
+
+            stray = default_partition_rows(connection, model)
+            if stray:
+                # Moved into their month's partition when it is created
+                self.stderr.write(self.style.WARNING(
+                    f'{label}: {stray} rows in {model._meta.db_table}{DEFAULT_SUFFIX} fall outside the monthly '
+                    f'partitions; raise --ahead if they are future bookings.'
+                ))
+
+        self.stdout.write(self.style.SUCCESS('Dry run complete.' if options['dry_run'] else 'Partitions up to date.'))
+
+    def apply(self, connection, dry_run, statements):
+        if dry_run:
+            for sql in statements:
+                self.stdout.write(f'{sql};')
+        else:
+            apply_statements(connection, statements)
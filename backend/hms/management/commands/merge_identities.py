@@ -0,0 +1,42 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from admin_app.statistics import refresh_statistics
+from hms.identity import merge_patient_identities, merge_receptionist_identities
+from hms.search import reindex_patients
+
+
+class Command(BaseCommand):
+    help = (
+        'Links PatientProfile and receptionist_app.Receptionist rows to their canonical '
+        'hms.Patient and hms.Receptionist rows, in batches. Safe to re-run.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows merged per transaction')
+
+    def handle(self, *args, **options):
+        review = []
+        patients = merge_patient_identities(apps, batch_size=options['batch_size'], review=review)
+        receptionists = merge_receptionist_identities(apps, batch_size=options['batch_size'])
+        if patients['created']:
+            # bulk_create skips the signals that keep the patient counter current
+            refresh_statistics()
+        if patients['linked'] or patients['created']:
+            # Linked and created rows were written in bulk, without their search text
+            reindex_patients()
+
+        self.stdout.write(
+            f"Patients: {patients['linked']} linked, {patients['created']} created, "
+            f"{patients['updated']} updated, {patients['unmatched']} without a match, "
+            f"{patients['review']} to review."
+        )
+        for entry in review:
+            self.stdout.write(self.style.WARNING(
+                f"Review user {entry['username']} (id {entry['user_id']}): {entry['reason']}"
+                + (f"; candidate patients {entry['patient_ids']}" if entry['patient_ids'] else '')
+            ))
+        self.stdout.write(
+            f"Receptionists: {receptionists['created']} created, {receptionists['updated']} updated."
+        )
+        self.stdout.write(self.style.SUCCESS("Identity merge complete."))
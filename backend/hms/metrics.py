@@ -0,0 +1,239 @@
+"""
+In-process request metrics, rendered in the Prometheus text format at
+/api/metrics/.
+
+PerformanceMiddleware (hms.middleware) feeds one observation per request into
+the histograms below, labelled by view (e.g. ``DoctorProfileViewSet.list``)
+and HTTP method, and keeps a window of recent durations per view for the
+p50/p95/p99 figures in /api/diagnostics/. The db_pool_* metrics are read from
+the psycopg connection pool at scrape time when settings.DB_POOL is on.
+Metrics live in the memory of each server process, so with several workers
+every scrape sees the process that served it; scrape each worker (or run one
+per container) for a complete picture.
+"""
+import math
+import threading
+from collections import defaultdict, deque
+
+from django.conf import settings
+from django.db import connections
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def percentile(ordered, quantile):
+    """Nearest-rank percentile of an already sorted, non-empty sequence."""
+    return ordered[max(math.ceil(quantile / 100 * len(ordered)) - 1, 0)]
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = defaultdict(int)
+        self.lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] += amount
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, labels, (), value) for labels, value in sorted(self.values.items())]
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=SECONDS_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) + (math.inf,)
+        # labels -> [per-bucket counts..., sum, count]
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self.lock:
+            series = self.values.get(labels)
+            if series is None:
+                series = self.values[labels] = [0] * len(self.buckets) + [0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self):
+        with self.lock:
+            values = sorted((labels, list(series)) for labels, series in self.values.items())
+        samples = []
+        for labels, series in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                samples.append((f'{self.name}_bucket', labels, (('le', _format_value(bound)),), cumulative))
+            samples.append((f'{self.name}_sum', labels, (), series[-2]))
+            samples.append((f'{self.name}_count', labels, (), series[-1]))
+        return samples
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+
+
+class CallbackMetric:
+    """A metric read at scrape time: callback returns (label values, value) pairs."""
+
+    def __init__(self, name, documentation, type, labelnames, callback):
+        self.name = name
+        self.documentation = documentation
+        self.type = type
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+
+    def samples(self):
+        return [(self.name, labels, (), value) for labels, value in self.callback()]
+
+    def clear(self):
+        pass
+
+
+class LatencyWindow:
+    """The last settings.PERF_LATENCY_WINDOW request durations per view, for percentiles."""
+
+    def __init__(self):
+        self.windows = {}
+        self.lock = threading.Lock()
+
+    def add(self, view, seconds):
+        with self.lock:
+            window = self.windows.get(view)
+            if window is None:
+                window = self.windows[view] = deque(maxlen=settings.PERF_LATENCY_WINDOW)
+            window.append(seconds)
+
+    def percentiles(self, quantiles=(50, 95, 99)):
+        with self.lock:
+            windows = {view: sorted(window) for view, window in self.windows.items()}
+        summary = {}
+        for view, durations in sorted(windows.items()):
+            summary[view] = {'count': len(durations)}
+            for quantile in quantiles:
+                summary[view][f'p{quantile}_ms'] = round(percentile(durations, quantile) * 1000, 1)
+        return summary
+
+    def clear(self):
+        with self.lock:
+            self.windows.clear()
+
+
+LABELS = ('view', 'method')
+
+requests_total = Counter('http_requests_total', 'Requests handled, by view, method and status.', LABELS + ('status',))
+request_duration = Histogram('http_request_duration_seconds', 'Wall time spent handling a request.', LABELS)
+db_queries = Histogram('http_request_db_queries', 'Database queries run per request.', LABELS, QUERY_COUNT_BUCKETS)
+db_duration = Histogram('http_request_db_duration_seconds', 'Time spent in database queries per request.', LABELS)
+serializer_duration = Histogram(
+    'http_request_serializer_duration_seconds', 'Time spent serializing and rendering response data.', LABELS
+)
+response_size = Histogram('http_response_size_bytes', 'Response body size.', LABELS, SIZE_BUCKETS)
+
+
+def _pool_samples(*keys):
+    """(alias, key) -> value for every database alias that has a connection pool."""
+    from .health import pool_status
+
+    samples = {}
+    for alias in connections:
+        status = pool_status(alias)
+        if status is not None:
+            samples.update(((alias, key), status[key]) for key in keys)
+    return samples
+
+
+def _pool_stat(key, scale=1):
+    return lambda: [((alias,), value * scale) for (alias, _), value in _pool_samples(key).items()]
+
+
+def _pool_connections():
+    return [
+        ((alias, 'in_use' if key == 'in_use' else 'idle'), value)
+        for (alias, key), value in _pool_samples('in_use', 'available').items()
+    ]
+
+
+db_pool_connections = CallbackMetric(
+    'db_pool_connections', 'Pooled database connections, in use or idle.', 'gauge', ('alias', 'state'),
+    _pool_connections,
+)
+db_pool_max_size = CallbackMetric(
+    'db_pool_max_size', 'Largest size the pool may grow to.', 'gauge', ('alias',), _pool_stat('max_size')
+)
+db_pool_waiting = CallbackMetric(
+    'db_pool_requests_waiting', 'Requests waiting for a pooled connection.', 'gauge', ('alias',),
+    _pool_stat('waiting'),
+)
+db_pool_requests = CallbackMetric(
+    'db_pool_requests_total', 'Connections requested from the pool.', 'counter', ('alias',), _pool_stat('requests')
+)
+db_pool_timeouts = CallbackMetric(
+    'db_pool_timeouts_total', 'Requests that gave up waiting for a pooled connection.', 'counter', ('alias',),
+    _pool_stat('timeouts'),
+)
+db_pool_wait = CallbackMetric(
+    'db_pool_wait_seconds_total', 'Time requests spent waiting for a pooled connection.', 'counter', ('alias',),
+    _pool_stat('wait_ms', scale=0.001),
+)
+
+METRICS = (
+    requests_total, request_duration, db_queries, db_duration, serializer_duration, response_size,
+    db_pool_connections, db_pool_max_size, db_pool_waiting, db_pool_requests, db_pool_timeouts, db_pool_wait,
+)
+
+latency = LatencyWindow()
+
+
+def render():
+    """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    for metric in METRICS:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.type}')
+        for name, labels, extra, value in metric.samples():
+            lines.append(f'{name}{_format_labels(metric.labelnames, labels, extra)} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    for metric in METRICS:
+        metric.clear()
+    latency.clear()
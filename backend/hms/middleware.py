@@ -0,0 +1,201 @@
+import heapq
+import itertools
+import logging
+import time
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# The RequestProfile of the request being handled, if PerformanceMiddleware is on
+current_profile = ContextVar('current_profile', default=None)
+
+REFRESHED_AT_KEY = '_refreshed_at'
+
+
+class SessionRefreshMiddleware:
+    """
+    Keep authenticated sessions alive without saving them on every request.
+
+    With SESSION_SAVE_EVERY_REQUEST off, a session is only written when its
+    data changes, so its expiry would no longer slide with activity. This
+    middleware touches the session at most once per SESSION_REFRESH_INTERVAL
+    seconds, which renews the expiry while plain reads write nothing.
+    Must come after SessionMiddleware and AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        interval = settings.SESSION_REFRESH_INTERVAL
+        user = getattr(request, 'user', None)
+        # Only renew sessions the client already has; clients authenticating
+        # per request (e.g. basic auth) should not get a session created
+        if (interval and not settings.SESSION_SAVE_EVERY_REQUEST and user is not None
+                and user.is_authenticated and request.session.session_key):
+            now = int(time.time())
+            if now - request.session.get(REFRESHED_AT_KEY, 0) >= interval:
+                request.session[REFRESHED_AT_KEY] = now
+        return response
+
+
+class RequestProfile:
+    """Database and serializer timings collected while one request is handled."""
+
+    def __init__(self, top_queries):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+        self.top_queries = top_queries
+        self.slowest = []
+        self.sequence = itertools.count()
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.queries += 1
+            self.db_time += duration
+            entry = (duration, next(self.sequence), sql)
+            if len(self.slowest) < self.top_queries:
+                heapq.heappush(self.slowest, entry)
+            elif self.slowest and duration > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, entry)
+
+    def slowest_queries(self):
+        return [
+            {'duration_ms': round(duration * 1000, 2), 'sql': sql[:1000]}
+            for duration, _, sql in sorted(self.slowest, reverse=True)
+        ]
+
+
+def instrument_serializers():
+    """
+    Time DRF serializer .data so PerformanceMiddleware can report serializer time.
+
+    Serializer.data and ListSerializer.data both go through BaseSerializer.data,
+    which runs to_representation once per top-level serializer; serializers
+    built inside another one (e.g. in a SerializerMethodField) are counted as
+    part of the outer one.
+    """
+    from rest_framework.serializers import BaseSerializer
+
+    original = BaseSerializer.data.fget
+    if getattr(original, 'instrumented', False):
+        return
+
+    def data(self):
+        profile = current_profile.get()
+        if profile is None or profile.serializer_depth:
+            return original(self)
+        profile.serializer_depth += 1
+        start = time.perf_counter()
+        try:
+            return original(self)
+        finally:
+            profile.serializer_depth -= 1
+            profile.serializer_time += time.perf_counter() - start
+
+    data.instrumented = True
+    BaseSerializer.data = property(data)
+
+
+def view_label(request):
+    """'DoctorViewSet.list' for ViewSet actions, the view's name otherwise."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    func = match.func
+    actions = getattr(func, 'actions', None)
+    if actions and request.method.lower() in actions:
+        return f"{func.cls.__name__}.{actions[request.method.lower()]}"
+    view_class = getattr(func, 'cls', None) or getattr(func, 'view_class', None)
+    return view_class.__name__ if view_class else getattr(func, '__name__', match.view_name)
+
+
+class PerformanceMiddleware:
+    """
+    Record wall time, query count, database time, serializer time and response
+    size per view into hms.metrics, and log requests slower than
+    PERF_SLOW_REQUEST_MS together with their slowest queries.
+
+    Queries are timed with connection.execute_wrapper on every database
+    alias; serializer time covers building serializer.data plus rendering
+    the response. Should come right after RequestIdMiddleware.
+    """
+
+    def __init__(self, get_response):
+        if not settings.PERF_METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        instrument_serializers()
+
+    def __call__(self, request):
+        profile = RequestProfile(settings.PERF_SLOW_REQUEST_TOP_QUERIES)
+        token = current_profile.set(profile)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile))
+                response = self.get_response(request)
+        finally:
+            current_profile.reset(token)
+        elapsed = time.perf_counter() - start
+        self.record(request, response, profile, elapsed)
+        return response
+
+    def process_template_response(self, request, response):
+        # Called right before DRF renders the response; time the rendering as serialization
+        profile = current_profile.get()
+        if profile is not None:
+            start = time.perf_counter()
+
+            def rendered(response):
+                profile.serializer_time += time.perf_counter() - start
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def record(self, request, response, profile, elapsed):
+        view = view_label(request)
+        labels = (view, request.method)
+        if response.streaming:
+            size = int(response.get('Content-Length') or 0)
+        else:
+            size = len(response.content)
+        metrics.requests_total.inc(*labels, str(response.status_code))
+        metrics.request_duration.observe(elapsed, *labels)
+        metrics.db_queries.observe(profile.queries, *labels)
+        metrics.db_duration.observe(profile.db_time, *labels)
+        metrics.serializer_duration.observe(profile.serializer_time, *labels)
+        metrics.response_size.observe(size, *labels)
+        metrics.latency.add(view, elapsed)
+
+        if elapsed * 1000 >= settings.PERF_SLOW_REQUEST_MS:
+            logger.warning(
+                "Slow request: %s %s took %.0f ms", request.method, view, elapsed * 1000,
+                extra={
+                    'view': view,
+                    'path': request.path,
+                    'status_code': response.status_code,
+                    'duration_ms': round(elapsed * 1000, 1),
+                    'db_queries': profile.queries,
+                    'db_ms': round(profile.db_time * 1000, 1),
+                    'serializer_ms': round(profile.serializer_time * 1000, 1),
+                    'response_bytes': size,
+                    'top_queries': profile.slowest_queries(),
+                },
+            )
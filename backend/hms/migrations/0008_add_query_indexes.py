@@ -0,0 +1,42 @@
+# Generated by Django 5.2.1 on 2026-10-17 10:00
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction, but it does not
+    # block writes to the tables while the indexes are built
+    atomic = False
+
+    dependencies = [
+        ('hms', '0007_receptionist_already_exists'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='appointment',
+            index=models.Index(fields=['doctor', 'appointment_date'], name='hms_appt_doctor_date_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='appointment',
+            index=models.Index(fields=['patient', 'appointment_date'], name='hms_appt_patient_date_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='billing',
+            index=models.Index(fields=['bill_date'], name='billing_date_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='labtestorder',
+            index=models.Index(fields=['requested_at'], name='labtest_requested_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='labtestorder',
+            index=models.Index(fields=['doctor', 'requested_at'], name='labtest_doctor_requested_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='patient',
+            index=models.Index(fields=['registration_date'], name='patient_registered_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.1 on 2026-10-17 10:00
+
+from django.db import migrations
+
+from hms.identity import merge_patient_identities, merge_receptionist_identities
+
+
+def merge_identities(apps, schema_editor):
+    merge_patient_identities(apps)
+    merge_receptionist_identities(apps)
+
+
+class Migration(migrations.Migration):
+
+    # The merge commits one batch at a time instead of holding locks on the
+    # patient and receptionist tables for the whole migration
+    atomic = False
+
+    dependencies = [
+        ('hms', '0009_patient_user'),
+        ('patient_app', '0009_reminderdelivery'),
+        ('receptionist_app', '0002_receptionist'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_identities, migrations.RunPython.noop),
+    ]
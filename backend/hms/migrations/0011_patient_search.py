@@ -0,0 +1,70 @@
+# Generated by Django 5.2.1 on 2026-10-17 10:00
+
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.operations import TrigramExtension
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models
+
+from hms.search import build_search_text
+
+BATCH_SIZE = 1000
+
+
+def search_indexes():
+    return [
+        GinIndex(OpClass('search_text', name='gin_trgm_ops'), name='patient_search_trgm_idx'),
+        GinIndex(SearchVector('search_text', config='simple'), name='patient_search_fts_idx'),
+    ]
+
+
+def fill_search_text(apps, schema_editor):
+    Patient = apps.get_model('hms', 'Patient')
+    queryset = Patient.objects.using(schema_editor.connection.alias).select_related('user').order_by('pk')
+    last_pk = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk)[:BATCH_SIZE])
+        if not batch:
+            break
+        for patient in batch:
+            patient.search_text = build_search_text(patient, patient.user)
+        Patient.objects.using(schema_editor.connection.alias).bulk_update(batch, ['search_text'])
+        last_pk = batch[-1].pk
+
+
+def add_search_indexes(apps, schema_editor):
+    # GIN indexes only exist on PostgreSQL; other databases search in process (hms.search)
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Patient = apps.get_model('hms', 'Patient')
+    for index in search_indexes():
+        schema_editor.add_index(Patient, index, concurrently=True)
+
+
+def remove_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Patient = apps.get_model('hms', 'Patient')
+    for index in search_indexes():
+        schema_editor.remove_index(Patient, index, concurrently=True)
+
+
+class Migration(migrations.Migration):
+
+    # The backfill commits one batch at a time, and CREATE INDEX CONCURRENTLY
+    # cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('hms', '0010_merge_identities'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='patient',
+            name='search_text',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(fill_search_text, migrations.RunPython.noop),
+        migrations.RunPython(add_search_indexes, remove_search_indexes),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.1 on 2026-10-17 10:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+from hms.partitioning import partition_table, unpartition_table
+
+PARTITIONED = [('hms', 'Appointment'), ('auditlog', 'LogEntry')]
+
+
+def partition(apps, schema_editor):
+    for app_label, model_name in PARTITIONED:
+        partition_table(schema_editor, apps.get_model(app_label, model_name), settings.PARTITION_MONTHS_AHEAD)
+
+
+def unpartition(apps, schema_editor):
+    for app_label, model_name in PARTITIONED:
+        unpartition_table(schema_editor, apps.get_model(app_label, model_name))
+
+
+class Migration(migrations.Migration):
+
+    # Rewrites the appointment and audit log tables on PostgreSQL, holding
+    # an exclusive lock on them until the migration commits
+
+    dependencies = [
+        ('auditlog', '0017_add_actor_email'),
+        ('hms', '0011_patient_search'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='billing',
+            name='appointment',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='bills', to='hms.appointment', verbose_name='Appointment'),
+        ),
+        migrations.RunPython(partition, unpartition),
+    ]
@@ -3,6 +3,22 @@ from django.core.validators import validate_email
 from django.core.exceptions import ValidationError
 from django.contrib.auth.models import User
 
+from .partitioning import PartitionedQuerySet
+
+class PatientQuerySet(models.QuerySet):
+    def seen_by(self, doctor):
+        """
+        Patients with an appointment with the doctor in either appointment table.
+        patient_app appointments reference PatientProfile, whose primary key is
+        the user id, so they are matched through the indexed Patient.user link
+        without joining PatientProfile.
+        """
+        from patient_app.models import Appointment as PatientAppointment
+        return self.filter(
+            models.Q(pk__in=Appointment.objects.filter(doctor=doctor).values('patient_id'))
+            | models.Q(user_id__in=PatientAppointment.objects.filter(doctor=doctor).values('patient_id'))
+        )
+
 class Patient(models.Model):
     GENDER_CHOICES = [
         ('Male', 'Male'),
@@ -11,6 +27,11 @@ class Patient(models.Model):
     ]
     
     patient_id = models.AutoField(primary_key=True)
+    # Login account of the patient. This is the canonical patient row; the
+    # PatientProfile of the same user (pk == user_id) holds portal-only data.
+    user = models.OneToOneField(
+        User, on_delete=models.SET_NULL, related_name='hms_patient', null=True, blank=True
+    )
     reg_num = models.CharField(max_length=20, unique=True, verbose_name="Registration Number")
     first_name = models.CharField(max_length=100, verbose_name="First Name")
     last_name = models.CharField(max_length=100, verbose_name="Last Name")
@@ -23,6 +44,10 @@ class Patient(models.Model):
     contact_number = models.CharField(max_length=20, blank=True, null=True, verbose_name="Contact Number")
     email = models.EmailField(verbose_name="Email", blank=True, null=True) # Keep EmailField for validation, but make it optional for now
     registration_date = models.DateTimeField(auto_now_add=True, verbose_name="Registration Date")
+    # Names (own and login account), reg_num, phone digits and email for hms.search
+    search_text = models.TextField(blank=True, default='', editable=False)
+
+    objects = PatientQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.first_name} {self.last_name} (Reg. No: {self.reg_num})"
@@ -39,11 +64,19 @@ class Patient(models.Model):
                 except ValidationError:
                     pass # Let the user provide any valid email if they want to override auto-generation, or you can raise an error here if you want to enforce the pattern.
 
+        from .search import build_search_text
+        self.search_text = build_search_text(self, self.user if self.user_id else None)
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'search_text'}
+
         super().save(*args, **kwargs) # Call the original save method to save the model
 
     class Meta:
         verbose_name = "Patient"
         verbose_name_plural = "Patients"
+        indexes = [
+            models.Index(fields=['registration_date'], name='patient_registered_idx'),
+        ]
 
 class Doctor(models.Model):
     user           = models.OneToOneField(
@@ -81,17 +114,25 @@ class Appointment(models.Model):
         ('Cancelled', 'Cancelled'),
     ], default='Scheduled', verbose_name="Status")
 
+    # Partitioned by month on appointment_date in PostgreSQL (see hms.partitioning)
+    objects = PartitionedQuerySet.as_manager()
+
     def __str__(self):
         return f"Appointment #{self.appointment_id} - Patient: {self.patient}, Doctor: {self.doctor}"
 
     class Meta:
         verbose_name = "Appointment"
         verbose_name_plural = "Appointments"
+        indexes = [
+            models.Index(fields=['doctor', 'appointment_date'], name='hms_appt_doctor_date_idx'),
+            models.Index(fields=['patient', 'appointment_date'], name='hms_appt_patient_date_idx'),
+        ]
 
 class Billing(models.Model):
     bill_id = models.AutoField(primary_key=True)
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='bills', verbose_name="Patient")
-    appointment = models.ForeignKey(Appointment, on_delete=models.SET_NULL, null=True, blank=True, related_name='bills', verbose_name="Appointment")
+    # No database constraint: the partitioned appointment table has no unique id to reference
+    appointment = models.ForeignKey(Appointment, on_delete=models.SET_NULL, null=True, blank=True, related_name='bills', verbose_name="Appointment", db_constraint=False)
     bill_date = models.DateTimeField(auto_now_add=True, verbose_name="Bill Date")
     amount = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Amount")
     status = models.CharField(max_length=20, choices=[
@@ -111,6 +152,9 @@ class Billing(models.Model):
     class Meta:
         verbose_name = "Bill"
         verbose_name_plural = "Bills"
+        indexes = [
+            models.Index(fields=['bill_date'], name='billing_date_idx'),
+        ]
 
 class LabTestOrder(models.Model):
     TEST_STATUS = [
@@ -129,6 +173,12 @@ class LabTestOrder(models.Model):
     def __str__(self):
         return f"{self.test_name} for {self.patient} ({self.status})"
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['requested_at'], name='labtest_requested_idx'),
+            models.Index(fields=['doctor', 'requested_at'], name='labtest_doctor_requested_idx'),
+        ]
+
 class Receptionist(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='hms_receptionist', null=True, blank=True)
     receptionist_id = models.AutoField(primary_key=True)
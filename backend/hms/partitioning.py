@@ -0,0 +1,295 @@
+"""
+Monthly range partitioning of the appointment and audit log tables on
+PostgreSQL.
+
+hms.Appointment, patient_app.Appointment and auditlog's LogEntry are
+partitioned by month on the columns in PARTITION_KEYS, one partition per
+calendar month (UTC) named ``<table>_pYYYYMM`` plus a default partition
+``<table>_pdefault`` that catches rows outside every monthly range. A query
+that filters the partition key with a range (PartitionedQuerySet.in_range
+and friends, or any ``__gte``/``__lt`` filter) only scans the partitions
+covering that range. ``__date`` and similar lookups wrap the column in a
+cast and scan every partition.
+
+PostgreSQL requires the partition key in the primary key, so the tables'
+primary keys are (id, key) in the database. Models keep their single
+column primary key, and ids stay unique because they come from one
+sequence. No foreign key constraint can reference a partitioned table's
+id, so the foreign keys pointing at appointments have db_constraint=False;
+Django still applies their on_delete behaviour. Detaching a partition
+bypasses it, so manage_partitions keeps a partition attached while rows in
+other tables (bills, lab orders, reminder deliveries) still point at its
+rows; archive (see archive.pipeline) or delete those first.
+
+The migrations convert existing tables with partition_table(), which
+copies the rows into a new partitioned table inside the migration's
+transaction; plan a maintenance window for large tables. The
+manage_partitions command then keeps settings.PARTITION_MONTHS_AHEAD
+months of partitions ready and detaches partitions older than
+settings.PARTITION_RETENTION_MONTHS. Other databases (SQLite in
+development and tests) keep plain tables.
+"""
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+
+from django.apps import apps
+from django.db import connections, models, transaction
+from django.utils import timezone
+
+# Model label -> name of the DateTimeField the table is partitioned on
+PARTITION_KEYS = {
+    'hms.Appointment': 'appointment_date',
+    'patient_app.Appointment': 'appointment_datetime',
+    'auditlog.LogEntry': 'timestamp',
+}
+
+DEFAULT_SUFFIX = '_pdefault'
+
+
+def partitioned_models():
+    return [apps.get_model(label) for label in PARTITION_KEYS]
+
+
+def partition_key(model):
+    """Name of the field model's table is partitioned on."""
+    return PARTITION_KEYS[model._meta.label]
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def month_bounds(month):
+    """Aware datetimes [start, end) covering the calendar month (UTC)."""
+    start = month_start(month)
+    end = add_months(start, 1)
+    return (
+        datetime(start.year, start.month, 1, tzinfo=dt_timezone.utc),
+        datetime(end.year, end.month, 1, tzinfo=dt_timezone.utc),
+    )
+
+
+def partition_name(model, month):
+    return f'{model._meta.db_table}_p{month:%Y%m}'
+
+
+class PartitionedQuerySet(models.QuerySet):
+    """Filters on the partition key written as ranges, so PostgreSQL prunes partitions."""
+
+    def in_range(self, start, end):
+        """Rows whose partition key falls in [start, end)."""
+        key = partition_key(self.model)
+        return self.filter(**{f'{key}__gte': start, f'{key}__lt': end})
+
+    def on_day(self, day):
+        start = timezone.make_aware(datetime.combine(day, time.min))
+        return self.in_range(start, start + timedelta(days=1))
+
+    def in_month(self, year, month):
+        return self.in_range(*month_bounds(date(year, month, 1)))
+
+
+def _quote(name):
+    return connections['default'].ops.quote_name(name)
+
+
+def _bound(month):
+    return f"'{month:%Y-%m-%d} 00:00:00+00'"
+
+
+def create_partition_sql(model, month):
+    """
+    Statements that add the partition for month. Rows for that month already
+    in the default partition are moved into it first, so ATTACH succeeds.
+    """
+    month = month_start(month)
+    table, column = model._meta.db_table, model._meta.get_field(partition_key(model)).column
+    part, default = partition_name(model, month), table + DEFAULT_SUFFIX
+    low, high = _bound(month), _bound(add_months(month, 1))
+    return [
+        f'CREATE TABLE {_quote(part)} (LIKE {_quote(table)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+        f'WITH moved AS (DELETE FROM {_quote(default)} WHERE {_quote(column)} >= {low} '
+        f'AND {_quote(column)} < {high} RETURNING *) INSERT INTO {_quote(part)} SELECT * FROM moved',
+        f'ALTER TABLE {_quote(table)} ATTACH PARTITION {_quote(part)} FOR VALUES FROM ({low}) TO ({high})',
+    ]
+
+
+def detach_partition_sql(model, month, archive_schema=None, drop=False):
+    """
+    Statements that detach month's partition; the detached table is then
+    dropped, moved to archive_schema, or left in place under its own name.
+    """
+    part = partition_name(model, month)
+    statements = [f'ALTER TABLE {_quote(model._meta.db_table)} DETACH PARTITION {_quote(part)}']
+    if drop:
+        statements.append(f'DROP TABLE {_quote(part)}')
+    elif archive_schema:
+        statements += [
+            f'CREATE SCHEMA IF NOT EXISTS {_quote(archive_schema)}',
+            f'ALTER TABLE {_quote(part)} SET SCHEMA {_quote(archive_schema)}',
+        ]
+    return statements
+
+
+def is_partitioned(connection, model):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT relkind FROM pg_class WHERE relname = %s AND pg_table_is_visible(oid)",
+            [model._meta.db_table],
+        )
+        row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def existing_partitions(connection, model):
+    """Months that have a partition attached, oldest first."""
+    prefix = model._meta.db_table + '_p'
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "WHERE parent.relname = %s AND pg_table_is_visible(parent.oid)",
+            [model._meta.db_table],
+        )
+        names = [name for name, in cursor.fetchall()]
+    months = []
+    for name in names:
+        suffix = name[len(prefix):]
+        if name.startswith(prefix) and len(suffix) == 6 and suffix.isdigit():
+            months.append(date(int(suffix[:4]), int(suffix[4:]), 1))
+    return sorted(months)
+
+
+def referencing_fields(model):
+    """Foreign keys of every model (auto-created ones included) that point at model."""
+    return [
+        field
+        for related in apps.get_models(include_auto_created=True)
+        for field in related._meta.local_fields
+        if field.remote_field and field.remote_field.model is model
+    ]
+
+
+def partition_references(connection, model, month):
+    """
+    Labels ('app.Model.field') of the foreign keys whose rows point at rows
+    in month's partition. Nothing enforces these references in the database,
+    so detaching the partition would leave them dangling.
+    """
+    key = partition_key(model)
+    start, end = month_bounds(month)
+    rows = model._base_manager.using(connection.alias).filter(**{f'{key}__gte': start, f'{key}__lt': end})
+    found = []
+    for field in referencing_fields(model):
+        targets = rows.values(field.target_field.attname)
+        if field.model._base_manager.using(connection.alias).filter(**{f'{field.attname}__in': targets}).exists():
+            found.append(f'{field.model._meta.label}.{field.name}')
+    return found
+
+
+def default_partition_rows(connection, model):
+    """Rows that fell outside every monthly partition."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT count(*) FROM {_quote(model._meta.db_table + DEFAULT_SUFFIX)}')
+        return cursor.fetchone()[0]
+
+
+def plan_partitions(existing, today, ahead, retain):
+    """
+    Return (months to create, months to detach): every month from today's
+    through ahead months later that has no partition yet, and, when retain
+    is set, existing months older than the last retain months.
+    """
+    current = month_start(today)
+    wanted = [add_months(current, offset) for offset in range(ahead + 1)]
+    create = [month for month in wanted if month not in existing]
+    detach = []
+    if retain:
+        oldest_kept = add_months(current, -(retain - 1))
+        detach = [month for month in existing if month < oldest_kept]
+    return create, detach
+
+
+def apply_statements(connection, statements):
+    # One transaction per partition, so a failure leaves the others in place
+    with transaction.atomic(using=connection.alias):
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+
+def _add_constraints_and_indexes(schema_editor, model):
+    """The foreign keys and indexes Django would create for model's table."""
+    for field in model._meta.local_fields:
+        if field.remote_field and field.db_constraint:
+            schema_editor.execute(schema_editor._create_fk_sql(model, field, '_fk_%(to_table)s_%(to_column)s'))
+    for sql in schema_editor._model_indexes_sql(model):
+        schema_editor.execute(sql)
+
+
+def _sequence_name(model):
+    return f'{model._meta.db_table}_{model._meta.pk.column}_seq'
+
+
+def partition_table(schema_editor, model, months_ahead=3):
+    """
+    Migration helper: replace model's table with a partitioned copy holding
+    a partition for every month from its oldest row to months_ahead months
+    from now. Does nothing on other databases or when already partitioned.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql' or is_partitioned(connection, model):
+        return
+    execute, quote = schema_editor.execute, schema_editor.quote_name
+    table, pk = model._meta.db_table, model._meta.pk.column
+    column = model._meta.get_field(partition_key(model)).column
+    unpartitioned, sequence = f'{table}_unpartitioned', _sequence_name(model)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT min({quote(column)}) FROM {quote(table)}')
+        oldest = cursor.fetchone()[0]
+    execute(f'ALTER TABLE {quote(table)} RENAME TO {quote(unpartitioned)}')
+    execute(
+        f'CREATE TABLE {quote(table)} (LIKE {quote(unpartitioned)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) '
+        f'PARTITION BY RANGE ({quote(column)})'
+    )
+    execute(f'CREATE TABLE {quote(table + DEFAULT_SUFFIX)} PARTITION OF {quote(table)} DEFAULT')
+    current = month_start(timezone.now())
+    month = month_start(oldest) if oldest is not None else current
+    while month <= add_months(current, months_ahead):
+        for sql in create_partition_sql(model, month):
+            execute(sql)
+        month = add_months(month, 1)
+
+    execute(f'INSERT INTO {quote(table)} SELECT * FROM {quote(unpartitioned)}')
+    # Takes the old id sequence with it; ids continue from a new one below
+    execute(f'DROP TABLE {quote(unpartitioned)} CASCADE')
+    execute(f'CREATE SEQUENCE {quote(sequence)} OWNED BY {quote(table)}.{quote(pk)}')
+    execute(f"SELECT setval('{sequence}', COALESCE((SELECT max({quote(pk)}) FROM {quote(table)}), 0) + 1, false)")
+    execute(f"ALTER TABLE {quote(table)} ALTER COLUMN {quote(pk)} SET DEFAULT nextval('{sequence}')")
+    execute(f'ALTER TABLE {quote(table)} ADD PRIMARY KEY ({quote(pk)}, {quote(column)})')
+    _add_constraints_and_indexes(schema_editor, model)
+
+
+def unpartition_table(schema_editor, model):
+    """Reverse of partition_table(): copy the attached partitions back into a plain table."""
+    connection = schema_editor.connection
+    if connection.vendor != 'postgresql' or not is_partitioned(connection, model):
+        return
+    execute, quote = schema_editor.execute, schema_editor.quote_name
+    table, pk = model._meta.db_table, model._meta.pk.column
+    partitioned, sequence = f'{table}_partitioned', _sequence_name(model)
+
+    execute(f'ALTER TABLE {quote(table)} RENAME TO {quote(partitioned)}')
+    execute(f'ALTER SEQUENCE {quote(sequence)} OWNED BY NONE')
+    execute(f'CREATE TABLE {quote(table)} (LIKE {quote(partitioned)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+    execute(f'INSERT INTO {quote(table)} SELECT * FROM {quote(partitioned)}')
+    execute(f'DROP TABLE {quote(partitioned)} CASCADE')
+    execute(f'ALTER SEQUENCE {quote(sequence)} OWNED BY {quote(table)}.{quote(pk)}')
+    execute(f'ALTER TABLE {quote(table)} ADD PRIMARY KEY ({quote(pk)})')
+    _add_constraints_and_indexes(schema_editor, model)
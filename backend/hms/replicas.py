@@ -0,0 +1,249 @@
+"""
+Read-replica routing.
+
+When settings.DB_REPLICA_ALIAS names a database alias (set DB_REPLICA_HOST to
+configure one), ReplicaRouter sends reads to it in two places:
+
+* ViewSets using ReplicaReadMixin, for their read-only actions (list and
+  retrieve by default, see replica_actions);
+* code wrapped in ``with use_replica(request):``, such as the appointment
+  report and the diagnostics snapshot.
+
+Everything else, every write and every read inside a transaction uses the
+primary. Two rules keep replica reads from showing stale data:
+
+* Read-your-writes: once a request writes, its remaining reads go to the
+  primary, and ReplicaMiddleware pins the user to the primary for
+  settings.DB_READ_YOUR_WRITES_SECONDS afterwards (in the API cache, so the
+  pin holds across server processes).
+* Lag fallback: the replica's replay lag is measured at most every
+  settings.DB_REPLICA_LAG_CHECK_INTERVAL seconds per process; while it is
+  above settings.DB_REPLICA_MAX_LAG, or the replica cannot be reached,
+  reads stay on the primary.
+
+Locally, pointing DB_REPLICA_HOST at the primary's host gives two aliases
+on the same database, and in tests the replica alias mirrors 'default'.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+PIN_KEY = 'hms:db:pinned:{user_id}'
+
+# Seconds since the replica last replayed a transaction, 0 when it has replayed
+# everything it received (an idle primary sends nothing new to replay)
+LAG_SQL = (
+    "SELECT CASE WHEN NOT pg_is_in_recovery() "
+    "OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+class RoutingState:
+    """Where the current request may read from, and whether it has written."""
+
+    def __init__(self):
+        self.read_alias = None
+        self.wrote = False
+
+
+# The RoutingState of the request being handled, if ReplicaMiddleware is on
+current_state = ContextVar('replica_routing_state', default=None)
+
+
+def _cache():
+    return caches[settings.API_CACHE_ALIAS]
+
+
+def replica_alias():
+    """The configured replica alias, or None when reads all go to the primary."""
+    alias = settings.DB_REPLICA_ALIAS
+    return alias if alias and alias != DEFAULT_DB_ALIAS else None
+
+
+def measure_lag(alias):
+    """The replica's replay lag in seconds; raises DatabaseError when it is unreachable."""
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return 0.0
+    with connection.cursor() as cursor:
+        cursor.execute(LAG_SQL)
+        return float(cursor.fetchone()[0] or 0)
+
+
+class LagMonitor:
+    """Replica lag per alias, measured at most once per check interval in this process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checked = {}
+
+    def lag(self, alias):
+        """Lag in seconds, or None when the last check could not reach the replica."""
+        now = time.monotonic()
+        with self.lock:
+            checked_at, lag = self.checked.get(alias, (None, None))
+            if checked_at is not None and now - checked_at < settings.DB_REPLICA_LAG_CHECK_INTERVAL:
+                return lag
+            # Claimed before measuring, so concurrent requests reuse the last value meanwhile
+            self.checked[alias] = (now, lag)
+        was_usable = checked_at is None or self.acceptable(lag)
+        try:
+            lag = measure_lag(alias)
+        except DatabaseError as e:
+            if was_usable:
+                logger.warning("Replica unreachable, reading from the primary", extra={'alias': alias, 'error': str(e)})
+            lag = None
+        else:
+            # Logged when the replica falls behind, not on every check while it stays behind
+            if was_usable and not self.acceptable(lag):
+                logger.warning(
+                    "Replica lagging, reading from the primary", extra={'alias': alias, 'lag_seconds': round(lag, 3)}
+                )
+        with self.lock:
+            self.checked[alias] = (time.monotonic(), lag)
+        return lag
+
+    @staticmethod
+    def acceptable(lag):
+        return lag is not None and lag <= settings.DB_REPLICA_MAX_LAG
+
+    def usable(self, alias):
+        return self.acceptable(self.lag(alias))
+
+    def status(self, alias):
+        with self.lock:
+            checked_at, lag = self.checked.get(alias, (None, None))
+        return None if checked_at is None else lag
+
+    def clear(self):
+        with self.lock:
+            self.checked.clear()
+
+
+monitor = LagMonitor()
+
+
+def is_pinned(user):
+    """Whether user wrote recently enough that the replica may not have their change yet."""
+    if user is None or not user.is_authenticated or not settings.DB_READ_YOUR_WRITES_SECONDS:
+        return False
+    return bool(_cache().get(PIN_KEY.format(user_id=user.pk)))
+
+
+def pin(user):
+    if user is not None and user.is_authenticated and settings.DB_READ_YOUR_WRITES_SECONDS:
+        _cache().set(PIN_KEY.format(user_id=user.pk), True, settings.DB_READ_YOUR_WRITES_SECONDS)
+
+
+def read_alias_for(request=None):
+    """The replica alias when request may read from it, otherwise None (the primary)."""
+    alias = replica_alias()
+    if alias is None:
+        return None
+    state = current_state.get()
+    if state is not None and state.wrote:
+        return None
+    if request is not None and is_pinned(getattr(request, 'user', None)):
+        return None
+    return alias if monitor.usable(alias) else None
+
+
+@contextmanager
+def use_replica(request=None):
+    """Send the reads made inside the block to the replica, when request may use it."""
+    state = current_state.get()
+    token = None
+    if state is None:
+        state = RoutingState()
+        token = current_state.set(state)
+    previous = state.read_alias
+    state.read_alias = read_alias_for(request)
+    try:
+        yield state.read_alias
+    finally:
+        state.read_alias = previous
+        if token is not None:
+            current_state.reset(token)
+
+
+class ReplicaRouter:
+    """Database router: reads go to the replica only where a RoutingState allows it."""
+
+    def db_for_read(self, model, **hints):
+        state = current_state.get()
+        if state is None or state.read_alias is None or state.wrote:
+            return None
+        # Reads inside a transaction must see its uncommitted writes
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return state.read_alias
+
+    def db_for_write(self, model, **hints):
+        state = current_state.get()
+        if state is not None:
+            state.wrote = True
+        # Explicitly the primary, even for instances that were read from the replica
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, replica_alias()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica receives its schema from the primary
+        if db == replica_alias():
+            return False
+        return None
+
+
+class ReplicaMiddleware:
+    """
+    Track writes per request and pin users who wrote to the primary.
+
+    Must come after AuthenticationMiddleware. Only collects state; reads
+    move to the replica where ReplicaReadMixin or use_replica() say so.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = RoutingState()
+        token = current_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_state.reset(token)
+        if state.wrote:
+            pin(getattr(request, 'user', None))
+        return response
+
+
+class ReplicaReadMixin:
+    """
+    Run the read-only actions of a ViewSet against the replica.
+
+    Add to ViewSets whose list and detail responses can tolerate data
+    settings.DB_REPLICA_MAX_LAG seconds old; users who just wrote still read
+    from the primary.
+    """
+    replica_actions = ('list', 'retrieve')
+
+    def initial(self, request, *args, **kwargs):
+        state = current_state.get()
+        if state is not None and self.action in self.replica_actions:
+            # Authenticate first: whether the user is pinned depends on who it is
+            self.perform_authentication(request)
+            state.read_alias = read_alias_for(request)
+        super().initial(request, *args, **kwargs)
@@ -0,0 +1,166 @@
+"""
+Cached role and profile resolution for the logged-in user.
+
+Working out whether a user is a doctor, receptionist or patient used to cost a
+query per hasattr()/Doctor.objects.get() check, several times per request.
+resolve_identity() answers all of it with one query and keeps the answer in
+three tiers:
+
+1. on the user object itself, for the rest of the request;
+2. a small in-process LRU (settings.ROLE_CACHE_LOCAL_SIZE entries kept for
+   settings.ROLE_CACHE_LOCAL_TTL seconds);
+3. the shared Django cache named by settings.ROLE_CACHE_ALIAS (Redis in
+   production, see CACHES), for settings.ROLE_CACHE_TTL seconds.
+
+Saving or deleting a user, doctor, patient profile, hms patient or
+receptionist calls invalidate_identity() (see hms.signals). That clears the
+shared tier and this process's LRU; other processes pick up the change when
+their short-lived LRU entry expires.
+"""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+
+ADMIN = 'ADMIN'
+DOCTOR = 'DOCTOR'
+RECEPTIONIST = 'RECEPTIONIST'
+PATIENT = 'PATIENT'
+
+CACHE_KEY = 'identity:v1:{user_id}'
+_REQUEST_ATTR = '_cached_identity'
+
+
+@dataclass(frozen=True)
+class UserIdentity:
+    user_id: int
+    role: str | None
+    doctor_id: int | None = None
+    doctor_first_name: str = ''
+    doctor_last_name: str = ''
+    doctor_specialization: str = ''
+    doctor_department: str = ''
+    patient_profile_id: int | None = None
+    hms_patient_id: int | None = None
+    receptionist_id: int | None = None
+
+
+class _LocalCache:
+    """Thread-safe LRU with a per-entry expiry."""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        size = settings.ROLE_CACHE_LOCAL_SIZE
+        if size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + settings.ROLE_CACHE_LOCAL_TTL, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+local_cache = _LocalCache()
+
+
+def _shared_cache():
+    return caches[settings.ROLE_CACHE_ALIAS]
+
+
+def _load_identity(user_id):
+    row = User.objects.filter(pk=user_id).values(
+        'is_staff', 'is_superuser',
+        'doctor__doctor_id', 'doctor__first_name', 'doctor__last_name',
+        'doctor__specialization', 'doctor__department',
+        'patientprofile__user_id', 'hms_patient__patient_id', 'hms_receptionist__receptionist_id',
+    ).first()
+    if row is None:
+        return UserIdentity(user_id=user_id, role=None)
+
+    if row['is_staff'] or row['is_superuser']:
+        role = ADMIN
+    elif row['doctor__doctor_id'] is not None:
+        role = DOCTOR
+    elif row['hms_receptionist__receptionist_id'] is not None:
+        role = RECEPTIONIST
+    elif row['patientprofile__user_id'] is not None or row['hms_patient__patient_id'] is not None:
+        role = PATIENT
+    else:
+        role = None
+    return UserIdentity(
+        user_id=user_id,
+        role=role,
+        doctor_id=row['doctor__doctor_id'],
+        doctor_first_name=row['doctor__first_name'] or '',
+        doctor_last_name=row['doctor__last_name'] or '',
+        doctor_specialization=row['doctor__specialization'] or '',
+        doctor_department=row['doctor__department'] or '',
+        patient_profile_id=row['patientprofile__user_id'],
+        hms_patient_id=row['hms_patient__patient_id'],
+        receptionist_id=row['hms_receptionist__receptionist_id'],
+    )
+
+
+def resolve_identity(user):
+    """Return the UserIdentity of an authenticated user, or None for anonymous users."""
+    if user is None or not user.is_authenticated:
+        return None
+    identity = getattr(user, _REQUEST_ATTR, None)
+    if identity is not None:
+        return identity
+
+    key = CACHE_KEY.format(user_id=user.pk)
+    identity = local_cache.get(key)
+    if identity is None:
+        cached = _shared_cache().get(key)
+        if cached is not None:
+            identity = UserIdentity(**cached)
+        else:
+            identity = _load_identity(user.pk)
+            _shared_cache().set(key, asdict(identity), settings.ROLE_CACHE_TTL)
+        local_cache.set(key, identity)
+
+    setattr(user, _REQUEST_ATTR, identity)
+    return identity
+
+
+def get_role(user):
+    """Return the user's role, resolved from their profile rows."""
+    identity = resolve_identity(user)
+    return identity.role if identity else None
+
+
+def invalidate_identity(user_id):
+    """Forget the cached identity of a user after one of their profiles changed."""
+    if user_id is None:
+        return
+    key = CACHE_KEY.format(user_id=user_id)
+    local_cache.delete(key)
+    _shared_cache().delete(key)
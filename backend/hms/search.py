@@ -0,0 +1,202 @@
+"""
+Patient search for receptionist lookups (GET /api/hms-patients/search/?q=).
+
+Every hms.Patient row keeps a lowercased search_text: its names, the names of
+its login account, reg_num, contact number (digits only) and email. Patient.save
+and hms.signals keep it current; code writing patients in bulk calls
+reindex_patients() afterwards.
+
+On PostgreSQL, migration 0011 indexes search_text with a pg_trgm GIN index and
+a GIN index over its 'simple' full-text vector, and a search is one query that
+matches rows through either index:
+
+* prefix: every query word as a full-text prefix ('ali':* & 'raz':*)
+* substring: search_text LIKE '%term%' (served by the trigram index)
+* fuzzy: pg_trgm word similarity (term <% search_text), for typos
+
+At most settings.PATIENT_SEARCH_CANDIDATES matching rows are ranked: an exact
+reg_num or phone number match first, then full-text rank plus word similarity.
+
+Other databases (SQLite in tests and development) use InProcessIndex, a
+trigram index over the same search_text held in process memory and rebuilt
+after patients change, which ranks with the same rules.
+"""
+import re
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, F, FloatField, Q, Value, When
+
+from .models import Patient
+
+# pg_trgm's default word_similarity_threshold, used by the in-process index
+FUZZY_THRESHOLD = 0.6
+# Added to the score of an exact reg_num or phone number match
+EXACT_MATCH_BOOST = 2.0
+
+PHONE_LIKE = re.compile(r'^[\d\s()+-]+$')
+# Characters kept in full-text prefix terms; everything else separates words
+WORD = re.compile(r"[\w@.+-]+")
+
+
+def build_search_text(patient, user=None):
+    """The search_text of a Patient (or historical Patient) row and its login account."""
+    parts = [patient.first_name, patient.last_name]
+    if user is not None:
+        parts += [user.first_name, user.last_name]
+    parts += [patient.reg_num, re.sub(r'\D', '', patient.contact_number or ''), patient.email]
+    words = []
+    for part in parts:
+        for word in (part or '').lower().split():
+            if word not in words:
+                words.append(word)
+    return ' '.join(words)
+
+
+def normalize_query(query):
+    """Lowercase and collapse whitespace; phone-like queries keep only their digits."""
+    query = ' '.join(query.lower().split())
+    if PHONE_LIKE.match(query) and re.search(r'\d', query):
+        return re.sub(r'\D', '', query)
+    return query
+
+
+def reindex_patients(queryset=None, batch_size=1000):
+    """Recompute search_text for patients written without save(), e.g. by bulk_create."""
+    queryset = (queryset if queryset is not None else Patient.objects.all()).select_related('user').order_by('pk')
+    last_pk, updated = 0, 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            break
+        changed = []
+        for patient in batch:
+            text = build_search_text(patient, patient.user)
+            if text != patient.search_text:
+                patient.search_text = text
+                changed.append(patient)
+        Patient.objects.bulk_update(changed, ['search_text'])
+        updated += len(changed)
+        last_pk = batch[-1].pk
+    local_index.invalidate()
+    return updated
+
+
+def search_patients(query, limit):
+    """Up to limit Patient rows matching query, best first, each with a score attribute."""
+    term = normalize_query(query)
+    if not term:
+        return []
+    if connection.vendor == 'postgresql':
+        return _postgres_search(term, limit)
+    return local_index.search(term, limit)
+
+
+def _postgres_search(term, limit):
+    from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+
+    words = WORD.findall(term)
+    vector = SearchVector('search_text', config='simple')
+    matches = Q(search_text__contains=term) | Q(search_text__trigram_word_similar=term)
+    prefix = None
+    if words:
+        prefix = SearchQuery(
+            ' & '.join("'{}':*".format(word.replace("'", "''")) for word in words),
+            search_type='raw', config='simple',
+        )
+        matches |= Q(document=prefix)
+
+    candidates = Patient.objects.annotate(document=vector).filter(matches).values('pk')
+    score = Case(
+        When(Q(reg_num__iexact=term) | Q(contact_number=term), then=Value(EXACT_MATCH_BOOST)),
+        default=Value(0.0), output_field=FloatField(),
+    ) + TrigramWordSimilarity(term, 'search_text')
+    if prefix is not None:
+        score = score + SearchRank(vector, prefix)
+    return list(
+        Patient.objects.filter(pk__in=candidates[:settings.PATIENT_SEARCH_CANDIDATES])
+        .annotate(score=score)
+        .order_by(F('score').desc(), 'pk')[:limit]
+    )
+
+
+def trigrams(word):
+    """pg_trgm style trigrams: the word padded with two spaces in front and one behind."""
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class InProcessIndex:
+    """
+    Trigram index over Patient.search_text kept in memory, for databases
+    without pg_trgm. Rebuilt on the next search after invalidate(), which
+    hms.signals calls whenever a patient changes.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stale = True
+        self.documents = {}
+        self.postings = defaultdict(set)
+
+    def invalidate(self):
+        self.stale = True
+
+    def build(self):
+        # Cleared first, so a change made while building marks the new index stale again
+        self.stale = False
+        self.documents = {}
+        self.postings = defaultdict(set)
+        for pk, reg_num, contact_number, text in Patient.objects.values_list(
+            'pk', 'reg_num', 'contact_number', 'search_text'
+        ).iterator():
+            words = text.split()
+            self.documents[pk] = (reg_num.lower(), contact_number or '', text, words)
+            for word in words:
+                for trigram in trigrams(word):
+                    self.postings[trigram].add(pk)
+
+    def search(self, term, limit):
+        with self.lock:
+            if self.stale:
+                self.build()
+            query_words = term.split()
+            candidates = set()
+            for word in query_words:
+                for trigram in trigrams(word):
+                    candidates |= self.postings.get(trigram, set())
+            scored = []
+            for pk in candidates:
+                score = self.score(term, query_words, self.documents[pk])
+                if score is not None:
+                    scored.append((-score, pk))
+        scored.sort()
+        scored = scored[:limit]
+        patients = Patient.objects.in_bulk([pk for _, pk in scored])
+        results = []
+        for negative_score, pk in scored:
+            patient = patients.get(pk)
+            if patient is not None:
+                patient.score = -negative_score
+                results.append(patient)
+        return results
+
+    @staticmethod
+    def score(term, query_words, document):
+        reg_num, contact_number, text, words = document
+        is_prefix = all(any(word.startswith(query_word) for word in words) for query_word in query_words)
+        # Word similarity: the share of the query's trigrams found in its best matching word
+        similarity = sum(
+            max(len(trigrams(query_word) & trigrams(word)) for word in words) / len(trigrams(query_word))
+            for query_word in query_words
+        ) / len(query_words) if words else 0.0
+        if not (is_prefix or term in text or similarity >= FUZZY_THRESHOLD):
+            return None
+        exact = EXACT_MATCH_BOOST if term in (reg_num, contact_number) else 0.0
+        # Mirrors the PostgreSQL ranking: a prefix match weighs like a full-text rank
+        return exact + similarity + (0.1 if is_prefix else 0.0)
+
+
+local_index = InProcessIndex()
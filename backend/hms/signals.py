@@ -0,0 +1,112 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from doctor_app.models import DoctorSchedule
+from doctor_app.schedule import forget_days
+from patient_app.models import PatientProfile
+from .caching import DOCTOR_SCHEDULES, DOCTORS, bump_version
+from .models import Appointment, Doctor, Patient, Receptionist
+from .roles import invalidate_identity
+from .search import build_search_text, local_index
+
+# Profile models whose rows decide a user's role (see hms.roles)
+PROFILE_MODELS = (Doctor, Patient, Receptionist, PatientProfile)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_user_identity(sender, instance, **kwargs):
+    invalidate_identity(instance.pk)
+
+
+def forget_previous_owner(sender, instance, **kwargs):
+    """A profile moved to another user also changes the identity of its previous user."""
+    if instance.pk is None or sender is PatientProfile:
+        return
+    previous_user_id = sender.objects.filter(pk=instance.pk).values_list('user_id', flat=True).first()
+    if previous_user_id != instance.user_id:
+        invalidate_identity(previous_user_id)
+
+
+def forget_profile_identity(sender, instance, **kwargs):
+    invalidate_identity(instance.user_id)
+
+
+for model in PROFILE_MODELS:
+    pre_save.connect(forget_previous_owner, sender=model, dispatch_uid=f'roles_pre_save_{model._meta.label}')
+    post_save.connect(forget_profile_identity, sender=model, dispatch_uid=f'roles_post_save_{model._meta.label}')
+    post_delete.connect(forget_profile_identity, sender=model, dispatch_uid=f'roles_post_delete_{model._meta.label}')
+
+
+# Cached doctor directory and schedule responses (see hms.caching). Schedule
+# responses include the doctor's name, so doctor changes invalidate both.
+# Bumped after commit: a bump inside the transaction lets a concurrent read
+# cache the old rows under the new version.
+@receiver(post_save, sender=Doctor)
+@receiver(post_delete, sender=Doctor)
+def bump_doctor_cache(sender, instance, **kwargs):
+    def bump():
+        bump_version(DOCTORS)
+        bump_version(DOCTOR_SCHEDULES)
+    transaction.on_commit(bump)
+
+
+@receiver(post_save, sender=DoctorSchedule)
+@receiver(post_delete, sender=DoctorSchedule)
+def bump_schedule_cache(sender, instance, **kwargs):
+    transaction.on_commit(lambda: bump_version(DOCTOR_SCHEDULES))
+
+
+# Cached daily schedules (see doctor_app.schedule): an appointment that
+# moves invalidates the day it left as well as the day it is on now.
+# Forgotten after commit, for the same reason as the version bumps above.
+@receiver(pre_save, sender=Appointment)
+def remember_schedule_day(sender, instance, **kwargs):
+    instance._schedule_previous = None
+    if instance.pk:
+        instance._schedule_previous = sender.objects.filter(pk=instance.pk).values_list(
+            'doctor_id', 'appointment_date'
+        ).first()
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def forget_schedule_days(sender, instance, **kwargs):
+    pairs = [(instance.doctor_id, instance.appointment_date)]
+    previous = getattr(instance, '_schedule_previous', None)
+    if previous is not None:
+        pairs.append(previous)
+    transaction.on_commit(lambda: forget_days(pairs))
+
+
+@receiver(post_save, sender=Patient)
+def forget_patient_schedule_days(sender, instance, created, **kwargs):
+    # Schedules show patient names
+    if not created:
+        pairs = list(Appointment.objects.filter(patient=instance).values_list('doctor_id', 'appointment_date'))
+        transaction.on_commit(lambda: forget_days(pairs))
+
+
+# Patient search (see hms.search). search_text includes the login account's
+# names, so renaming a user re-indexes its patient row.
+SEARCHED_USER_FIELDS = {'first_name', 'last_name'}
+
+
+@receiver(post_save, sender=User)
+def reindex_user_patient(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and not SEARCHED_USER_FIELDS & set(update_fields)):
+        # e.g. the last_login update on every login
+        return
+    for patient in Patient.objects.filter(user=instance):
+        text = build_search_text(patient, instance)
+        if text != patient.search_text:
+            Patient.objects.filter(pk=patient.pk).update(search_text=text)
+            local_index.invalidate()
+
+
+@receiver(post_save, sender=Patient)
+@receiver(post_delete, sender=Patient)
+def invalidate_patient_search(sender, instance, **kwargs):
+    local_index.invalidate()
@@ -1,3 +1,848 @@
-from django.test import TestCase
+import json
+import logging
+import queue
+from datetime import date, timedelta
+from io import StringIO
+from logging.handlers import QueueListener
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from . import metrics
+from .log import JSONFormatter, NonBlockingHandler, SamplingFilter, request_id_var
+from .models import Doctor, LabTestOrder, Patient
+
+
+class CursorPaginationTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='pager', password='password123')
+        cls.doctor = Doctor.objects.create(
+            first_name='Page', last_name='Size', specialization='General', department='OPD'
+        )
+        for i in range(7):
+            patient = Patient.objects.create(
+                reg_num=f'2030{i:03d}', first_name='Cursor', last_name=str(i),
+                gender='Male', date_of_birth=date(2000, 1, 1)
+            )
+            LabTestOrder.objects.create(doctor=cls.doctor, patient=patient, test_name=f'CBC {i}')
+        # Spread requested_at so the cursor has distinct positions to seek on
+        now = timezone.now()
+        for offset, order in enumerate(LabTestOrder.objects.order_by('id')):
+            LabTestOrder.objects.filter(pk=order.pk).update(requested_at=now - timedelta(minutes=offset))
+        cls.list_url = reverse('lab-test-list')
+
+    def setUp(self):
+        self.client.force_authenticate(user=self.user)
+
+    def _get(self, url, params=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, len(ctx.captured_queries)
+
+    def test_walks_all_rows_newest_first_without_overlap(self):
+        response, _ = self._get(self.list_url, {'page_size': 3})
+        seen = [row['id'] for row in response.data['results']]
+        self.assertIsNone(response.data['previous'])
+        while response.data['next']:
+            response, _ = self._get(response.data['next'])
+            seen.extend(row['id'] for row in response.data['results'])
+
+        expected = list(LabTestOrder.objects.order_by('-requested_at').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_page_queries_do_not_grow_with_page_number(self):
+        first, first_queries = self._get(self.list_url, {'page_size': 2})
+        cursor = parse_qs(urlparse(first.data['next']).query)['cursor'][0]
+        later, later_queries = self._get(self.list_url, {'page_size': 2, 'cursor': cursor})
+        self.assertEqual(len(later.data['results']), 2)
+        self.assertEqual(first_queries, later_queries)
+
+    def test_hms_patients_are_paginated(self):
+        response, _ = self._get(reverse('hms-patient-list'), {'page_size': 5})
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertIsNotNone(response.data['next'])
+
+
+class ExplainQueriesCommandTests(APITestCase):
+    def test_reports_every_canonical_query(self):
+        out = StringIO()
+        call_command('explain_queries', '--threshold=0', stdout=out)
+        for label in ('appointments (doctor)', 'appointments (reminders)', 'medical-records (patient)',
+                      'patient-lab-tests (doctor)', 'lab-tests', 'hms-patients'):
+            self.assertIn(label, out.getvalue())
+
+
+from django.apps import apps
+
+from admin_app.serializers import AdminPatientRegistrationSerializer, AdminReceptionistRegistrationSerializer
+from patient_app.models import Appointment as PatientAppointment, PatientProfile
+from receptionist_app.models import Receptionist as AppReceptionist
+from .identity import merge_patient_identities, merge_receptionist_identities
+from .models import Appointment, Billing, Receptionist
+
+
+class PatientIdentityTests(APITestCase):
+    def _profile(self, username, first_name='', last_name='', **fields):
+        user = User.objects.create_user(
+            username=username, password='password123', first_name=first_name, last_name=last_name
+        )
+        return PatientProfile.objects.create(user=user, **fields)
+
+    def _patient(self, reg_num, first_name, last_name, **fields):
+        fields.setdefault('gender', 'Female')
+        fields.setdefault('date_of_birth', date(2001, 1, 1))
+        return Patient.objects.create(reg_num=reg_num, first_name=first_name, last_name=last_name, **fields)
+
+    def test_merge_links_creates_and_fills_in_batches(self):
+        by_reg_num = self._profile('2021001', 'Sara', 'Ali', contact_number='0300-1111111')
+        by_name = self._profile('sana.k', 'Sana', 'Khan', date_of_birth=date(2001, 1, 1))
+        missing = self._profile('2021003', 'Omar', 'Farooq', date_of_birth=date(2000, 2, 2), gender='M')
+        unmatched = self._profile('no.details', 'No', 'Details')
+        sara = self._patient('2021001', 'Sara', 'Ali')
+        sana = self._patient('2021002', 'Sana', 'Khan', contact_number='0300-2222222', gender='Female')
+
+        counts = merge_patient_identities(apps, batch_size=2)
+
+        # Sara's patient gets her phone number, both profiles get date of birth and gender
+        self.assertEqual(counts, {'linked': 2, 'created': 1, 'updated': 3, 'unmatched': 1, 'review': 0})
+        sara.refresh_from_db()
+        sana.refresh_from_db()
+        by_name.refresh_from_db()
+        self.assertEqual(sara.user_id, by_reg_num.pk)
+        self.assertEqual(sara.contact_number, '0300-1111111')
+        self.assertEqual(sana.user_id, by_name.pk)
+        self.assertEqual((by_name.contact_number, by_name.gender), ('0300-2222222', 'Female'))
+        omar = Patient.objects.get(user=missing.user)
+        self.assertEqual((omar.reg_num, omar.gender), ('2021003', 'Male'))
+        self.assertFalse(Patient.objects.filter(user=unmatched.user).exists())
+
+        # Re-running finds nothing left to do
+        self.assertEqual(
+            merge_patient_identities(apps, batch_size=2),
+            {'linked': 0, 'created': 0, 'updated': 0, 'unmatched': 1, 'review': 0},
+        )
+
+    def test_name_match_needs_a_second_identifier(self):
+        by_phone = self._profile('hamza.s', 'Hamza', 'Saeed', contact_number='0300 1234567')
+        namesake = self._profile('hamza.s2', 'Hamza', 'Saeed', date_of_birth=date(1999, 9, 9), gender='M')
+        hamza = self._patient('2021010', 'Hamza', 'Saeed', contact_number='0300-1234567')
+        lonely = self._profile('zara.n', 'Zara', 'Naqvi', date_of_birth=date(1995, 5, 5), gender='F')
+        zara = self._patient('2021011', 'Zara', 'Naqvi')
+
+        review = []
+        counts = merge_patient_identities(apps, review=review)
+
+        self.assertEqual(counts['linked'], 1)
+        hamza.refresh_from_db()
+        zara.refresh_from_db()
+        self.assertEqual(hamza.user_id, by_phone.pk)
+        # Same name, different birth date and no phone: neither linked nor duplicated
+        self.assertIsNone(zara.user_id)
+        self.assertFalse(Patient.objects.filter(user=lonely.user).exists())
+        self.assertFalse(Patient.objects.filter(user=namesake.user).exists())
+        self.assertEqual(counts['review'], 2)
+        self.assertEqual(
+            {entry['username']: entry['patient_ids'] for entry in review},
+            {'hamza.s2': [hamza.pk], 'zara.n': [zara.pk]},
+        )
+
+    def test_truncated_reg_nums_do_not_collide(self):
+        first = self._profile('a' * 20 + '.first', 'Long', 'One', date_of_birth=date(2000, 1, 1), gender='F')
+        second = self._profile('a' * 20 + '.second', 'Long', 'Two', date_of_birth=date(2000, 1, 1), gender='F')
+
+        review = []
+        counts = merge_patient_identities(apps, review=review)
+
+        self.assertEqual((counts['created'], counts['review']), (1, 1))
+        self.assertEqual(Patient.objects.get(reg_num='a' * 20).user_id, first.pk)
+        self.assertEqual(review[0]['user_id'], second.pk)
+
+    def test_merge_copies_old_receptionists(self):
+        user = User.objects.create_user(username='front.desk', first_name='Hina', last_name='Raza')
+        AppReceptionist.objects.create(user=user, contact_number='0301-0000000')
+        linked_user = User.objects.create_user(username='desk.two')
+        AppReceptionist.objects.create(user=linked_user, address='Block A')
+        Receptionist.objects.create(user=linked_user, first_name='Desk', last_name='Two')
+
+        counts = merge_receptionist_identities(apps)
+
+        self.assertEqual(counts, {'created': 1, 'updated': 1})
+        self.assertEqual(Receptionist.objects.get(user=user).first_name, 'Hina')
+        self.assertEqual(Receptionist.objects.get(user=linked_user).address, 'Block A')
+
+    def test_registration_links_patient_to_user(self):
+        serializer = AdminPatientRegistrationSerializer(data={
+            'username': '2024050', 'password': 'pw-123456', 'confirm_password': 'pw-123456',
+            'email': '2024050@example.com', 'first_name': 'Ali', 'last_name': 'Raza',
+            'date_of_birth': '2004-04-04', 'gender': 'M', 'reg_num': '2024050',
+        })
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        profile = serializer.save()
+
+        patient = Patient.objects.get(user=profile.user)
+        self.assertEqual(patient.gender, 'Male')
+        self.assertEqual(serializer.data['hms_patient_id'], patient.patient_id)
+
+    def test_receptionist_registration_writes_one_record(self):
+        serializer = AdminReceptionistRegistrationSerializer(data={
+            'username': 'reception1', 'password': 'pw-123456', 'confirm_password': 'pw-123456',
+            'email': 'reception1@example.com', 'first_name': 'Hira', 'last_name': 'Malik',
+        })
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        receptionist = serializer.save()
+
+        self.assertIsInstance(receptionist, Receptionist)
+        self.assertEqual(receptionist.first_name, 'Hira')
+        self.assertFalse(AppReceptionist.objects.exists())
+
+    def test_seen_by_covers_both_appointment_tables(self):
+        doctor = Doctor.objects.create(first_name='Seen', last_name='By', specialization='General', department='OPD')
+        other_doctor = Doctor.objects.create(first_name='Other', last_name='Doc', specialization='General', department='OPD')
+        hms_only = self._patient('3001', 'Hms', 'Only')
+        portal_profile = self._profile('3002', 'Portal', 'Only')
+        portal = self._patient('3002', 'Portal', 'Only', user=portal_profile.user)
+        both_profile = self._profile('3003', 'Both', 'Tables')
+        both = self._patient('3003', 'Both', 'Tables', user=both_profile.user)
+        other = self._patient('3004', 'Other', 'Patient')
+        when = timezone.now() + timedelta(days=1)
+        Appointment.objects.create(patient=hms_only, doctor=doctor, appointment_date=when, reason='Checkup')
+        Appointment.objects.create(patient=both, doctor=doctor, appointment_date=when, reason='Checkup')
+        Appointment.objects.create(patient=other, doctor=other_doctor, appointment_date=when, reason='Checkup')
+        PatientAppointment.objects.create(patient=portal_profile, doctor=doctor, appointment_datetime=when)
+        PatientAppointment.objects.create(patient=both_profile, doctor=doctor, appointment_datetime=when)
+
+        with self.assertNumQueries(1):
+            seen = set(Patient.objects.seen_by(doctor))
+
+        self.assertEqual(seen, {hms_only, portal, both})
+
+
+from django.core.cache import cache
+from django.test import override_settings
+
+from .roles import DOCTOR, PATIENT, local_cache, resolve_identity
+
+
+class RoleResolverTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='role_user', password='password123')
+
+    def setUp(self):
+        local_cache.clear()
+        cache.clear()
+
+    def fresh_user(self):
+        # A new instance, as each request loads its own user object
+        return User.objects.get(pk=self.user.pk)
+
+    def test_identity_is_cached_per_request_and_across_requests(self):
+        PatientProfile.objects.create(user=self.user)
+        user = self.fresh_user()
+        with self.assertNumQueries(1):
+            self.assertEqual(resolve_identity(user).role, PATIENT)
+            self.assertEqual(resolve_identity(user).patient_profile_id, self.user.pk)
+
+        user = self.fresh_user()
+        with self.assertNumQueries(0):
+            resolve_identity(user)  # in-process LRU
+
+        local_cache.clear()
+        user = self.fresh_user()
+        with self.assertNumQueries(0):
+            resolve_identity(user)  # shared cache
+
+    def test_profile_changes_invalidate_the_cache(self):
+        self.assertIsNone(resolve_identity(self.fresh_user()).role)
+
+        doctor = Doctor.objects.create(
+            user=self.user, first_name='Role', last_name='Doc', specialization='General', department='OPD'
+        )
+        identity = resolve_identity(self.fresh_user())
+        self.assertEqual((identity.role, identity.doctor_id), (DOCTOR, doctor.pk))
+
+        doctor.department = 'Cardiology'
+        doctor.save()
+        self.assertEqual(resolve_identity(self.fresh_user()).doctor_department, 'Cardiology')
+
+        doctor.delete()
+        self.assertIsNone(resolve_identity(self.fresh_user()).doctor_id)
+
+    def test_current_user_reports_cached_doctor(self):
+        Doctor.objects.create(
+            user=self.user, first_name='Role', last_name='Doc', specialization='General', department='OPD'
+        )
+        self.client.force_login(self.user)
+        self.client.get(reverse('current_user'))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('current_user'))
+
+        self.assertEqual(response.data['userType'], 'Doctor')
+        self.assertEqual(response.data['fullName'], 'Role Doc')
+        self.assertFalse(any('hms_doctor' in query['sql'] for query in queries.captured_queries))
+
+    @override_settings(SESSION_SAVE_EVERY_REQUEST=False, SESSION_REFRESH_INTERVAL=3600)
+    def test_authenticated_reads_do_not_write_the_session(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('current_user'))  # first request renews the session once
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('current_user'))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        writes = [
+            query['sql'] for query in queries.captured_queries
+            if 'django_session' in query['sql'] and not query['sql'].startswith('SELECT')
+        ]
+        self.assertEqual(writes, [])
+
+
+from doctor_app.models import DoctorSchedule
+from .caching import stats as api_cache_stats
+
+
+class DoctorDirectoryCacheTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='directory_user', password='password123')
+        cls.doctor = Doctor.objects.create(
+            first_name='Cache', last_name='Doc', specialization='General', department='OPD'
+        )
+        DoctorSchedule.objects.create(
+            doctor=cls.doctor, day_of_week='monday', start_time='09:00', end_time='12:00', max_appointments=10
+        )
+
+    def setUp(self):
+        cache.clear()
+        api_cache_stats.reset()
+        self.client.force_authenticate(self.user)
+
+    def test_warm_directory_fetch_costs_no_queries(self):
+        first = self.client.get(reverse('doctor-list'))
+        self.assertEqual(first['X-Cache'], 'MISS')
+
+        with self.assertNumQueries(0):
+            second = self.client.get(reverse('doctor-list'))
+
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(api_cache_stats.snapshot()['doctors'], {'hits': 1, 'misses': 1, 'not_modified': 0})
+
+    def test_if_none_match_returns_not_modified(self):
+        etag = self.client.get(reverse('doctor-schedule-list'))['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('doctor-schedule-list'), HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(api_cache_stats.snapshot()['doctor_schedules']['not_modified'], 1)
+
+    def test_doctor_changes_invalidate_directory_and_schedules(self):
+        doctors_etag = self.client.get(reverse('doctor-list'))['ETag']
+        schedules_etag = self.client.get(reverse('doctor-schedule-list'))['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.doctor.last_name = 'Renamed'
+            self.doctor.save()
+            # The version only moves once the change commits
+            self.assertEqual(self.client.get(reverse('doctor-list'))['ETag'], doctors_etag)
+
+        response = self.client.get(reverse('doctor-schedule-list'), HTTP_IF_NONE_MATCH=schedules_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()[0]['doctor_name'], 'Cache Renamed')
+        self.assertNotEqual(self.client.get(reverse('doctor-list'))['ETag'], doctors_etag)
+
+    def test_query_parameters_are_cached_separately(self):
+        DoctorSchedule.objects.create(
+            doctor=self.doctor, day_of_week='tuesday', start_time='09:00', end_time='12:00', max_appointments=10
+        )
+        everything = self.client.get(reverse('doctor-schedule-list'))
+        filtered = self.client.get(reverse('doctor-schedule-list'), {'search': 'tuesday'})
+
+        self.assertEqual(len(everything.json()), 2)
+        self.assertEqual(len(filtered.json()), 1)
+        self.assertNotEqual(everything['ETag'], filtered['ETag'])
+
+
+class StructuredLoggingTests(APITestCase):
+    def test_request_id_is_echoed_and_attached_to_records(self):
+        url = reverse('admin_app:admin_api_register_patient')
+        with self.assertLogs('admin_app.views', 'INFO') as logs:
+            response = self.client.post(
+                url, {'username': 'log_probe', 'password': 'secret-value', 'gender': 'Male'},
+                format='json', HTTP_X_REQUEST_ID='req-123',
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response['X-Request-ID'], 'req-123')
+        record = logs.records[-1]
+        entry = json.loads(JSONFormatter().format(record))
+        self.assertEqual(entry['request_id'], 'req-123')
+        self.assertEqual(entry['message'], 'Patient registration rejected')
+        self.assertIn('first_name', entry['invalid_fields'])
+        self.assertNotIn('secret-value', json.dumps(entry))
+
+    def test_unusable_request_ids_are_replaced(self):
+        response = self.client.get(reverse('api_root'), HTTP_X_REQUEST_ID='not a valid id\n')
+        self.assertRegex(response['X-Request-ID'], r'^[0-9a-f]{32}$')
+
+    def test_sampling_limits_each_call_site_but_keeps_warnings(self):
+        sampler = SamplingFilter(rate=1, burst=2)
+        logger = logging.getLogger('hms.tests.sampling')
+
+        def make(level, msg):
+            return logger.makeRecord(logger.name, level, __file__, 0, msg, (), None)
+
+        with mock.patch('hms.log.time.monotonic', return_value=100.0):
+            passed = [sampler.filter(make(logging.INFO, 'hot path %s')) for _ in range(5)]
+            self.assertEqual(passed, [True, True, False, False, False])
+            self.assertTrue(sampler.filter(make(logging.INFO, 'another call site')))
+            self.assertTrue(sampler.filter(make(logging.WARNING, 'hot path %s')))
+        with mock.patch('hms.log.time.monotonic', return_value=101.0):
+            record = make(logging.INFO, 'hot path %s')
+            self.assertTrue(sampler.filter(record))
+        self.assertEqual(record.suppressed, 3)
+
+    def test_queued_records_keep_their_exception_and_request_id(self):
+        stream = StringIO()
+        target = logging.StreamHandler(stream)
+        target.setFormatter(JSONFormatter())
+        records = queue.SimpleQueue()
+        listener = QueueListener(records, target)
+        logger = logging.getLogger('hms.tests.queued')
+        logger.addHandler(NonBlockingHandler(records))
+        logger.propagate = False
+        self.addCleanup(logger.handlers.clear)
+        token = request_id_var.set('queued-1')
+        listener.start()
+        try:
+            try:
+                raise ValueError('boom')
+            except ValueError:
+                logger.exception("Failed for %s", 'user 7', extra={'user_id': 7})
+        finally:
+            request_id_var.reset(token)
+            listener.stop()
+
+        entry = json.loads(stream.getvalue())
+        self.assertEqual(entry['message'], 'Failed for user 7')
+        self.assertEqual((entry['request_id'], entry['user_id']), ('queued-1', 7))
+        self.assertIn('ValueError: boom', entry['exc_info'])
+
+
+class PerformanceMetricsTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Doctor.objects.create(first_name='Metric', last_name='One', specialization='General', department='OPD')
+
+    def setUp(self):
+        # Start from a cold response cache so the doctor list hits the database
+        cache.clear()
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    def test_requests_are_recorded_per_view(self):
+        self.client.get(reverse('doctor-list'))
+        self.client.get(reverse('doctor-list'))
+
+        body = self.client.get(reverse('api_metrics')).content.decode()
+        labels = '{view="DoctorProfileViewSet.list",method="GET"}'
+        self.assertIn(f'http_request_duration_seconds_count{labels} 2', body)
+        self.assertIn('http_requests_total{view="DoctorProfileViewSet.list",method="GET",status="200"} 2', body)
+        self.assertIn('http_request_duration_seconds_bucket{view="DoctorProfileViewSet.list",method="GET",le="+Inf"} 2', body)
+        samples = dict(line.rsplit(' ', 1) for line in body.splitlines() if not line.startswith('#'))
+        self.assertGreater(float(samples[f'http_request_db_queries_sum{labels}']), 0)
+        self.assertGreater(float(samples[f'http_request_serializer_duration_seconds_sum{labels}']), 0)
+        self.assertGreater(float(samples[f'http_response_size_bytes_sum{labels}']), 0)
+
+        performance = self.client.get(reverse('api_diagnostics')).json()['performance']
+        self.assertEqual(performance['DoctorProfileViewSet.list']['count'], 2)
+        self.assertLessEqual(
+            performance['DoctorProfileViewSet.list']['p50_ms'], performance['DoctorProfileViewSet.list']['p99_ms']
+        )
+
+    def test_slow_requests_are_logged_with_their_top_queries(self):
+        with self.settings(PERF_SLOW_REQUEST_MS=0, PERF_SLOW_REQUEST_TOP_QUERIES=1):
+            with self.assertLogs('hms.middleware', 'WARNING') as logs:
+                self.client.get(reverse('doctor-list'))
+
+        record = logs.records[-1]
+        self.assertEqual(record.view, 'DoctorProfileViewSet.list')
+        self.assertGreaterEqual(record.db_queries, 1)
+        self.assertEqual(len(record.top_queries), 1)
+        self.assertIn('hms_doctor', record.top_queries[0]['sql'])
+
+
+class HealthProbeTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Doctor.objects.create(first_name='Probe', last_name='Doc', specialization='General', department='OPD')
+        Patient.objects.create(
+            reg_num='2040001', first_name='Probe', last_name='Patient', gender='Male', date_of_birth=date(1990, 1, 1)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_liveness_does_not_touch_the_database(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('api_health_live'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_readiness_runs_one_query_and_reports_failures(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('api_health_ready'))
+        self.assertEqual((response.status_code, response.json()['status']), (200, 'ready'))
+
+        with mock.patch('hms.health.check_database', return_value='connection refused'):
+            response = self.client.get(reverse('api_health_ready'))
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response.json()['database'], 'connection refused')
+
+    def test_diagnostics_serves_cached_counts(self):
+        first = self.client.get(reverse('api_diagnostics')).json()
+        self.assertEqual((first['models']['doctors'], first['models']['patients']), (1, 1))
+        self.assertTrue(first['database']['models_have_data'])
+
+        Doctor.objects.create(first_name='Second', last_name='Doc', specialization='General', department='OPD')
+        with self.assertNumQueries(1):
+            second = self.client.get(reverse('api_diagnostics')).json()
+        self.assertEqual(second['models']['doctors'], 1)
+        self.assertEqual(second['counts']['generated_at'], first['counts']['generated_at'])
+
+    def test_stale_snapshot_is_refreshed_by_one_request(self):
+        from task_queue.models import Task
+        from .health import REFRESH_LOCK_KEY
+
+        self.client.get(reverse('api_diagnostics'))
+        Doctor.objects.create(first_name='Second', last_name='Doc', specialization='General', department='OPD')
+        with self.settings(DIAGNOSTICS_SNAPSHOT_TTL=0):
+            # Another request is already refreshing: serve the stale copy
+            cache.add(REFRESH_LOCK_KEY, True)
+            stale = self.client.get(reverse('api_diagnostics')).json()
+            cache.delete(REFRESH_LOCK_KEY)
+            refreshed = self.client.get(reverse('api_diagnostics')).json()
+        self.assertEqual(stale['models']['doctors'], 1)
+        self.assertEqual(refreshed['models']['doctors'], 2)
+        self.assertIsNone(cache.get(REFRESH_LOCK_KEY))
+        self.assertFalse(Task.objects.exists())
+
+    def test_counts_report_per_table_whether_they_are_estimated(self):
+        from .health import COUNTED_MODELS
+
+        first = self.client.get(reverse('api_diagnostics')).json()
+        # SQLite has no planner estimates, so every count is exact
+        self.assertEqual(first['counts']['estimated'], {key: False for key in COUNTED_MODELS})
+
+
+class ConnectionPoolMetricsTests(APITestCase):
+    POOL = {
+        'min_size': 2, 'max_size': 10, 'size': 5, 'in_use': 3, 'available': 2,
+        'waiting': 12, 'requests': 40, 'wait_ms': 1500, 'timeouts': 4,
+    }
+
+    def setUp(self):
+        patcher = mock.patch('hms.health.pool_status', side_effect=lambda alias='default': self.POOL)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_metrics_need_staff_or_an_allowed_address(self):
+        url = reverse('api_metrics')
+        with self.settings(METRICS_ALLOWED_IPS=['10.0.0.5']):
+            self.assertEqual(self.client.get(url, REMOTE_ADDR='203.0.113.9').status_code, 403)
+            self.assertEqual(self.client.get(url, REMOTE_ADDR='10.0.0.5').status_code, 200)
+            staff = User.objects.create_user(username='metrics_staff', password='password123', is_staff=True)
+            self.client.force_login(staff)
+            self.assertEqual(self.client.get(url, REMOTE_ADDR='203.0.113.9').status_code, 200)
+
+    def test_pool_statistics_are_exported(self):
+        body = self.client.get(reverse('api_metrics')).content.decode()
+
+        self.assertIn('db_pool_connections{alias="default",state="in_use"} 3', body)
+        self.assertIn('db_pool_connections{alias="default",state="idle"} 2', body)
+        self.assertIn('db_pool_requests_waiting{alias="default"} 12', body)
+        self.assertIn('db_pool_timeouts_total{alias="default"} 4', body)
+        self.assertIn('db_pool_wait_seconds_total{alias="default"} 1.5', body)
+
+    def test_saturated_pool_fails_readiness(self):
+        with self.settings(HEALTH_POOL_MAX_WAITING=10):
+            response = self.client.get(reverse('api_health_ready'))
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response.json()['pool']['in_use'], 3)
+
+
+from .search import local_index
+
+
+class PatientSearchTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(username='front.desk', password='password123')
+        Receptionist.objects.create(user=cls.staff, first_name='Front', last_name='Desk')
+        account = User.objects.create_user(username='2024100', password='password123', first_name='Ayesha')
+        for reg_num, first_name, last_name, phone, user in [
+            ('2024100', 'Ayesha', 'Siddiqui', '0300-1234567', account),
+            ('2024101', 'Ali', 'Raza', '0312-7654321', None),
+            ('2024102', 'Alina', 'Rashid', '', None),
+            ('2024103', 'Bilal', 'Ahmed', '', None),
+        ]:
+            Patient.objects.create(
+                reg_num=reg_num, first_name=first_name, last_name=last_name, contact_number=phone,
+                user=user, gender='Female', date_of_birth=date(2000, 1, 1),
+            )
+        cls.url = reverse('hms-patient-search')
+
+    def setUp(self):
+        local_index.invalidate()
+        self.client.force_authenticate(user=self.staff)
+
+    def _search(self, q, **params):
+        response = self.client.get(self.url, {'q': q, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [row['reg_num'] for row in response.data['results']]
+
+    def test_prefix_and_substring_matches(self):
+        self.assertEqual(set(self._search('ali')), {'2024101', '2024102'})
+        self.assertEqual(self._search('ali raz')[0], '2024101')
+        self.assertEqual(self._search('iddiq'), ['2024100'])
+
+    def test_fuzzy_match_tolerates_typos(self):
+        self.assertEqual(self._search('siddiqi'), ['2024100'])
+        self.assertEqual(self._search('bilall')[0], '2024103')
+
+    def test_phone_and_exact_reg_num(self):
+        self.assertEqual(self._search('0300 1234567'), ['2024100'])
+        results = self._search('2024101')
+        self.assertEqual(results[0], '2024101')
+        self.assertEqual(len(self._search('20241', limit=2)), 2)
+
+    def test_renaming_the_login_account_reindexes(self):
+        account = User.objects.get(username='2024100')
+        account.last_name = 'Qureshi'
+        account.save()
+        self.assertEqual(self._search('qureshi'), ['2024100'])
+
+    def test_only_staff_can_search(self):
+        # The login account of a patient record
+        self.client.force_authenticate(user=User.objects.get(username='2024100'))
+        self.assertEqual(self.client.get(self.url, {'q': 'ali'}).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_short_query_is_rejected(self):
+        response = self.client.get(self.url, {'q': 'a'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('q', response.data)
+
+
+import unittest
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.test import TransactionTestCase
+from rest_framework.test import APIClient
+
+from . import replicas
+
+
+@override_settings(DB_REPLICA_ALIAS='replica', DB_REPLICA_MAX_LAG=5.0)
+class ReplicaRoutingTests(TransactionTestCase):
+    # Routing decisions only; the 'replica' alias is never queried here
+    NEW_PATIENT = {
+        'reg_num': '2025900', 'first_name': 'New', 'last_name': 'Patient',
+        'gender': 'Male', 'date_of_birth': '2000-01-01',
+    }
+
+    def setUp(self):
+        cache.clear()
+        replicas.monitor.clear()
+        patcher = mock.patch('hms.replicas.measure_lag', return_value=0.5)
+        self.measure_lag = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user(username='reader', password='password123')
+        self.request = mock.Mock(user=self.user)
+
+    def _read_alias(self, request=None):
+        with replicas.use_replica(request or self.request):
+            return Patient.objects.all().db
+
+    def test_reads_go_to_the_replica_only_where_allowed(self):
+        self.assertEqual(Patient.objects.all().db, 'default')
+        self.assertEqual(self._read_alias(), 'replica')
+        with replicas.use_replica(self.request):
+            with transaction.atomic():
+                self.assertEqual(Patient.objects.all().db, 'default')
+
+    def test_writes_pin_the_rest_of_the_request_to_the_primary(self):
+        with replicas.use_replica(self.request) as alias:
+            self.assertEqual(alias, 'replica')
+            doctor = Doctor.objects.create(first_name='Read', last_name='Write', specialization='ENT', department='OPD')
+            self.assertEqual(Doctor.objects.all().db, 'default')
+            self.assertEqual(doctor._state.db, 'default')
+
+    def test_user_stays_on_the_primary_after_writing(self):
+        replicas.pin(self.user)
+        self.assertEqual(self._read_alias(), 'default')
+        self.assertEqual(self._read_alias(mock.Mock(user=User.objects.create_user(username='other'))), 'replica')
+        with self.settings(DB_READ_YOUR_WRITES_SECONDS=0):
+            self.assertEqual(self._read_alias(), 'replica')
+
+    def test_lagging_or_unreachable_replica_falls_back_to_the_primary(self):
+        self.measure_lag.return_value = 30.0
+        self.assertEqual(self._read_alias(), 'default')
+        self.assertEqual(replicas.monitor.status('replica'), 30.0)
+
+        replicas.monitor.clear()
+        self.measure_lag.side_effect = DatabaseError('connection refused')
+        self.assertEqual(self._read_alias(), 'default')
+
+    def test_lag_is_measured_once_per_interval(self):
+        with self.settings(DB_REPLICA_LAG_CHECK_INTERVAL=60):
+            for _ in range(3):
+                self._read_alias()
+        self.assertEqual(self.measure_lag.call_count, 1)
+
+    def test_replica_is_never_migrated(self):
+        router = replicas.ReplicaRouter()
+        self.assertFalse(router.allow_migrate('replica', 'hms'))
+        self.assertIsNone(router.allow_migrate('default', 'hms'))
+
+    def test_list_views_read_from_the_replica_until_the_user_writes(self):
+        seen = []
+        original = replicas.read_alias_for
+
+        def record(request=None):
+            seen.append(original(request))
+            return None  # the replica alias does not exist in this test database
+
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        with mock.patch('hms.replicas.read_alias_for', side_effect=record):
+            client.get(reverse('lab-test-list'))
+            created = client.post(reverse('hms-patient-list'), self.NEW_PATIENT)
+            client.get(reverse('lab-test-list'))
+        self.assertEqual(created.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(seen, ['replica', None])
+
+
+@unittest.skipUnless(settings.DB_REPLICA_ALIAS, 'set DB_REPLICA_HOST to test against a replica alias')
+class ReplicaQueryTests(TransactionTestCase):
+    # With DB_REPLICA_HOST pointing at the primary, 'replica' is a second
+    # alias (a test mirror) on the same database
+    databases = {'default', settings.DB_REPLICA_ALIAS or 'default'}
+    client_class = APIClient
+
+    def setUp(self):
+        cache.clear()
+        replicas.monitor.clear()
+        self.user = User.objects.create_user(username='replica.reader', password='password123')
+        self.client.force_authenticate(user=self.user)
+
+    def test_list_queries_run_on_the_replica(self):
+        replica = connections[settings.DB_REPLICA_ALIAS]
+        with CaptureQueriesContext(replica) as ctx:
+            response = self.client.get(reverse('lab-test-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(ctx.captured_queries)
+
+        self.client.post(reverse('hms-patient-list'), ReplicaRoutingTests.NEW_PATIENT)
+        with CaptureQueriesContext(replica) as ctx:
+            self.client.get(reverse('lab-test-list'))
+        self.assertEqual(ctx.captured_queries, [])
+
+
+from datetime import datetime
+
+from django.core.management.base import CommandError
+
+from .health import estimated_counts
+from .partitioning import create_partition_sql, detach_partition_sql, partition_references, plan_partitions
+
+
+class PartitioningTests(APITestCase):
+    def test_plan_creates_upcoming_months_and_detaches_expired_ones(self):
+        existing = [date(2026, 8, 1), date(2026, 9, 1), date(2026, 10, 1)]
+        create, detach = plan_partitions(existing, date(2026, 10, 17), ahead=3, retain=2)
+        self.assertEqual(create, [date(2026, 11, 1), date(2026, 12, 1), date(2027, 1, 1)])
+        self.assertEqual(detach, [date(2026, 8, 1)])
+        self.assertEqual(plan_partitions(existing, date(2026, 10, 17), ahead=0, retain=0), ([], []))
+
+    def test_partition_sql_moves_stray_rows_before_attaching(self):
+        create = create_partition_sql(Appointment, date(2026, 12, 5))
+        self.assertIn('CREATE TABLE "hms_appointment_p202612" (LIKE "hms_appointment"', create[0])
+        self.assertIn('DELETE FROM "hms_appointment_pdefault"', create[1])
+        self.assertTrue(create[2].endswith(
+            "FOR VALUES FROM ('2026-12-01 00:00:00+00') TO ('2027-01-01 00:00:00+00')"
+        ))
+        detach = detach_partition_sql(PatientAppointment, date(2026, 1, 1), archive_schema='archive')
+        self.assertEqual(detach[-1], 'ALTER TABLE "patient_app_appointment_p202601" SET SCHEMA "archive"')
+
+    def test_month_and_day_filters_are_ranges(self):
+        patient = Patient.objects.create(
+            reg_num='2026500', first_name='Range', last_name='Query', gender='Male', date_of_birth=date(2000, 1, 1)
+        )
+        doctor = Doctor.objects.create(first_name='Range', last_name='Doc', specialization='ENT', department='OPD')
+        for day in (date(2026, 10, 31), date(2026, 11, 1)):
+            Appointment.objects.create(
+                patient=patient, doctor=doctor, reason='Checkup',
+                appointment_date=timezone.make_aware(datetime(day.year, day.month, day.day)),
+            )
+        october = Appointment.objects.in_month(2026, 10)
+        self.assertEqual(october.count(), 1)
+        self.assertEqual(Appointment.objects.on_day(date(2026, 11, 1)).count(), 1)
+        # Casting the column (as __date does) would keep PostgreSQL from pruning partitions
+        self.assertNotIn('cast_date', str(october.query))
+
+    def test_partitions_still_referenced_are_reported(self):
+        patient = Patient.objects.create(
+            reg_num='2026502', first_name='Old', last_name='Bill', gender='Male', date_of_birth=date(2000, 1, 1)
+        )
+        doctor = Doctor.objects.create(first_name='Old', last_name='Doc', specialization='ENT', department='OPD')
+        appointment = Appointment.objects.create(
+            patient=patient, doctor=doctor, reason='Checkup',
+            appointment_date=timezone.make_aware(datetime(2025, 3, 10)),
+        )
+        bill = Billing.objects.create(patient=patient, appointment=appointment, amount=100)
+
+        self.assertEqual(partition_references(connection, Appointment, date(2025, 3, 1)), ['hms.Billing.appointment'])
+        self.assertEqual(partition_references(connection, Appointment, date(2025, 4, 1)), [])
+        bill.delete()
+        self.assertEqual(partition_references(connection, Appointment, date(2025, 3, 1)), [])
+
+    def test_command_needs_postgresql(self):
+        with self.assertRaisesMessage(CommandError, 'PostgreSQL'):
+            call_command('manage_partitions', stdout=StringIO())
+
+    @unittest.skipUnless(connection.vendor == 'postgresql', 'partitioned tables need PostgreSQL')
+    def test_counts_of_partitioned_tables_are_estimated_from_their_partitions(self):
+        patient = Patient.objects.create(
+            reg_num='2026501', first_name='Estimate', last_name='Count', gender='Male', date_of_birth=date(2000, 1, 1)
+        )
+        doctor = Doctor.objects.create(first_name='Estimate', last_name='Doc', specialization='ENT', department='OPD')
+        for day in (date(2026, 10, 1), date(2026, 11, 1)):
+            Appointment.objects.create(
+                patient=patient, doctor=doctor, reason='Checkup',
+                appointment_date=timezone.make_aware(datetime(day.year, day.month, day.day)),
+            )
+        with connection.cursor() as cursor:
+            # Analyzes the partitions; autovacuum never analyzes the parent
+            cursor.execute(f'ANALYZE "{Appointment._meta.db_table}"')
+
+        with CaptureQueriesContext(connection) as ctx:
+            counts, estimated = estimated_counts()
+        self.assertTrue(estimated)
+        self.assertEqual(counts['appointments'], 2)
+        table = Appointment._meta.db_table
+        self.assertFalse([q for q in ctx.captured_queries if 'COUNT(*)' in q['sql'] and table in q['sql']])
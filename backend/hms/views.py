@@ -1,5 +1,9 @@
+from django.conf import settings
 from django.shortcuts import render
 from rest_framework import viewsets, permissions
+from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.response import Response
 from .models import Appointment, LabTestOrder, Patient, Doctor, Billing, Receptionist
 from .serializers import (
     AppointmentSerializer, 
@@ -9,30 +13,64 @@ from .serializers import (
     BillingSerializer,
     ReceptionistSerializer
 )
+from .caching import DOCTORS, CachedResponseMixin
+from .pagination import TimeCursorPagination
+from .replicas import ReplicaReadMixin
+from .roles import ADMIN, DOCTOR, RECEPTIONIST, get_role
+from .search import search_patients
 
 # Create your views here.
 
-class AppointmentViewSet(viewsets.ModelViewSet):
+class AppointmentViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     queryset = Appointment.objects.all()
     serializer_class = AppointmentSerializer
     permission_classes = [permissions.IsAuthenticated]
 
-class LabTestViewSet(viewsets.ModelViewSet):
-    queryset = LabTestOrder.objects.all()
+class LabTestViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
+    queryset = LabTestOrder.objects.select_related('doctor', 'patient')
     serializer_class = LabTestOrderSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = TimeCursorPagination
+    cursor_ordering = ('-requested_at', '-id')
 
-class PatientViewSet(viewsets.ModelViewSet):
+class PatientViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     queryset = Patient.objects.all()
     serializer_class = PatientSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = TimeCursorPagination
+    cursor_ordering = ('-registration_date', '-patient_id')
+    replica_actions = ('list', 'retrieve', 'search')
 
-class DoctorViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Ranked patient lookup by name, reg number, phone or email (see hms.search).
+        ?q= is the search text (at least 2 characters), ?limit= the number of results.
+        """
+        if get_role(request.user) not in (ADMIN, RECEPTIONIST, DOCTOR):
+            raise PermissionDenied("Only hospital staff can search patients.")
+        query = request.query_params.get('q', '').strip()
+        if len(query) < 2:
+            raise ValidationError({'q': ['Enter at least 2 characters to search.']})
+        try:
+            limit = int(request.query_params.get('limit', settings.PATIENT_SEARCH_LIMIT))
+        except ValueError:
+            raise ValidationError({'limit': ['Must be a whole number.']})
+        limit = min(max(limit, 1), settings.PATIENT_SEARCH_MAX_LIMIT)
+
+        patients = search_patients(query[:100], limit)
+        results = self.get_serializer(patients, many=True).data
+        for patient, item in zip(patients, results):
+            item['score'] = round(patient.score, 4)
+        return Response({'query': query, 'count': len(results), 'results': results})
+
+class DoctorViewSet(CachedResponseMixin, viewsets.ModelViewSet):
+    cache_namespaces = (DOCTORS,)
     queryset = Doctor.objects.all()
     serializer_class = DoctorSerializer
     permission_classes = [permissions.IsAuthenticated]
 
-class BillingViewSet(viewsets.ModelViewSet):
+class BillingViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     queryset = Billing.objects.all()
     serializer_class = BillingSerializer
     permission_classes = [permissions.IsAuthenticated]
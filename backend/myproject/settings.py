@@ -47,11 +47,14 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',  # Trigram and full-text lookups for patient search
     'hms',         # Core HMS app for models
     'doctor_app',      # Doctor features
     'patient_app',     # Patient features
     'receptionist_app', # Receptionist features
     'admin_app',       # Administrator features
+    'task_queue',      # Database-backed background tasks
+    'archive',         # Closed appointments and lab orders moved out of the hot tables
     'auditlog',
     'rest_framework',  # Django REST framework for APIs
     'corsheaders',     # CORS headers for API
@@ -59,11 +62,15 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware', # CORS middleware (must be at the top)
+    'hms.log.RequestIdMiddleware',  # Request ids for log correlation
+    'hms.middleware.PerformanceMiddleware',  # Per-view timings for /api/metrics/
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'hms.replicas.ReplicaMiddleware',  # Read-your-writes pinning for replica reads
+    'hms.middleware.SessionRefreshMiddleware',  # Renews sessions without a write per request
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -92,6 +99,21 @@ WSGI_APPLICATION = 'myproject.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Connection reuse: DB_CONN_MAX_AGE is how many seconds a connection is kept
+# open across requests (0 closes it after every request); health checks
+# replace connections that died while idle before they are used
+DB_CONN_MAX_AGE = env.int('DB_CONN_MAX_AGE', default=60)
+DB_CONN_HEALTH_CHECKS = env.bool('DB_CONN_HEALTH_CHECKS', default=True)
+# Pooled mode: each process shares a psycopg 3 connection pool (needs the
+# psycopg and psycopg-pool packages) instead of one connection per thread.
+# DB_POOL_TIMEOUT is how many seconds a request waits for a free connection
+DB_POOL = env.bool('DB_POOL', default=False)
+DB_POOL_MIN_SIZE = env.int('DB_POOL_MIN_SIZE', default=2)
+DB_POOL_MAX_SIZE = env.int('DB_POOL_MAX_SIZE', default=10)
+DB_POOL_TIMEOUT = env.float('DB_POOL_TIMEOUT', default=10.0)
+DB_POOL_MAX_IDLE = env.float('DB_POOL_MAX_IDLE', default=300.0)
+DB_POOL_MAX_LIFETIME = env.float('DB_POOL_MAX_LIFETIME', default=3600.0)
+
 DATABASES = {
      'default': {
         'ENGINE': env('DATABASE_ENGINE', default='django.db.backends.postgresql_psycopg2'),
@@ -100,9 +122,59 @@ DATABASES = {
         'PASSWORD': env('DB_PASSWORD', default=''),
         'HOST': env('DB_HOST', default='localhost'),
         'PORT': env('DB_PORT', default='5432'),
+        # The pool owns connection lifetimes, and Django refuses persistent connections with it
+        'CONN_MAX_AGE': 0 if DB_POOL else DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': DB_CONN_HEALTH_CHECKS,
+        'OPTIONS': {
+            'pool': {
+                'min_size': DB_POOL_MIN_SIZE,
+                'max_size': DB_POOL_MAX_SIZE,
+                'timeout': DB_POOL_TIMEOUT,
+                'max_idle': DB_POOL_MAX_IDLE,
+                'max_lifetime': DB_POOL_MAX_LIFETIME,
+            },
+        } if DB_POOL else {},
     }
 }
 
+# Read replica: DB_REPLICA_HOST adds a DB_REPLICA_ALIAS database with the
+# primary's credentials, and hms.replicas.ReplicaRouter sends list/detail
+# API reads and reports to it. After writing, a user reads from the primary
+# for DB_READ_YOUR_WRITES_SECONDS; keep that above DB_REPLICA_MAX_LAG, the
+# replay lag in seconds beyond which all reads fall back to the primary
+DB_REPLICA_HOST = env('DB_REPLICA_HOST', default='')
+DB_REPLICA_ALIAS = env('DB_REPLICA_ALIAS', default='replica') if DB_REPLICA_HOST else ''
+DB_READ_YOUR_WRITES_SECONDS = env.int('DB_READ_YOUR_WRITES_SECONDS', default=10)
+DB_REPLICA_MAX_LAG = env.float('DB_REPLICA_MAX_LAG', default=5.0)
+DB_REPLICA_LAG_CHECK_INTERVAL = env.float('DB_REPLICA_LAG_CHECK_INTERVAL', default=5.0)
+
+if DB_REPLICA_ALIAS:
+    DATABASES[DB_REPLICA_ALIAS] = {
+        **DATABASES['default'],
+        'HOST': DB_REPLICA_HOST,
+        'PORT': env('DB_REPLICA_PORT', default=DATABASES['default']['PORT']),
+        # Tests read through the replica alias from the primary's test database
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['hms.replicas.ReplicaRouter']
+
+# Monthly partitions of the appointment and audit log tables on PostgreSQL
+# (see hms.partitioning): manage_partitions keeps PARTITION_MONTHS_AHEAD
+# future months ready and detaches partitions older than
+# PARTITION_RETENTION_MONTHS (0 keeps every month) into the
+# PARTITION_ARCHIVE_SCHEMA schema
+PARTITION_MONTHS_AHEAD = env.int('PARTITION_MONTHS_AHEAD', default=3)
+PARTITION_RETENTION_MONTHS = env.int('PARTITION_RETENTION_MONTHS', default=0)
+PARTITION_ARCHIVE_SCHEMA = env('PARTITION_ARCHIVE_SCHEMA', default='archive')
+
+# archive_records moves closed rows older than ARCHIVE_OLDER_THAN (e.g.
+# 365d, 18m, 2y) out of the hot tables, ARCHIVE_BATCH_SIZE rows per
+# transaction; --to jsonl writes them under ARCHIVE_DIR
+ARCHIVE_OLDER_THAN = env('ARCHIVE_OLDER_THAN', default='2y')
+ARCHIVE_BATCH_SIZE = env.int('ARCHIVE_BATCH_SIZE', default=1000)
+ARCHIVE_DIR = env('ARCHIVE_DIR', default=os.path.join(BASE_DIR, 'archive_files'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -140,6 +212,26 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Uploaded documents. MEDIA_ROOT defaults to the project directory, where
+# FileField uploads have always been written (see patient_app.documents)
+MEDIA_ROOT = env('MEDIA_ROOT', default=str(BASE_DIR))
+MEDIA_URL = 'media/'
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    # Medical record and lab result documents, deduplicated by SHA-256 (see patient_app.storage)
+    'documents': {'BACKEND': env('DOCUMENT_STORAGE_BACKEND', default='patient_app.storage.ContentAddressedStorage')},
+}
+# Unreferenced document files are kept this long before gc_documents deletes them
+DOCUMENT_GC_GRACE_HOURS = env.int('DOCUMENT_GC_GRACE_HOURS', default=24)
+DOCUMENT_MAX_UPLOAD_SIZE = env.int('DOCUMENT_MAX_UPLOAD_SIZE', default=100 * 1024 * 1024)
+DOCUMENT_CHUNK_SIZE = env.int('DOCUMENT_CHUNK_SIZE', default=64 * 1024)
+# Empty to stream downloads from Django, 'x-accel-redirect' (nginx, with an
+# internal location at DOCUMENT_SENDFILE_PREFIX aliased to MEDIA_ROOT) or
+# 'x-sendfile' (Apache mod_xsendfile, lighttpd) to let the proxy send the file
+DOCUMENT_SENDFILE_MODE = env('DOCUMENT_SENDFILE_MODE', default='')
+DOCUMENT_SENDFILE_PREFIX = env('DOCUMENT_SENDFILE_PREFIX', default='/protected-media/')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -150,11 +242,35 @@ LOGIN_URL = '/login/'  # URL where requests are redirected for login
 LOGIN_REDIRECT_URL = '/doctor/profile/'  # Default redirect after login
 LOGOUT_REDIRECT_URL = '/login/'  # Where to redirect after logout
 
+# Caches: local memory by default, set CACHE_URL=redis://host:6379/1 to share
+# the cache between processes (requires the redis package)
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+
 # Session settings
+# SESSION_ENGINE may be django.contrib.sessions.backends.cached_db (sessions
+# read from the cache, written through to the database) or
+# django.contrib.sessions.backends.signed_cookies (no server-side storage)
+SESSION_ENGINE = env('SESSION_ENGINE', default='django.contrib.sessions.backends.db')
 SESSION_COOKIE_AGE = 1209600  # 2 weeks in seconds (optional)
-SESSION_SAVE_EVERY_REQUEST = True  # Helps keep session alive
+# Saving on every request writes the session store on every read; instead
+# SessionRefreshMiddleware renews active sessions once per refresh interval
+SESSION_SAVE_EVERY_REQUEST = env.bool('SESSION_SAVE_EVERY_REQUEST', default=False)
+SESSION_REFRESH_INTERVAL = env.int('SESSION_REFRESH_INTERVAL', default=3600)
 SESSION_EXPIRE_AT_BROWSER_CLOSE = False  # Persistent sessions
 
+# Role/profile resolution cache (see hms.roles): shared cache alias and TTL,
+# plus the size and TTL of the per-process LRU in front of it
+ROLE_CACHE_ALIAS = env('ROLE_CACHE_ALIAS', default='default')
+ROLE_CACHE_TTL = env.int('ROLE_CACHE_TTL', default=300)
+ROLE_CACHE_LOCAL_SIZE = env.int('ROLE_CACHE_LOCAL_SIZE', default=1024)
+ROLE_CACHE_LOCAL_TTL = env.int('ROLE_CACHE_LOCAL_TTL', default=30)
+
+# Versioned response cache for the doctor directory and schedules (see hms.caching)
+API_CACHE_ALIAS = env('API_CACHE_ALIAS', default='default')
+API_CACHE_TTL = env.int('API_CACHE_TTL', default=600)
+
 # REST Framework and CORS settings
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
@@ -166,6 +282,107 @@ REST_FRAMEWORK = {
     ]
 }
 
+# Cursor pagination for the large list endpoints (see hms.pagination).
+# Clients may override the page size with ?page_size= up to the maximum.
+API_PAGE_SIZE = env.int('API_PAGE_SIZE', default=50)
+API_MAX_PAGE_SIZE = env.int('API_MAX_PAGE_SIZE', default=200)
+
+# Length of one bookable slot within a DoctorSchedule window (see doctor_app.availability)
+APPOINTMENT_SLOT_MINUTES = env.int('APPOINTMENT_SLOT_MINUTES', default=30)
+# Active appointments one slot may hold (enforced by patient_app.booking)
+APPOINTMENT_SLOT_CAPACITY = env.int('APPOINTMENT_SLOT_CAPACITY', default=1)
+
+# Doctor daily schedules (see doctor_app.schedule): length of the time blocks
+# appointments are grouped into, and how long a cached (doctor, day) entry
+# lives at most; saving or deleting an appointment drops its entry earlier
+SCHEDULE_BLOCK_MINUTES = env.int('SCHEDULE_BLOCK_MINUTES', default=60)
+SCHEDULE_CACHE_TTL = env.int('SCHEDULE_CACHE_TTL', default=3600)
+
+# Patient search (see hms.search): results per request by default and at
+# most, and how many matching rows PostgreSQL ranks to pick them from
+PATIENT_SEARCH_LIMIT = env.int('PATIENT_SEARCH_LIMIT', default=20)
+PATIENT_SEARCH_MAX_LIMIT = env.int('PATIENT_SEARCH_MAX_LIMIT', default=100)
+PATIENT_SEARCH_CANDIDATES = env.int('PATIENT_SEARCH_CANDIDATES', default=500)
+
+# Background tasks (see task_queue): run workers with manage.py run_workers.
+# TASK_QUEUE_EAGER runs tasks in-process after commit instead, e.g. in development
+TASK_QUEUE_EAGER = env.bool('TASK_QUEUE_EAGER', default=False)
+TASK_QUEUE_POLL_INTERVAL = env.float('TASK_QUEUE_POLL_INTERVAL', default=1.0)
+TASK_QUEUE_LEASE_SECONDS = env.int('TASK_QUEUE_LEASE_SECONDS', default=300)
+TASK_QUEUE_RETRY_BACKOFF = env.int('TASK_QUEUE_RETRY_BACKOFF', default=10)
+TASK_QUEUE_MAX_BACKOFF = env.int('TASK_QUEUE_MAX_BACKOFF', default=3600)
+TASK_QUEUE_RETENTION_DAYS = env.int('TASK_QUEUE_RETENTION_DAYS', default=7)
+
+# Seconds between the queued rebuilds of the admin statistics counters (see
+# admin_app.statistics); 0 leaves them to manage.py refresh_statistics
+STATISTICS_RECONCILE_SECONDS = env.int('STATISTICS_RECONCILE_SECONDS', default=86400)
+
+# Logging (see hms.log): JSON lines by default, LOG_FORMAT=text for local
+# development. LOG_LEVELS sets per-logger levels, e.g.
+# LOG_LEVELS=django.db.backends=DEBUG,admin_app=WARNING
+LOG_LEVEL = env('LOG_LEVEL', default='INFO')
+LOG_LEVELS = env.dict('LOG_LEVELS', default={})
+LOG_FORMAT = env('LOG_FORMAT', default='json')
+# Records per second each call site may log below WARNING (0 disables sampling)
+LOG_SAMPLE_RATE = env.float('LOG_SAMPLE_RATE', default=20)
+LOG_SAMPLE_BURST = env.int('LOG_SAMPLE_BURST', default=100)
+# Hand records to a background thread so requests never wait on log output
+LOGGING_ASYNC = env.bool('LOGGING_ASYNC', default=True)
+LOGGING_CONFIG = 'hms.log.configure'
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'()': 'hms.log.JSONFormatter'},
+        'text': {'format': '%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s'},
+    },
+    'filters': {
+        'sampled': {'()': 'hms.log.SamplingFilter', 'rate': LOG_SAMPLE_RATE, 'burst': LOG_SAMPLE_BURST},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': LOG_FORMAT, 'filters': ['sampled']},
+    },
+    'root': {'handlers': ['console'], 'level': LOG_LEVEL},
+    'loggers': {
+        'django': {'handlers': ['console'], 'level': LOG_LEVEL, 'propagate': False},
+    },
+}
+for _logger, _level in LOG_LEVELS.items():
+    LOGGING['loggers'].setdefault(_logger, {})['level'] = _level.upper()
+
+# Per-view request metrics (see hms.middleware.PerformanceMiddleware) served at
+# /api/metrics/. Requests slower than PERF_SLOW_REQUEST_MS are logged with
+# their slowest queries; PERF_LATENCY_WINDOW recent requests per view feed the
+# percentiles in /api/diagnostics/
+PERF_METRICS_ENABLED = env.bool('PERF_METRICS_ENABLED', default=True)
+PERF_SLOW_REQUEST_MS = env.int('PERF_SLOW_REQUEST_MS', default=1000)
+PERF_SLOW_REQUEST_TOP_QUERIES = env.int('PERF_SLOW_REQUEST_TOP_QUERIES', default=5)
+PERF_LATENCY_WINDOW = env.int('PERF_LATENCY_WINDOW', default=1000)
+# /api/metrics/ answers staff users and these client addresses (REMOTE_ADDR,
+# e.g. the Prometheus scraper) only
+METRICS_ALLOWED_IPS = env.list('METRICS_ALLOWED_IPS', default=['127.0.0.1', '::1'])
+
+# Health probes (see hms.health): diagnostics row counts are cached this many
+# seconds and refreshed in the background; readiness fails when more requests
+# than HEALTH_POOL_MAX_WAITING wait for a pooled connection (0 disables that check)
+DIAGNOSTICS_SNAPSHOT_TTL = env.int('DIAGNOSTICS_SNAPSHOT_TTL', default=60)
+HEALTH_POOL_MAX_WAITING = env.int('HEALTH_POOL_MAX_WAITING', default=10)
+
+# Delivery backend used by the send_appointment_reminders command (see patient_app.reminders)
+APPOINTMENT_REMINDER_BACKEND = env(
+    'APPOINTMENT_REMINDER_BACKEND', default='patient_app.reminders.ConsoleReminderBackend'
+)
+# A failed reminder is retried after REMINDER_RETRY_BACKOFF seconds, doubling
+# per attempt up to REMINDER_MAX_BACKOFF (see patient_app.reminders.retry_delay)
+REMINDER_RETRY_BACKOFF = env.int('REMINDER_RETRY_BACKOFF', default=60)
+REMINDER_MAX_BACKOFF = env.int('REMINDER_MAX_BACKOFF', default=3600)
+
+# Bulk patient import (see admin_app.bulk_import): rows per validation/insert
+# batch and processes the import_patients command uses to hash passwords (1
+# hashes in the calling process; the upload endpoint always does)
+BULK_IMPORT_BATCH_SIZE = env.int('BULK_IMPORT_BATCH_SIZE', default=500)
+BULK_IMPORT_HASH_WORKERS = env.int('BULK_IMPORT_HASH_WORKERS', default=os.cpu_count() or 1)
+
 CORS_ALLOWED_ORIGINS = [
     'http://localhost:3000',
     'http://127.0.0.1:3000',
@@ -194,7 +411,9 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'x-request-id',
 ]
+CORS_EXPOSE_HEADERS = ['x-request-id']
 
 # CSRF settings
 CSRF_TRUSTED_ORIGINS = [
@@ -3,20 +3,28 @@ from django.urls import path, include
 from django.contrib.auth.views import LoginView, LogoutView
 from rest_framework.routers import DefaultRouter
 from rest_framework.authtoken.views import obtain_auth_token
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt, ensure_csrf_cookie
 from django.contrib.auth import authenticate, login, logout
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 import json
+import logging
 import django
 from datetime import datetime
 from django.utils import timezone
+from django.conf import settings
 
 # Import ViewSets
 from patient_app.views import PatientProfileViewSet, AppointmentViewSet, MedicalRecordViewSet, PatientLabTestOrderViewSet
 from hms.views import LabTestViewSet, PatientViewSet, DoctorViewSet, ReceptionistViewSet
 from doctor_app.views import DoctorProfileViewSet, ScheduleViewSet, DoctorScheduleViewSet
+from admin_app.views import statistics_api
+from hms.roles import resolve_identity
+from hms.caching import stats as api_cache_stats
+from hms import health, metrics
+
+logger = logging.getLogger(__name__)
 
 class LogoutAllowGET(LogoutView):
     def get(self, request, *args, **kwargs):
@@ -36,6 +44,15 @@ router.register(r'patient-lab-tests', PatientLabTestOrderViewSet, basename='pati
 router.register(r'receptionists', ReceptionistViewSet, basename='receptionist')
 
 # Custom API views for authentication
+def doctor_user_data(identity):
+    return {
+        'userType': 'Doctor',
+        'doctorId': identity.doctor_id,
+        'fullName': f"{identity.doctor_first_name} {identity.doctor_last_name}",
+        'specialization': identity.doctor_specialization,
+        'department': identity.doctor_department
+    }
+
 @csrf_exempt
 @api_view(['POST'])
 def api_login(request):
@@ -67,19 +84,9 @@ def api_login(request):
                 'isSuperuser': user.is_superuser,
             })
             # Admin case takes precedence over other roles
-        # If not admin, check if user is associated with a doctor
-        elif hasattr(user, 'doctor'):
-            try:
-                doctor = user.doctor
-                user_data.update({
-                    'userType': 'Doctor',
-                    'doctorId': doctor.doctor_id,
-                    'fullName': f"{doctor.first_name} {doctor.last_name}",
-                    'specialization': doctor.specialization,
-                    'department': doctor.department
-                })
-            except Exception as e:
-                pass  # Silently ignore if doctor relation doesn't exist
+        # If not admin, check if user is associated with a doctor (cached, see hms.roles)
+        elif (identity := resolve_identity(user)).doctor_id is not None:
+            user_data.update(doctor_user_data(identity))
         else:
             # If user type was provided and user is not an admin or doctor
             user_data['userType'] = user_type
@@ -113,20 +120,10 @@ def current_user(request):
             'isStaff': user.is_staff,
             'isSuperuser': user.is_superuser,
         })
-    # If not admin, check if user is associated with a doctor
-    elif hasattr(user, 'doctor'):
-        try:
-            doctor = user.doctor
-            data.update({
-                'userType': 'Doctor',
-                'doctorId': doctor.doctor_id,
-                'fullName': f"{doctor.first_name} {doctor.last_name}",
-                'specialization': doctor.specialization,
-                'department': doctor.department
-            })
-        except Exception as e:
-            pass
-        
+    # If not admin, check if user is associated with a doctor (cached, see hms.roles)
+    elif (identity := resolve_identity(user)).doctor_id is not None:
+        data.update(doctor_user_data(identity))
+
     return Response(data)
 
 @api_view(['GET'])
@@ -156,76 +153,51 @@ def api_root(request):
                 'statistics': '/api/statistics/',
                 'logs': '/api/logs/',
                 'diagnostics': '/api/diagnostics/', 
+                'metrics': '/api/metrics/',
+                'liveness': '/api/health/live/',
+                'readiness': '/api/health/ready/',
             }
         }
     }
     return Response(data)
 
+def health_live(request):
+    """Liveness probe: the process is serving requests. Never touches the database."""
+    return JsonResponse({"status": "alive"})
+
+def health_ready(request):
+    """Readiness probe: SELECT 1 plus the connection pool check (see hms.health)."""
+    ready, details = health.readiness()
+    return JsonResponse({"status": "ready" if ready else "unavailable", **details}, status=200 if ready else 503)
+
 @api_view(['GET'])
 def api_diagnostics(request):
     """
-    API endpoint to check system and database connectivity
+    API endpoint to check system and database connectivity.
+    Row counts come from the cached snapshot in hms.health, so this costs a
+    SELECT 1 and a cache read.
     """
-    from django.db import connection
-    from django.db.utils import OperationalError
-    from django.contrib.auth.models import User
-    from hms.models import Doctor, Patient, Appointment
-    from receptionist_app.models import Receptionist
-    import django
-    from datetime import datetime
-    
-    # Check database connectivity
-    db_connected = True
-    db_error = None
+    db_error = health.check_database()
+    db_connected = db_error is None
     try:
-        # Try to execute a simple query
-        with connection.cursor() as cursor:
-            cursor.execute("SELECT 1")
-            cursor.fetchone()
-    except OperationalError as e:
-        db_connected = False
-        db_error = str(e)
-    
-    # Count model instances
-    try:
-        user_count = User.objects.count()
-        doctor_count = Doctor.objects.count()
-        patient_count = Patient.objects.count()
-        appointment_count = Appointment.objects.count()
-        receptionist_count = Receptionist.objects.count()
-        
-        # Get user type counts
-        staff_users = User.objects.filter(is_staff=True).count()
-        superusers = User.objects.filter(is_superuser=True).count()
-        regular_users = user_count - staff_users
-        
-        # Get sample data for verification
-        doctors_sample = list(Doctor.objects.all()[:3].values('doctor_id', 'first_name', 'last_name', 'specialization'))
-        patients_sample = list(Patient.objects.all()[:3].values('patient_id', 'first_name', 'last_name'))
-        
-        model_counts = {
-            "doctors": doctor_count,
-            "patients": patient_count,
-            "appointments": appointment_count,
-            "receptionists": receptionist_count
-        }
-        
-        # Check if models have data
-        models_have_data = all([
-            doctor_count > 0,
-            patient_count > 0
-        ])
-        
+        snapshot = health.get_snapshot()
     except Exception as e:
         db_connected = False
         db_error = str(e)
-        user_count = 0
-        model_counts = {"error": str(e)}
+        snapshot = None
+
+    if snapshot is not None:
+        counts = snapshot['counts']
+        model_counts = {key: counts[key] for key in ('doctors', 'patients', 'appointments', 'receptionists')}
+        models_have_data = counts['doctors'] > 0 and counts['patients'] > 0
+        users = {"total": counts['users'], "types": snapshot['user_types']}
+        samples = snapshot['samples']
+    else:
+        model_counts = {"error": db_error}
         models_have_data = False
-        doctors_sample = []
-        patients_sample = []
-    
-    # Build response data
+        users = {"total": 0, "types": {"staff_users": 0, "superusers": 0, "regular_users": 0}}
+        samples = {"doctors": [], "patients": []}
+
     data = {
         "system_status": "healthy" if db_connected else "database_error",
         "timestamp": datetime.now().isoformat(),
@@ -233,25 +205,30 @@ def api_diagnostics(request):
         "database": {
             "connected": db_connected,
             "error": db_error,
-            "models_have_data": models_have_data
-        },
-        "users": {
-            "total": user_count,
-            "types": {
-                "staff_users": staff_users if 'staff_users' in locals() else 0,
-                "superusers": superusers if 'superusers' in locals() else 0,
-                "regular_users": regular_users if 'regular_users' in locals() else 0
-            }
+            "models_have_data": models_have_data,
+            "pool": health.pool_status(),
+            "replica": health.replica_status()
         },
+        "users": users,
         "models": model_counts,
-        "samples": {
-            "doctors": doctors_sample,
-            "patients": patients_sample
-        }
+        "counts": {
+            "generated_at": snapshot['generated_at'] if snapshot else None,
+            "estimated": snapshot['counts_estimated'] if snapshot else False
+        },
+        "samples": samples,
+        "api_cache": api_cache_stats.snapshot(),
+        # Latency of recent requests in this server process, per view
+        "performance": metrics.latency.percentiles()
     }
     
     return Response(data)
 
+def api_metrics(request):
+    """Request metrics of this server process in the Prometheus text format (staff and allowed IPs only)."""
+    if not (request.user.is_staff or request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS):
+        return HttpResponse(status=403)
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @ensure_csrf_cookie
 @api_view(['GET'])
 def get_csrf_token(request):
@@ -261,9 +238,6 @@ def get_csrf_token(request):
     """
     response = Response({"success": "CSRF cookie set"})
     
-    # Log the existing cookies coming in with the request
-    print("Request cookies:", request.COOKIES)
-    
     # Set specific attributes for the CSRF cookie to ensure it works properly
     # Get the value of the csrftoken cookie which ensure_csrf_cookie middleware just set
     csrf_token = request.COOKIES.get('csrftoken')
@@ -278,9 +252,10 @@ def get_csrf_token(request):
             httponly=False,  # CSRF token needs to be readable by JavaScript
             samesite='Lax'  # 'Lax' is more permissive than 'Strict'
         )
-        print(f"Set CSRF cookie with value: {csrf_token[:10]}...")
+        # Called on every page load: the sampling filter keeps this from flooding the log
+        logger.debug("CSRF cookie refreshed")
     else:
-        print("No CSRF token found in cookies to enhance")
+        logger.debug("No CSRF cookie in the request to refresh")
     
     return response
 
@@ -309,9 +284,15 @@ urlpatterns = [
     # 5) API root endpoint
     path('api/', api_root, name='api_root'),
     
-    # 6) Diagnostics endpoint - accessible without authentication
+    # 6) Statistics endpoint for the admin dashboard
+    path('api/statistics/', statistics_api, name='api_statistics'),
+
+    # 7) Diagnostics endpoint - accessible without authentication
     path('api/diagnostics/', api_diagnostics, name='api_diagnostics'),
+    path('api/health/live/', health_live, name='api_health_live'),
+    path('api/health/ready/', health_ready, name='api_health_ready'),
+    path('api/metrics/', api_metrics, name='api_metrics'),
     
-    # 7) CSRF token endpoint
+    # 8) CSRF token endpoint
     path('api/csrf-token/', get_csrf_token, name='get_csrf_token'),
 ]
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class PatientConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'patient_app'
+
+    def ready(self):
+        # Register the document reference counting handlers
+        from . import signals  # noqa: F401
@@ -0,0 +1,83 @@
+"""
+Capacity checks for booking appointments.
+
+Bookings for the same doctor are serialized by locking that doctor's row
+(SELECT ... FOR UPDATE) for the rest of the booking transaction, so two
+requests can never both see a free slot and both take it, while bookings for
+other doctors proceed in parallel and the appointment table is never locked.
+
+Within the lock a booking must fit the doctor's DoctorSchedule for that
+weekday: it has to start inside a schedule slot, the slot may hold at most
+settings.APPOINTMENT_SLOT_CAPACITY active appointments and the day at most
+the schedule's max_appointments. Doctors without any schedule configured
+still get the per-slot check, using slots aligned to midnight.
+"""
+from datetime import datetime, time
+
+from django.utils import timezone
+
+from doctor_app.availability import (
+    WEEKDAYS, Slot, active_appointments, day_bounds, get_slot_capacity, get_slot_length, schedule_slots,
+)
+from doctor_app.models import DoctorSchedule
+from hms.models import Doctor
+
+
+class BookingError(Exception):
+    """Raised when the requested appointment time cannot be booked."""
+
+
+def find_slot(schedule, appointment_datetime):
+    """Return the slot of the schedule window that contains appointment_datetime, or None."""
+    day = timezone.localtime(appointment_datetime).date()
+    for slot in schedule_slots(schedule, day):
+        if slot.start <= appointment_datetime < slot.end:
+            return slot
+    return None
+
+
+def aligned_slot(appointment_datetime):
+    """Return the slot counted from local midnight that contains appointment_datetime."""
+    slot_length = get_slot_length()
+    local = timezone.localtime(appointment_datetime)
+    midnight = timezone.make_aware(datetime.combine(local.date(), time.min))
+    slot_start = midnight + ((local - midnight) // slot_length) * slot_length
+    return Slot(slot_start, slot_start + slot_length)
+
+
+def ensure_bookable(doctor, appointment_datetime, exclude_pk=None):
+    """
+    Lock the doctor and check that appointment_datetime still has room.
+
+    Must be called inside transaction.atomic(), and the appointment must be
+    saved in that same transaction so the lock covers the write. exclude_pk
+    leaves out the appointment being rescheduled. Raises BookingError when
+    the time is outside the doctor's schedule or the slot or day is full.
+    """
+    Doctor.objects.select_for_update().only('pk').get(pk=doctor.pk)
+
+    day = timezone.localtime(appointment_datetime).date()
+    weekly_schedule = {
+        schedule.day_of_week: schedule for schedule in DoctorSchedule.objects.filter(doctor_id=doctor.pk)
+    }
+    schedule = weekly_schedule.get(WEEKDAYS[day.weekday()])
+
+    if weekly_schedule:
+        if schedule is None or not schedule.is_available:
+            raise BookingError("The doctor is not available on this day.")
+        slot = find_slot(schedule, appointment_datetime)
+        if slot is None:
+            raise BookingError("The requested time is outside the doctor's schedule.")
+    else:
+        slot = aligned_slot(appointment_datetime)
+
+    day_start, day_end = day_bounds(day)
+    booked = active_appointments([doctor.pk], day_start, day_end)
+    if exclude_pk is not None:
+        booked = booked.exclude(pk=exclude_pk)
+    booked_times = list(booked.values_list('appointment_datetime', flat=True))
+
+    if schedule is not None and len(booked_times) >= schedule.max_appointments:
+        raise BookingError("The doctor has no appointments left on this day.")
+    if sum(slot.start <= booked_time < slot.end for booked_time in booked_times) >= get_slot_capacity():
+        raise BookingError("This time slot is already booked.")
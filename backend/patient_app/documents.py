@@ -0,0 +1,220 @@
+"""
+Streaming upload and download of medical record and lab result documents.
+
+Uploads: ChecksumUploadHandler spools every uploaded file to a temporary file
+on disk (never into memory), computing its SHA-256 and enforcing
+settings.DOCUMENT_MAX_UPLOAD_SIZE chunk by chunk as the request body is read.
+Saving to FileSystemStorage then moves the temporary file into place instead
+of copying it; other storages receive it in chunks.
+
+Downloads: serve_document() is called after the view's permission checks. It
+either hands the transfer to the front proxy (settings.DOCUMENT_SENDFILE_MODE,
+'x-accel-redirect' for nginx or 'x-sendfile' for Apache/lighttpd) or streams
+the file itself in settings.DOCUMENT_CHUNK_SIZE blocks, honouring single byte
+ranges (Range / If-Range) so large files can be resumed and seeked. Either
+way memory use per download does not depend on the file size.
+"""
+import hashlib
+import json
+import mimetypes
+import os
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header
+from rest_framework import serializers, status
+from rest_framework.exceptions import APIException
+from rest_framework.renderers import BaseRenderer
+
+X_ACCEL_REDIRECT = 'x-accel-redirect'
+X_SENDFILE = 'x-sendfile'
+
+
+class DocumentTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Uploaded document is too large.'
+    default_code = 'document_too_large'
+
+
+class ChecksumUploadHandler(TemporaryFileUploadHandler):
+    """Spool uploads to disk, hashing them and enforcing the size limit as chunks arrive."""
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.digest = hashlib.sha256()
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.DOCUMENT_MAX_UPLOAD_SIZE:
+            self.file.close()
+            raise DocumentTooLarge(
+                f'Documents may not be larger than {settings.DOCUMENT_MAX_UPLOAD_SIZE} bytes.'
+            )
+        self.digest.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        upload = super().file_complete(file_size)
+        upload.sha256 = self.digest.hexdigest()
+        return upload
+
+
+class ChecksumUploadMixin:
+    """Make a ViewSet read uploaded files through ChecksumUploadHandler."""
+
+    def initialize_request(self, request, *args, **kwargs):
+        # Handlers can only be swapped before anything has read the body
+        if not hasattr(request, '_files'):
+            request.upload_handlers = [ChecksumUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
+
+def validate_document_size(upload):
+    if upload is not None and upload.size > settings.DOCUMENT_MAX_UPLOAD_SIZE:
+        raise serializers.ValidationError(
+            f'Documents may not be larger than {settings.DOCUMENT_MAX_UPLOAD_SIZE} bytes.'
+        )
+    return upload
+
+
+def file_sha256(upload):
+    """SHA-256 of an uploaded file, reusing the one computed while it was received."""
+    checksum = getattr(upload, 'sha256', None)
+    if checksum:
+        return checksum
+    digest = hashlib.sha256()
+    for chunk in upload.chunks(settings.DOCUMENT_CHUNK_SIZE):
+        digest.update(chunk)
+    upload.seek(0)
+    return digest.hexdigest()
+
+
+def document_attrs(attrs, field_name):
+    """Add the checksum and size columns that go with an uploaded (or cleared) file field."""
+    if field_name not in attrs:
+        return attrs
+    upload = attrs[field_name]
+    attrs[f'{field_name}_sha256'] = file_sha256(upload) if upload else ''
+    attrs[f'{field_name}_size'] = upload.size if upload else None
+    return attrs
+
+
+class PassthroughRenderer(BaseRenderer):
+    """Lets document actions accept any Accept header; their file responses skip rendering."""
+    media_type = '*/*'
+    format = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Only error responses are rendered here
+        return data if isinstance(data, bytes) else json.dumps(data).encode()
+
+
+def parse_range(header, size):
+    """
+    Parse a Range header against a file of the given size.
+
+    Returns (start, end) inclusive, None to serve the whole file (no header,
+    a syntax this view does not handle, or several ranges), or False when the
+    range cannot be satisfied.
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    first, _, last = header[len('bytes='):].strip().partition('-')
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        else:
+            suffix = int(last)
+            if suffix == 0:
+                return False
+            start, end = max(size - suffix, 0), size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        return False
+    if start > end:
+        return None
+    return start, min(end, size - 1)
+
+
+def iter_range(file, start, length, chunk_size):
+    """Yield length bytes of file from start, closing it when done."""
+    try:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+def serve_document(request, field_file, checksum=''):
+    """Return a response delivering field_file; call only after the permission check."""
+    filename = os.path.basename(field_file.name)
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    etag = f'"{checksum}"' if checksum else None
+
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        response = not_modified
+    elif settings.DOCUMENT_SENDFILE_MODE == X_ACCEL_REDIRECT:
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = f"{settings.DOCUMENT_SENDFILE_PREFIX.rstrip('/')}/{quote(field_file.name)}"
+    elif settings.DOCUMENT_SENDFILE_MODE == X_SENDFILE and _local_path(field_file):
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = _local_path(field_file)
+    else:
+        response = stream_document(request, field_file, content_type, etag)
+
+    if etag:
+        response['ETag'] = etag
+    response['Content-Disposition'] = content_disposition_header(
+        as_attachment=request.query_params.get('download') == '1', filename=filename
+    )
+    response['Cache-Control'] = 'private'
+    return response
+
+
+def _local_path(field_file):
+    # X-Sendfile needs a path on the proxy's filesystem; remote storages are streamed
+    try:
+        return field_file.path
+    except NotImplementedError:
+        return None
+
+
+def stream_document(request, field_file, content_type, etag):
+    file = field_file.storage.open(field_file.name, 'rb')
+    size = field_file.size
+    byte_range = None
+    if_range = request.headers.get('If-Range')
+    # A stale If-Range means the client's partial copy is outdated: send everything
+    if not if_range or (etag and if_range == etag):
+        byte_range = parse_range(request.headers.get('Range'), size)
+
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+        response.block_size = settings.DOCUMENT_CHUNK_SIZE
+        response['Content-Length'] = size
+    elif byte_range is False:
+        file.close()
+        response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        response['Content-Range'] = f'bytes */{size}'
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            iter_range(file, start, end - start + 1, settings.DOCUMENT_CHUNK_SIZE),
+            status=status.HTTP_206_PARTIAL_CONTENT, content_type=content_type,
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+    response['Accept-Ranges'] = 'bytes'
+    return response
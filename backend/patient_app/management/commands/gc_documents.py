@@ -0,0 +1,111 @@
+import os
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from django.db.models.fields.json import KeyTextTransform
+from django.utils import timezone
+
+from archive.models import ArchivedRecord
+from patient_app.models import DOCUMENT_FIELDS, DocumentBlob
+from patient_app.storage import CAS_PREFIX, document_storage
+
+
+class Command(BaseCommand):
+    help = (
+        'Deletes content-addressed document files that no medical record or lab test order has '
+        'referenced for the grace period, and stray files left behind by interrupted uploads.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-hours', type=int,
+            help='Keep unreferenced files at least this long (default: settings.DOCUMENT_GC_GRACE_HOURS).'
+        )
+        parser.add_argument(
+            '--recount', action='store_true',
+            help='Recompute reference counts from the record tables and archived rows first, e.g. after bulk updates.'
+        )
+        parser.add_argument('--batch-size', type=int, default=500, help='Blobs deleted per batch (default: 500).')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be deleted without deleting.')
+
+    def handle(self, *args, **options):
+        grace_hours = options['grace_hours']
+        if grace_hours is None:
+            grace_hours = settings.DOCUMENT_GC_GRACE_HOURS
+        cutoff = timezone.now() - timedelta(hours=grace_hours)
+        storage = document_storage()
+        dry_run = options['dry_run']
+
+        if options['recount']:
+            fixed = self.recount(dry_run)
+            self.stdout.write(f"Corrected {fixed} reference counts.")
+
+        deleted = freed = 0
+        candidates = DocumentBlob.objects.filter(ref_count__lte=0, updated_at__lt=cutoff).order_by('pk')
+        last_pk = 0
+        while batch := list(candidates.filter(pk__gt=last_pk).values_list('pk', 'name', 'size')[:options['batch_size']]):
+            last_pk = batch[-1][0]
+            for pk, name, size in batch:
+                # Re-check on delete: an upload may have referenced the blob since it was listed
+                if not dry_run and not DocumentBlob.objects.filter(
+                    pk=pk, ref_count__lte=0, updated_at__lt=cutoff
+                ).delete()[0]:
+                    continue
+                if not dry_run:
+                    storage.delete(name)
+                deleted += 1
+                freed += size
+
+        strays = self.delete_strays(storage, cutoff, dry_run)
+        verb = 'Would delete' if dry_run else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {deleted} unreferenced documents ({freed} bytes) and {strays} stray files."
+        ))
+
+    def recount(self, dry_run):
+        counts = Counter()
+        for model, field_name in DOCUMENT_FIELDS.items():
+            rows = (
+                model.objects.filter(**{f'{field_name}__startswith': CAS_PREFIX})
+                .order_by().values(field_name).annotate(references=Count('pk')).values_list(field_name, 'references')
+            )
+            for name, references in rows:
+                counts[name] += references
+            # Archived rows were deleted without releasing their documents and still reference them
+            archived = (
+                ArchivedRecord.objects.of(model).filter(**{f'data__{field_name}__startswith': CAS_PREFIX})
+                .annotate(name=KeyTextTransform(field_name, 'data'))
+                .order_by().values('name').annotate(references=Count('pk')).values_list('name', 'references')
+            )
+            for name, references in archived:
+                counts[name] += references
+        fixed = 0
+        for pk, name, ref_count in DocumentBlob.objects.values_list('pk', 'name', 'ref_count').iterator():
+            if ref_count != counts.get(name, 0):
+                fixed += 1
+                if not dry_run:
+                    DocumentBlob.objects.filter(pk=pk).update(ref_count=counts.get(name, 0))
+        return fixed
+
+    def delete_strays(self, storage, cutoff, dry_run):
+        """Delete files under cas/ without a DocumentBlob row (interrupted uploads)."""
+        root = storage.path(CAS_PREFIX)
+        if not os.path.isdir(root):
+            return 0
+        cutoff_timestamp = cutoff.timestamp()
+        strays = 0
+        for directory, _, filenames in os.walk(root):
+            names = {
+                os.path.relpath(os.path.join(directory, filename), storage.location).replace(os.sep, '/')
+                for filename in filenames
+            }
+            known = set(DocumentBlob.objects.filter(name__in=names).values_list('name', flat=True))
+            for name in names - known:
+                if os.path.getmtime(storage.path(name)) < cutoff_timestamp:
+                    strays += 1
+                    if not dry_run:
+                        storage.delete(name)
+        return strays
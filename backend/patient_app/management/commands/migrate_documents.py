@@ -0,0 +1,77 @@
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from patient_app.models import DOCUMENT_FIELDS
+from patient_app.storage import CAS_PREFIX, add_reference, document_storage, sha256_from_name
+
+
+class Command(BaseCommand):
+    help = (
+        'Moves medical record and lab result documents saved before content-addressed storage '
+        'into it, deduplicating identical files. Works in small batches and can be stopped and '
+        'rerun at any time, so it is safe to leave running in the background.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Records migrated per batch (default: 100).')
+        parser.add_argument(
+            '--sleep', type=float, default=0,
+            help='Seconds to pause between batches, to limit the I/O load on a live system.'
+        )
+        parser.add_argument(
+            '--delete-originals', action='store_true',
+            help='Delete each old file once no record refers to it any more.'
+        )
+
+    def handle(self, *args, **options):
+        storage = document_storage()
+        counts = Counter()
+        for model, field_name in DOCUMENT_FIELDS.items():
+            legacy = (
+                model.objects.exclude(**{f'{field_name}__startswith': CAS_PREFIX})
+                .exclude(**{field_name: ''}).exclude(**{f'{field_name}__isnull': True})
+                .order_by('pk')
+            )
+            last_pk = 0
+            while batch := list(legacy.filter(pk__gt=last_pk).values_list('pk', field_name)[:options['batch_size']]):
+                last_pk = batch[-1][0]
+                for pk, old_name in batch:
+                    counts[self.migrate(model, field_name, pk, old_name, storage, options['delete_originals'])] += 1
+                self.stdout.write(f"{model._meta.label}: migrated up to #{last_pk} ({dict(counts)})")
+                if options['sleep']:
+                    time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{counts['migrated']} documents migrated, {counts['missing']} missing files, "
+            f"{counts['changed']} changed while migrating (left for the next run)."
+        ))
+
+    def migrate(self, model, field_name, pk, old_name, storage, delete_original):
+        if not storage.exists(old_name):
+            return 'missing'
+        with storage.open(old_name, 'rb') as source:
+            size = source.size
+            new_name = storage.save(old_name, source)
+
+        with transaction.atomic():
+            # Only swap the name if the record still points at the file we copied
+            updated = model.objects.filter(pk=pk, **{field_name: old_name}).update(**{
+                field_name: new_name,
+                f'{field_name}_sha256': sha256_from_name(new_name),
+                f'{field_name}_size': size,
+                'updated_at': timezone.now(),
+            })
+            if updated:
+                add_reference(new_name)
+        if not updated:
+            return 'changed'
+
+        if delete_original and not any(
+            other.objects.filter(**{other_field: old_name}).exists() for other, other_field in DOCUMENT_FIELDS.items()
+        ):
+            storage.delete(old_name)
+        return 'migrated'
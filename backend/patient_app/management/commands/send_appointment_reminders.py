@@ -1,11 +1,27 @@
+import os
+import socket
+import time as time_module
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta, date, datetime, time
+from itertools import islice
+
 from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Q
 from django.utils import timezone
-from datetime import timedelta, date # Added date
-from patient.models import Appointment # Corrected import
-from administrator.models import SystemLog # Corrected import
+
+from admin_app.models import SystemLog
+from patient_app.models import Appointment, ReminderDelivery
+from patient_app.reminders import get_reminder_backend, render_reminders, retry_delay
+
 
 class Command(BaseCommand):
-    help = 'Sends appointment reminders to patients for appointments scheduled for the next day.'
+    help = (
+        'Sends appointment reminders to patients for appointments scheduled for the next day. '
+        'Deliveries are recorded in a ledger, so reruns skip reminders that were already sent '
+        'and several instances can drain the same day in parallel.'
+    )
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -18,13 +34,36 @@ class Command(BaseCommand):
             type=str,
             help='Specify a date (YYYY-MM-DD) to send reminders for, instead of tomorrow. Useful for testing.'
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of reminders claimed, rendered and logged per batch (default: 500).'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=4,
+            help='Number of worker threads delivering reminders (default: 4).'
+        )
+        parser.add_argument(
+            '--lease-seconds',
+            type=int,
+            default=600,
+            help='Claims older than this are considered abandoned by a crashed run and are re-claimed (default: 600).'
+        )
+        parser.add_argument(
+            '--max-attempts',
+            type=int,
+            default=3,
+            help='Stop retrying a reminder after this many delivery attempts (default: 3).'
+        )
 
     def handle(self, *args, **options):
         dry_run = options['dry_run']
         specified_date_str = options['date']
-        
-        reminders_sent_count = 0
-        appointments_found_count = 0
+        batch_size = max(1, options['batch_size'])
+        concurrency = max(1, options['concurrency'])
 
         if specified_date_str:
             try:
@@ -37,55 +76,162 @@ class Command(BaseCommand):
             target_date = timezone.localdate() + timedelta(days=1)
             self.stdout.write(self.style.NOTICE(f"Checking for appointments on: {target_date.strftime('%Y-%m-%d')} (Tomorrow)"))
 
-        # Query for appointments scheduled for the target_date and are still 'SCHEDULED'
+        # A datetime range rather than __date so the partial index on
+        # scheduled appointments can be used
+        self.day_start = timezone.make_aware(datetime.combine(target_date, time.min))
+        self.day_end = self.day_start + timedelta(days=1)
         appointments_to_remind = Appointment.objects.filter(
-            appointment_datetime__date=target_date,
+            appointment_datetime__gte=self.day_start,
+            appointment_datetime__lt=self.day_end,
             status='SCHEDULED'
-        ).select_related('patient__user', 'doctor__user') # Optimize query
+        )
 
-        appointments_found_count = appointments_to_remind.count()
+        started = time_module.monotonic()
+        if dry_run:
+            appointments_found_count = self.preview(appointments_to_remind, batch_size)
+        else:
+            appointments_found_count = self.enqueue(appointments_to_remind, batch_size)
 
-        if not appointments_to_remind.exists():
+        if not appointments_found_count:
             self.stdout.write(self.style.SUCCESS(f"No appointments found for {target_date.strftime('%Y-%m-%d')} that require reminders."))
             return
 
         self.stdout.write(f"Found {appointments_found_count} appointments for {target_date.strftime('%Y-%m-%d')}.")
+        if dry_run:
+            self.stdout.write(self.style.SUCCESS(f"Dry run complete. Would have processed {appointments_found_count} appointments."))
+            return
+
+        worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        backend = get_reminder_backend(stdout=self.stdout)
+        reminders_sent_count = 0
+        failed_count = 0
 
-        for appointment in appointments_to_remind:
-            patient_name = appointment.patient.user.get_full_name() or appointment.patient.user.username
-            doctor_name = f"Dr. {appointment.doctor.user.last_name}"
-            appointment_time = appointment.appointment_datetime.strftime('%I:%M %p')
-            
-            reminder_message = (
-                f"Reminder for {patient_name}: Appointment with {doctor_name} "
-                f"on {target_date.strftime('%A, %B %d, %Y')} at {appointment_time}."
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            while True:
+                claimed_ids = self.claim(worker_id, batch_size, options['lease_seconds'], options['max_attempts'])
+                if not claimed_ids:
+                    break
+                sent, failed = self.process(worker_id, claimed_ids, backend, executor)
+                reminders_sent_count += sent
+                failed_count += failed
+
+        elapsed = time_module.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f"Appointment reminder process finished. {reminders_sent_count} reminders logged."))
+        if failed_count:
+            self.stdout.write(self.style.WARNING(f"{failed_count} delivery attempts failed."))
+
+        processed = reminders_sent_count + failed_count
+        rate = processed / elapsed if elapsed > 0 else processed
+        self.stdout.write(
+            f"Throughput: {processed} reminders in {elapsed:.2f}s "
+            f"({rate:.1f}/s, batch size {batch_size}, concurrency {concurrency})."
+        )
+
+    def preview(self, appointments, batch_size):
+        """Render the day's reminders without sending them or touching the ledger."""
+        found = 0
+        stream = appointments.select_related('patient__user', 'doctor__user').order_by(
+            'appointment_datetime', 'id'
+        ).iterator(chunk_size=batch_size)
+        while batch := list(islice(stream, batch_size)):
+            found += len(batch)
+            for reminder in render_reminders(batch):
+                self.stdout.write(f"[DRY RUN] Would send: {reminder.message}")
+        return found
+
+    def enqueue(self, appointments, batch_size):
+        """Add a PENDING ledger row for every appointment of the day that does not have one yet."""
+        found = 0
+        stream = appointments.values_list('id', flat=True).iterator(chunk_size=batch_size)
+        while appointment_ids := list(islice(stream, batch_size)):
+            found += len(appointment_ids)
+            ReminderDelivery.objects.bulk_create(
+                [ReminderDelivery(appointment_id=appointment_id) for appointment_id in appointment_ids],
+                ignore_conflicts=True,
             )
+        return found
 
-            if dry_run:
-                self.stdout.write(f"[DRY RUN] Would send: {reminder_message}")
-            else:
-                # Actual sending logic (e.g., email) would go here
-                # For now, we just print to stdout as if it were sent
-                self.stdout.write(self.style.SUCCESS(f"SENT: {reminder_message}"))
-                
-                # Log the reminder action
-                log_description = (
-                    f"Sent appointment reminder for appointment ID {appointment.id} "
-                    f"(Patient: {appointment.patient.user.username}, "
-                    f"Doctor: {appointment.doctor.user.username}, "
-                    f"Time: {appointment.appointment_datetime.strftime('%Y-%m-%d %H:%M')})"
+    def claim(self, worker_id, batch_size, lease_seconds, max_attempts):
+        """
+        Atomically take up to batch_size deliverable ledger rows for this worker.
+
+        Rows locked by another worker's claim transaction are skipped rather than
+        waited on, claims whose lease expired (a crashed run) are taken over, and
+        failed rows wait until their next_attempt_at.
+        """
+        now = timezone.now()
+        claimable = Q(attempts__lt=max_attempts) & (
+            Q(status='PENDING')
+            | Q(status='FAILED', next_attempt_at__lte=now)
+            | Q(status='CLAIMED', claimed_at__lt=now - timedelta(seconds=lease_seconds))
+        )
+        with transaction.atomic():
+            claimed_ids = list(
+                ReminderDelivery.objects.select_for_update(skip_locked=True, of=('self',))
+                .filter(
+                    claimable,
+                    window=ReminderDelivery.WINDOW_DAY_BEFORE,
+                    appointment__status='SCHEDULED',
+                    appointment__appointment_datetime__gte=self.day_start,
+                    appointment__appointment_datetime__lt=self.day_end,
+                )
+                .order_by('id')
+                .values_list('id', flat=True)[:batch_size]
+            )
+            if claimed_ids:
+                ReminderDelivery.objects.filter(id__in=claimed_ids).update(
+                    status='CLAIMED', claimed_by=worker_id, claimed_at=now, attempts=F('attempts') + 1
                 )
-                try:
-                    SystemLog.objects.create(
-                        user=None, # System action, no specific user initiated this directly
-                        level='INFO', # Corrected: Use 'level' field
-                        message=log_description # Corrected: Use 'message' field
+        return claimed_ids
+
+    def process(self, worker_id, claimed_ids, backend, executor):
+        """Deliver a claimed batch and record the outcome in the ledger and SystemLog."""
+        deliveries = list(
+            ReminderDelivery.objects.filter(id__in=claimed_ids)
+            .select_related('appointment__patient__user', 'appointment__doctor__user')
+            .order_by('appointment__appointment_datetime', 'id')
+        )
+        reminders = render_reminders([delivery.appointment for delivery in deliveries])
+        errors = executor.map(self.deliver, [backend] * len(reminders), reminders)
+
+        sent_ids = []
+        delivered = []
+        failures = []
+        for delivery, reminder, error in zip(deliveries, reminders, errors):
+            if error is None:
+                sent_ids.append(delivery.id)
+                delivered.append(reminder)
+            else:
+                failures.append((delivery, str(error)))
+                self.stderr.write(self.style.ERROR(
+                    f"Failed to send reminder for appointment ID {reminder.appointment_id}: {error}"
+                ))
+
+        # Only rows still held by this worker are updated, in case the lease
+        # expired and another run took them over meanwhile
+        owned = ReminderDelivery.objects.filter(claimed_by=worker_id, status='CLAIMED')
+        try:
+            with transaction.atomic():
+                now = timezone.now()
+                owned.filter(id__in=sent_ids).update(status='SENT', sent_at=now, last_error='')
+                for delivery, error in failures:
+                    owned.filter(id=delivery.id).update(
+                        status='FAILED', last_error=error, next_attempt_at=now + retry_delay(delivery.attempts)
                     )
-                    reminders_sent_count += 1
-                except Exception as e:
-                    self.stderr.write(self.style.ERROR(f"Failed to log reminder for appointment ID {appointment.id}: {e}"))
-        
-        if dry_run:
-            self.stdout.write(self.style.SUCCESS(f"Dry run complete. Would have processed {appointments_found_count} appointments."))
-        else:
-            self.stdout.write(self.style.SUCCESS(f"Appointment reminder process finished. {reminders_sent_count} reminders logged."))
+                SystemLog.objects.bulk_create([
+                    SystemLog(user=None, level='INFO', message=reminder.log_message)
+                    for reminder in delivered
+                ])
+        except Exception as e:
+            self.stderr.write(self.style.ERROR(f"Failed to record {len(deliveries)} reminders: {e}"))
+            return 0, len(deliveries)
+        return len(delivered), len(failures)
+
+    @staticmethod
+    def deliver(backend, reminder):
+        """Send one reminder on a worker thread; return the exception instead of raising it."""
+        try:
+            backend.send(reminder)
+        except Exception as e:
+            return e
+        return None
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.1 on 2026-10-17 10:00
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction, but it does not
+    # block writes to the tables while the indexes are built
+    atomic = False
+
+    dependencies = [
+        ('patient_app', '0007_alter_patientprofile_user'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='appointment',
+            index=models.Index(fields=['doctor', 'appointment_datetime'], name='appt_doctor_datetime_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='appointment',
+            index=models.Index(fields=['patient', 'appointment_datetime'], name='appt_patient_datetime_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('status', 'SCHEDULED')), fields=['appointment_datetime'], name='appt_scheduled_datetime_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='medicalrecord',
+            index=models.Index(fields=['patient', 'created_at'], name='record_patient_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='medicalrecord',
+            index=models.Index(fields=['doctor', 'created_at'], name='record_doctor_created_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='patientlabtestorder',
+            index=models.Index(fields=['ordered_by_doctor', '-order_datetime'], name='laborder_doctor_ordered_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='patientlabtestorder',
+            index=models.Index(fields=['patient', '-order_datetime'], name='laborder_patient_ordered_idx'),
+        ),
+    ]
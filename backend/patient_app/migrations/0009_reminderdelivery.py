@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-17 22:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patient_app', '0008_add_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReminderDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('window', models.CharField(choices=[('DAY_BEFORE', 'Day before')], default='DAY_BEFORE', max_length=20)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('CLAIMED', 'Claimed'), ('SENT', 'Sent'), ('FAILED', 'Failed')], default='PENDING', max_length=10)),
+                ('claimed_by', models.CharField(blank=True, default='', max_length=100)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('appointment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reminder_deliveries', to='patient_app.appointment')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['window', 'status'], name='reminder_window_status_idx')],
+                'constraints': [models.UniqueConstraint(fields=('appointment', 'window'), name='unique_reminder_per_window')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-17 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patient_app', '0009_reminderdelivery'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='medicalrecord',
+            name='document_sha256',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='medicalrecord',
+            name='document_size',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='patientlabtestorder',
+            name='result_document_sha256',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='patientlabtestorder',
+            name='result_document_size',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+    ]
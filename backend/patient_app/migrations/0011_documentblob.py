@@ -0,0 +1,39 @@
+# Generated by Django 5.2.1 on 2026-10-17 10:00
+
+import patient_app.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patient_app', '0010_document_checksums'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='medicalrecord',
+            name='document',
+            field=models.FileField(blank=True, null=True, storage=patient_app.storage.document_storage, upload_to='medical_records/'),
+        ),
+        migrations.AlterField(
+            model_name='patientlabtestorder',
+            name='result_document',
+            field=models.FileField(blank=True, null=True, storage=patient_app.storage.document_storage, upload_to='lab_results/'),
+        ),
+        migrations.CreateModel(
+            name='DocumentBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('sha256', models.CharField(db_index=True, max_length=64)),
+                ('size', models.PositiveBigIntegerField()),
+                ('ref_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['ref_count', 'updated_at'], name='blob_refcount_updated_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.1 on 2026-10-17 10:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+from hms.partitioning import partition_table, unpartition_table
+
+
+def partition(apps, schema_editor):
+    partition_table(schema_editor, apps.get_model('patient_app', 'Appointment'), settings.PARTITION_MONTHS_AHEAD)
+
+
+def unpartition(apps, schema_editor):
+    unpartition_table(schema_editor, apps.get_model('patient_app', 'Appointment'))
+
+
+class Migration(migrations.Migration):
+
+    # Rewrites the appointment table on PostgreSQL, holding an exclusive
+    # lock on it until the migration commits
+
+    dependencies = [
+        ('patient_app', '0011_documentblob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='patientlabtestorder',
+            name='appointment',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='lab_test_orders', to='patient_app.appointment'),
+        ),
+        migrations.AlterField(
+            model_name='reminderdelivery',
+            name='appointment',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='reminder_deliveries', to='patient_app.appointment'),
+        ),
+        migrations.RunPython(partition, unpartition),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-17 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patient_app', '0012_partition_appointments'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reminderdelivery',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,6 +1,9 @@
 from django.db import models
 from django.contrib.auth.models import User
 from hms.models import Doctor, LabTestOrder  # Updated to use the actual models from hms
+from hms.partitioning import PartitionedQuerySet
+from hms.roles import get_role, resolve_identity
+from .storage import document_storage
 
 class PatientProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True)
@@ -25,6 +28,33 @@ class PatientProfile(models.Model):
     def __str__(self):
         return f"Patient: {self.user.first_name} {self.user.last_name} (Reg: {self.user.username})"
 
+class AppointmentQuerySet(PartitionedQuerySet):
+    def with_related(self):
+        """Eager-load the doctor and patient (with its user and hms.Patient) rendered by AppointmentSerializer."""
+        return self.select_related('doctor', 'patient__user__hms_patient')
+
+    def for_user(self, user):
+        """
+        Return the appointments visible to the given user based on their role.
+        Admins and receptionists see every appointment, doctors see their own
+        appointments and patients see the appointments booked for them.
+        """
+        if not user or not user.is_authenticated:
+            return self.none()
+
+        role = get_role(user)
+        if role == "ADMIN" or role == "RECEPTIONIST":
+            queryset = self.all()
+        elif role == "DOCTOR":
+            # Filter on the cached doctor id instead of joining the doctor table
+            queryset = self.filter(doctor_id=resolve_identity(user).doctor_id)
+        elif role == "PATIENT":
+            # PatientProfile's primary key is the user id
+            queryset = self.filter(patient_id=user.pk)
+        else:
+            return self.none()
+        return queryset.with_related().order_by('-appointment_datetime')
+
 class Appointment(models.Model):
     patient = models.ForeignKey(PatientProfile, on_delete=models.CASCADE, related_name='appointments')
     doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='patient_appointments')
@@ -41,21 +71,46 @@ class Appointment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Partitioned by month on appointment_datetime in PostgreSQL (see hms.partitioning)
+    objects = AppointmentQuerySet.as_manager()
+
     def __str__(self):
         return f"Appointment for {self.patient.user.username} with Dr. {self.doctor.last_name} on {self.appointment_datetime.strftime('%Y-%m-%d %H:%M')}"
 
+    class Meta:
+        indexes = [
+            # Doctor and patient appointment lists, ordered by time
+            models.Index(fields=['doctor', 'appointment_datetime'], name='appt_doctor_datetime_idx'),
+            models.Index(fields=['patient', 'appointment_datetime'], name='appt_patient_datetime_idx'),
+            # Reminder runs only look at scheduled appointments for one day
+            models.Index(
+                fields=['appointment_datetime'],
+                name='appt_scheduled_datetime_idx',
+                condition=models.Q(status='SCHEDULED'),
+            ),
+        ]
+
 class MedicalRecord(models.Model):
     patient = models.ForeignKey(PatientProfile, on_delete=models.CASCADE, related_name='medical_records')
     doctor = models.ForeignKey(Doctor, on_delete=models.SET_NULL, null=True, blank=True, related_name='created_medical_records') # Doctor who created/updated
     record_type = models.CharField(max_length=100, help_text="e.g., Consultation, Lab Report, Prescription") # Type of record
     description = models.TextField()
-    document = models.FileField(upload_to='medical_records/', blank=True, null=True) # For uploading reports, images, etc.
+    document = models.FileField(upload_to='medical_records/', storage=document_storage, blank=True, null=True) # For uploading reports, images, etc.
+    # Filled in on upload (see patient_app.documents)
+    document_sha256 = models.CharField(max_length=64, blank=True, default='')
+    document_size = models.PositiveBigIntegerField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Record for {self.patient.user.username} - {self.record_type} ({self.created_at.strftime('%Y-%m-%d')})"
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', 'created_at'], name='record_patient_created_idx'),
+            models.Index(fields=['doctor', 'created_at'], name='record_doctor_created_idx'),
+        ]
+
 class PatientLabTestOrder(models.Model):
     TEST_ORDER_STATUS_CHOICES = [
         ('PENDING_SAMPLE', 'Pending Sample Collection'),
@@ -69,7 +124,8 @@ class PatientLabTestOrder(models.Model):
     patient = models.ForeignKey(PatientProfile, on_delete=models.CASCADE, related_name='lab_test_orders')
     ordered_by_doctor = models.ForeignKey(Doctor, on_delete=models.SET_NULL, null=True, blank=True, related_name='lab_tests_ordered')
     # If an appointment is directly associated with this lab order
-    appointment = models.ForeignKey(Appointment, on_delete=models.SET_NULL, null=True, blank=True, related_name='lab_test_orders')
+    # No database constraint: the partitioned appointment table has no unique id to reference
+    appointment = models.ForeignKey(Appointment, on_delete=models.SET_NULL, null=True, blank=True, related_name='lab_test_orders', db_constraint=False)
     
     # Instead of using LabTestDefinition which doesn't exist, use a simple CharField
     test_name = models.CharField(max_length=100)
@@ -84,7 +140,9 @@ class PatientLabTestOrder(models.Model):
     status = models.CharField(max_length=20, choices=TEST_ORDER_STATUS_CHOICES, default='PENDING_SAMPLE')
     result_summary = models.TextField(blank=True, null=True, help_text="Brief summary of results, if applicable.")
     # Could be a link to a more detailed record in MedicalRecord or a direct file upload
-    result_document = models.FileField(upload_to='lab_results/', blank=True, null=True) 
+    result_document = models.FileField(upload_to='lab_results/', storage=document_storage, blank=True, null=True) 
+    result_document_sha256 = models.CharField(max_length=64, blank=True, default='')
+    result_document_size = models.PositiveBigIntegerField(null=True, blank=True)
     actual_cost = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, help_text="Actual cost, might differ from default.")
     notes_by_doctor = models.TextField(blank=True, null=True, help_text="Instructions or notes from the doctor regarding this test.")
     # notes_by_lab = models.TextField(blank=True, null=True, help_text="Notes from the lab technician.")
@@ -96,3 +154,77 @@ class PatientLabTestOrder(models.Model):
 
     class Meta:
         ordering = ['-order_datetime']
+        indexes = [
+            models.Index(fields=['ordered_by_doctor', '-order_datetime'], name='laborder_doctor_ordered_idx'),
+            models.Index(fields=['patient', '-order_datetime'], name='laborder_patient_ordered_idx'),
+        ]
+
+class ReminderDelivery(models.Model):
+    """
+    Ledger entry for one reminder of one appointment.
+
+    send_appointment_reminders enqueues a row per (appointment, window) and
+    workers claim pending rows with SELECT ... FOR UPDATE SKIP LOCKED, so
+    several runs can drain the same day in parallel, and a rerun after a crash
+    only sends what was not marked SENT. A FAILED row is claimed again once
+    next_attempt_at has passed, with exponential backoff between attempts
+    (see patient_app.reminders.retry_delay).
+    """
+    WINDOW_DAY_BEFORE = 'DAY_BEFORE'
+    WINDOW_CHOICES = [
+        (WINDOW_DAY_BEFORE, 'Day before'),
+    ]
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('CLAIMED', 'Claimed'),
+        ('SENT', 'Sent'),
+        ('FAILED', 'Failed'),
+    ]
+
+    # No database constraint: the partitioned appointment table has no unique id to reference
+    appointment = models.ForeignKey(Appointment, on_delete=models.CASCADE, related_name='reminder_deliveries', db_constraint=False)
+    window = models.CharField(max_length=20, choices=WINDOW_CHOICES, default=WINDOW_DAY_BEFORE)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    claimed_by = models.CharField(max_length=100, blank=True, default='')
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['appointment', 'window'], name='unique_reminder_per_window'),
+        ]
+        indexes = [
+            models.Index(fields=['window', 'status'], name='reminder_window_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"Reminder ({self.get_window_display()}) for appointment #{self.appointment_id}: {self.status}"
+
+
+class DocumentBlob(models.Model):
+    """
+    One stored document file of the content-addressed storage (see
+    patient_app.storage), with the number of records that reference it.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    sha256 = models.CharField(max_length=64, db_index=True)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['ref_count', 'updated_at'], name='blob_refcount_updated_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} references)"
+
+
+# Document file fields stored in the content-addressed storage (see patient_app.storage)
+DOCUMENT_FIELDS = {MedicalRecord: 'document', PatientLabTestOrder: 'result_document'}
@@ -0,0 +1,98 @@
+"""
+Rendering and delivery of appointment reminders.
+
+The send_appointment_reminders command renders a batch of Reminder objects and
+hands them to the backend named by settings.APPOINTMENT_REMINDER_BACKEND.
+Backends are called from a thread pool, so ``send`` must be thread-safe and
+should not use the database.
+"""
+import random
+import threading
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.utils.module_loading import import_string
+
+DEFAULT_REMINDER_BACKEND = 'patient_app.reminders.ConsoleReminderBackend'
+
+
+@dataclass(frozen=True)
+class Reminder:
+    appointment_id: int
+    recipient_email: str
+    message: str
+    log_message: str
+
+
+def render_reminders(appointments):
+    """Build Reminder objects for appointments loaded with patient__user and doctor__user."""
+    reminders = []
+    for appointment in appointments:
+        patient_user = appointment.patient.user
+        doctor = appointment.doctor
+        patient_name = patient_user.get_full_name() or patient_user.username
+        doctor_last_name = doctor.user.last_name if doctor.user else doctor.last_name
+        doctor_username = doctor.user.username if doctor.user else f"{doctor.first_name} {doctor.last_name}"
+        appointment_time = appointment.appointment_datetime
+
+        reminders.append(Reminder(
+            appointment_id=appointment.id,
+            recipient_email=patient_user.email,
+            message=(
+                f"Reminder for {patient_name}: Appointment with Dr. {doctor_last_name} "
+                f"on {appointment_time.strftime('%A, %B %d, %Y')} at {appointment_time.strftime('%I:%M %p')}."
+            ),
+            log_message=(
+                f"Sent appointment reminder for appointment ID {appointment.id} "
+                f"(Patient: {patient_user.username}, "
+                f"Doctor: {doctor_username}, "
+                f"Time: {appointment_time.strftime('%Y-%m-%d %H:%M')})"
+            ),
+        ))
+    return reminders
+
+
+class BaseReminderBackend:
+    def __init__(self, stdout=None):
+        self.stdout = stdout
+
+    def send(self, reminder):
+        """Deliver one reminder. Raise an exception to report a failed delivery."""
+        raise NotImplementedError
+
+
+class ConsoleReminderBackend(BaseReminderBackend):
+    """Writes reminders to the command's stdout. Used in development."""
+    _lock = threading.Lock()
+
+    def send(self, reminder):
+        if self.stdout is not None:
+            with self._lock:
+                self.stdout.write(f"SENT: {reminder.message}")
+
+
+class EmailReminderBackend(BaseReminderBackend):
+    """Emails the reminder to the patient's account address."""
+
+    def send(self, reminder):
+        if not reminder.recipient_email:
+            raise ValueError(f"No email address for appointment ID {reminder.appointment_id}")
+        send_mail(
+            subject='Appointment reminder',
+            message=reminder.message,
+            from_email=None,
+            recipient_list=[reminder.recipient_email],
+        )
+
+
+def retry_delay(attempts):
+    """Wait before the next delivery attempt: exponential from REMINDER_RETRY_BACKOFF seconds, capped and jittered."""
+    delay = min(settings.REMINDER_RETRY_BACKOFF * 2 ** (attempts - 1), settings.REMINDER_MAX_BACKOFF)
+    return timedelta(seconds=delay / 2 + random.uniform(0, delay / 2))
+
+
+def get_reminder_backend(stdout=None):
+    backend_path = getattr(settings, 'APPOINTMENT_REMINDER_BACKEND', DEFAULT_REMINDER_BACKEND)
+    return import_string(backend_path)(stdout=stdout)
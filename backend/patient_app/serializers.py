@@ -1,4 +1,6 @@
 from rest_framework import serializers
+from rest_framework.reverse import reverse
+from .documents import document_attrs, validate_document_size
 from .models import PatientProfile, Appointment, MedicalRecord, PatientLabTestOrder
 from django.contrib.auth.models import User
 from hms.models import Doctor
@@ -10,6 +12,9 @@ class PatientProfileSerializer(serializers.ModelSerializer):
         queryset=User.objects.all(),
         write_only=True
     )
+    # Canonical hms.Patient of the same user
+    hms_patient_id = serializers.SerializerMethodField()
+    reg_num = serializers.SerializerMethodField()
     
     def get_user_details(self, obj):
         if obj.user:
@@ -22,9 +27,17 @@ class PatientProfileSerializer(serializers.ModelSerializer):
             }
         return None
 
+    def get_hms_patient_id(self, obj):
+        hms_patient = getattr(obj.user, 'hms_patient', None)
+        return hms_patient.patient_id if hms_patient else None
+
+    def get_reg_num(self, obj):
+        hms_patient = getattr(obj.user, 'hms_patient', None)
+        return hms_patient.reg_num if hms_patient else None
+
     class Meta:
         model = PatientProfile
-        fields = ('user', 'user_details', 'date_of_birth', 'address', 'contact_number')
+        fields = ('user', 'user_details', 'hms_patient_id', 'reg_num', 'date_of_birth', 'address', 'contact_number')
 
 class AppointmentSerializer(serializers.ModelSerializer):
     patient_details = PatientProfileSerializer(source='patient', read_only=True)
@@ -73,6 +86,20 @@ class MedicalRecordSerializer(serializers.ModelSerializer):
         write_only=True
     )
     
+    # Permission-checked download (see MedicalRecordViewSet.document)
+    document_url = serializers.SerializerMethodField()
+
+    def get_document_url(self, obj):
+        if not obj.document:
+            return None
+        return reverse('medical-record-document', kwargs={'pk': obj.pk}, request=self.context.get('request'))
+
+    def validate_document(self, value):
+        return validate_document_size(value)
+
+    def validate(self, attrs):
+        return document_attrs(attrs, 'document')
+
     def get_doctor_details(self, obj):
         if obj.doctor:
             return {
@@ -95,10 +122,13 @@ class MedicalRecordSerializer(serializers.ModelSerializer):
             'record_type', 
             'description', 
             'document', 
+            'document_url',
+            'document_sha256',
+            'document_size',
             'created_at', 
             'updated_at'
         )
-        read_only_fields = ('created_at', 'updated_at')
+        read_only_fields = ('created_at', 'updated_at', 'document_sha256', 'document_size')
 
 class PatientLabTestOrderSerializer(serializers.ModelSerializer):
     patient_details = PatientProfileSerializer(source='patient', read_only=True)
@@ -114,6 +144,22 @@ class PatientLabTestOrderSerializer(serializers.ModelSerializer):
         allow_null=True
     )
     
+    # Permission-checked download (see PatientLabTestOrderViewSet.result_document)
+    result_document_url = serializers.SerializerMethodField()
+
+    def get_result_document_url(self, obj):
+        if not obj.result_document:
+            return None
+        return reverse(
+            'patient-lab-test-result-document', kwargs={'pk': obj.pk}, request=self.context.get('request')
+        )
+
+    def validate_result_document(self, value):
+        return validate_document_size(value)
+
+    def validate(self, attrs):
+        return document_attrs(attrs, 'result_document')
+
     def get_ordered_by_doctor_details(self, obj):
         if obj.ordered_by_doctor:
             return {
@@ -140,8 +186,14 @@ class PatientLabTestOrderSerializer(serializers.ModelSerializer):
             'results_ready_datetime',
             'notes_by_doctor',
             'result_document',
+            'result_document_url',
+            'result_document_sha256',
+            'result_document_size',
             'sample_collection_datetime',
             'actual_cost',
             'updated_at'
         )
-        read_only_fields = ('order_datetime', 'updated_at', 'results_ready_datetime')
+        read_only_fields = (
+            'order_datetime', 'updated_at', 'results_ready_datetime',
+            'result_document_sha256', 'result_document_size',
+        )
@@ -0,0 +1,55 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+
+from .models import DOCUMENT_FIELDS, Appointment, PatientLabTestOrder
+from .storage import add_reference, remove_reference
+from .tasks import notify_appointment_status, notify_lab_result_ready
+
+# Columns whose previous value the post_save handlers compare against
+TRACKED_FIELDS = {
+    **{model: [field_name] for model, field_name in DOCUMENT_FIELDS.items()},
+    PatientLabTestOrder: ['result_document', 'status'],
+    Appointment: ['status'],
+}
+
+# Lab order states in which results are available to the patient
+RESULT_STATUSES = {'PENDING_REVIEW', 'COMPLETED'}
+
+
+def remember_previous_values(sender, instance, **kwargs):
+    fields = TRACKED_FIELDS[sender]
+    row = sender.objects.filter(pk=instance.pk).values_list(*fields).first() if instance.pk is not None else None
+    instance._previous_values = dict(zip(fields, row)) if row else {}
+
+
+def count_document_references(sender, instance, **kwargs):
+    field_name = DOCUMENT_FIELDS[sender]
+    current = getattr(instance, field_name).name or ''
+    previous = instance._previous_values.get(field_name) or ''
+    if current != previous:
+        add_reference(current)
+        remove_reference(previous)
+
+
+def release_document(sender, instance, **kwargs):
+    remove_reference(getattr(instance, DOCUMENT_FIELDS[sender]).name or '')
+
+
+def queue_appointment_notification(sender, instance, created, **kwargs):
+    if not created and instance._previous_values.get('status') != instance.status:
+        notify_appointment_status.enqueue(instance.pk)
+
+
+def queue_lab_result_notification(sender, instance, **kwargs):
+    previous = instance._previous_values
+    results_were_available = previous.get('status') in RESULT_STATUSES or bool(previous.get('result_document'))
+    if not results_were_available and (instance.status in RESULT_STATUSES or instance.result_document):
+        notify_lab_result_ready.enqueue(instance.pk)
+
+
+for model in TRACKED_FIELDS:
+    pre_save.connect(remember_previous_values, sender=model, dispatch_uid=f'tracked_pre_save_{model._meta.label}')
+for model in DOCUMENT_FIELDS:
+    post_save.connect(count_document_references, sender=model, dispatch_uid=f'blobs_post_save_{model._meta.label}')
+    post_delete.connect(release_document, sender=model, dispatch_uid=f'blobs_post_delete_{model._meta.label}')
+post_save.connect(queue_appointment_notification, sender=Appointment, dispatch_uid='notify_appointment_status')
+post_save.connect(queue_lab_result_notification, sender=PatientLabTestOrder, dispatch_uid='notify_lab_result_ready')
@@ -0,0 +1,74 @@
+"""
+Content-addressed storage for medical record and lab result documents.
+
+Files are stored under their SHA-256 (cas/ab/cd/<sha256><ext>), so identical
+uploads share one file and a second upload of the same content skips the
+write entirely. Each stored file has a DocumentBlob row counting the
+MedicalRecord and PatientLabTestOrder rows that point at it: the counts are
+kept by patient_app.signals, and the gc_documents command deletes files that
+nothing has referenced for settings.DOCUMENT_GC_GRACE_HOURS. Files saved before
+this storage was introduced keep their old names and are moved over by the
+migrate_documents command.
+"""
+import os
+import uuid
+
+from django.core.files.storage import FileSystemStorage, storages
+from django.db.models import F
+from django.utils import timezone
+
+from .documents import file_sha256
+
+CAS_PREFIX = 'cas/'
+
+
+def document_storage():
+    """Storage of the document FileFields, configured as STORAGES['documents']."""
+    return storages['documents']
+
+
+def is_content_addressed(name):
+    return bool(name) and name.startswith(CAS_PREFIX)
+
+
+def sha256_from_name(name):
+    """The checksum a content-addressed name was derived from."""
+    return os.path.splitext(os.path.basename(name))[0] if is_content_addressed(name) else ''
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage that names files after their content."""
+
+    def get_available_name(self, name, max_length=None):
+        # The final name is derived from the content in _save, never suffixed
+        return name
+
+    def _save(self, name, content):
+        from .models import DocumentBlob
+
+        checksum = file_sha256(content)
+        extension = os.path.splitext(name)[1].lower()
+        name = f'{CAS_PREFIX}{checksum[:2]}/{checksum[2:4]}/{checksum}{extension}'
+        if not self.exists(name):
+            # Write under a unique name and rename, so readers never see a
+            # partial file and concurrent uploads of the same content are safe
+            partial = super()._save(f'{name}.{uuid.uuid4().hex}.part', content)
+            os.replace(self.path(partial), self.path(name))
+        blob, created = DocumentBlob.objects.get_or_create(
+            name=name, defaults={'sha256': checksum, 'size': content.size}
+        )
+        if not created:
+            # Keep a blob that is about to be referenced again out of reach of gc_documents
+            DocumentBlob.objects.filter(pk=blob.pk).update(updated_at=timezone.now())
+        return name
+
+
+def add_reference(name, count=1):
+    from .models import DocumentBlob
+
+    if is_content_addressed(name):
+        DocumentBlob.objects.filter(name=name).update(ref_count=F('ref_count') + count, updated_at=timezone.now())
+
+
+def remove_reference(name):
+    add_reference(name, -1)
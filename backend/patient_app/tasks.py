@@ -0,0 +1,37 @@
+"""Patient notifications, queued when appointments and lab orders change (see patient_app.signals)."""
+from django.core.mail import send_mail
+
+from task_queue.registry import task
+from .models import Appointment, PatientLabTestOrder
+
+
+def _notify(user, subject, message):
+    # Accounts without an email address have nowhere to be notified
+    if user.email:
+        send_mail(subject=subject, message=message, from_email=None, recipient_list=[user.email])
+
+
+@task(priority=10)
+def notify_appointment_status(appointment_id):
+    appointment = Appointment.objects.select_related('patient__user', 'doctor').filter(pk=appointment_id).first()
+    if appointment is None:
+        return
+    when = appointment.appointment_datetime
+    _notify(
+        appointment.patient.user,
+        f"Appointment {appointment.get_status_display().lower()}",
+        f"Your appointment with Dr. {appointment.doctor.last_name} on {when.strftime('%A, %B %d, %Y')} "
+        f"at {when.strftime('%I:%M %p')} is now {appointment.get_status_display().lower()}.",
+    )
+
+
+@task(priority=10)
+def notify_lab_result_ready(order_id):
+    order = PatientLabTestOrder.objects.select_related('patient__user').filter(pk=order_id).first()
+    if order is None:
+        return
+    _notify(
+        order.patient.user,
+        f"{order.test_name} results available",
+        f"The results of your {order.test_name} test are available in your patient dashboard.",
+    )
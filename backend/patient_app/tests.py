@@ -2,7 +2,7 @@ from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
 from django.contrib.auth.models import User
-from hms.models import Doctor
+from hms.models import Doctor, Receptionist
 from .models import PatientProfile, Appointment, MedicalRecord, PatientLabTestOrder
 from datetime import datetime, timedelta, timezone # Ensure timezone is imported for datetime.timezone.utc
 # from .serializers import PatientProfileSerializer # Not directly needed
@@ -67,18 +67,12 @@ class PatientProfileReceptionistTests(APITestCase):
         response = self.client.post(self.profile_list_create_url, data, format='json')
         # Based on current PatientProfileViewSet permissions, this should be forbidden
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
-from django.urls import reverse
-from rest_framework import status
-from rest_framework.test import APITestCase
-from django.contrib.auth.models import User
-from doctor.models import DoctorProfile, LabTestDefinition
-from .models import PatientProfile, Appointment, MedicalRecord, PatientLabTestOrder
-from datetime import datetime, timedelta, timezone # Ensure timezone is imported for datetime.timezone.utc
-# Add new imports
+
+
 from io import StringIO
 from django.core.management import call_command
 from django.utils import timezone as django_timezone 
-from administrator.models import SystemLog
+from admin_app.models import SystemLog
 
 class PatientProfileAPITests(APITestCase):
     @classmethod
@@ -271,7 +265,7 @@ class AppointmentAPITests(APITestCase):
     def test_admin_list_all_appointments(self):
         response = self.client.get(self.list_create_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), Appointment.objects.count())
+        self.assertEqual(len(response.data['results']), Appointment.objects.count())
 
     def test_patient_create_own_appointment(self):
         self.client.force_authenticate(user=self.patient_user)
@@ -301,8 +295,8 @@ class AppointmentAPITests(APITestCase):
         )
         response = self.client.get(self.list_create_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 2) 
-        for appt_data in response.data:
+        self.assertEqual(len(response.data['results']), 2) 
+        for appt_data in response.data['results']:
             self.assertEqual(appt_data['patient_details']['user_details']['id'], self.patient_profile.user_id) # Corrected path and target
 
     def test_patient_update_own_appointment_reason_or_cancel(self):
@@ -329,8 +323,8 @@ class AppointmentAPITests(APITestCase):
         response = self.client.get(self.list_create_url)
         # print("Response data for test_doctor_list_own_appointments:", response.data) 
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 2)
-        for appt_data in response.data:
+        self.assertEqual(len(response.data['results']), 2)
+        for appt_data in response.data['results']:
             self.assertEqual(appt_data['doctor_details']['user_details']['id'], self.doctor_profile.user_id) # Corrected path and target
 
     def test_doctor_update_own_appointment_status(self):
@@ -358,7 +352,7 @@ class AppointmentAPITests(APITestCase):
         self.client.force_authenticate(user=self.receptionist_user)
         response = self.client.get(self.list_create_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), Appointment.objects.count())
+        self.assertEqual(len(response.data['results']), Appointment.objects.count())
 
 
 class MedicalRecordAPITests(APITestCase):
@@ -445,8 +439,8 @@ class MedicalRecordAPITests(APITestCase):
         )
         response = self.client.get(self.list_create_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 2) 
-        for rec_data in response.data:
+        self.assertEqual(len(response.data['results']), 2) 
+        for rec_data in response.data['results']:
             self.assertEqual(rec_data['doctor_details']['user_details']['id'], self.doctor_profile_one.user_id) # Corrected path and target
 
     def test_doctor_update_own_medical_record(self):
@@ -477,8 +471,8 @@ class MedicalRecordAPITests(APITestCase):
         )
         response = self.client.get(self.list_create_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 2) 
-        for rec_data in response.data:
+        self.assertEqual(len(response.data['results']), 2) 
+        for rec_data in response.data['results']:
             self.assertEqual(rec_data['patient_details']['user_details']['id'], self.patient_profile.user_id) # Corrected path and target
 
     def test_patient_retrieve_own_medical_record(self):
@@ -577,7 +571,7 @@ class PatientLabTestOrderAPITests(APITestCase):
         )
         response = self.client.get(self.list_create_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 2)
+        self.assertEqual(len(response.data['results']), 2)
 
     def test_admin_retrieve_lab_test_order(self):
         self.client.force_authenticate(user=self.admin_user)
@@ -633,8 +627,8 @@ class PatientLabTestOrderAPITests(APITestCase):
         )
         response = self.client.get(self.list_create_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 2) # lab_order_one and the one just created by doc1
-        for order_data in response.data:
+        self.assertEqual(len(response.data['results']), 2) # lab_order_one and the one just created by doc1
+        for order_data in response.data['results']:
             self.assertEqual(order_data['ordered_by_doctor_details']['user_details']['id'], self.doctor_user_one.pk)
 
     def test_doctor_retrieve_own_created_lab_test_order(self):
@@ -684,8 +678,8 @@ class PatientLabTestOrderAPITests(APITestCase):
         )
         response = self.client.get(self.list_create_url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 2) # lab_order_one and the one just created for patient1
-        for order_data in response.data:
+        self.assertEqual(len(response.data['results']), 2) # lab_order_one and the one just created for patient1
+        for order_data in response.data['results']:
             self.assertEqual(order_data['patient_details']['user_details']['id'], self.patient_user_one.pk)
 
     def test_patient_retrieve_own_lab_test_order(self):
@@ -947,4 +941,659 @@ class SendAppointmentRemindersCommandTests(APITestCase):
         # Clean up
         appointment_tomorrow2.delete()
         patient_profile2.delete()
-        patient_user2.delete()
\ No newline at end of file
+        patient_user2.delete()
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+class AppointmentQueryCountTests(APITestCase):
+    """Listing appointments must cost the same number of queries regardless of row count."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.receptionist_user = User.objects.create_user(username='qc_recep', password='password123')
+        Receptionist.objects.create(user=cls.receptionist_user, first_name='Query', last_name='Desk')
+        cls.doctor = Doctor.objects.create(
+            first_name='Query', last_name='Count', specialization='General', department='OPD'
+        )
+        cls.list_url = reverse('appointment-list')
+
+    def setUp(self):
+        self.client.force_authenticate(user=self.receptionist_user)
+
+    def _create_appointments(self, count):
+        start = datetime(2030, 1, 1, 9, 0, tzinfo=timezone.utc)
+        for i in range(count):
+            user = User.objects.create_user(
+                username=f'qc_patient_{Appointment.objects.count()}', password='password123',
+                first_name='Patient', last_name=str(i)
+            )
+            profile = PatientProfile.objects.create(user=user, date_of_birth='2000-01-01')
+            Appointment.objects.create(
+                patient=profile, doctor=self.doctor,
+                appointment_datetime=start + timedelta(hours=i), status='SCHEDULED'
+            )
+
+    def _count_list_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.list_url, {'page_size': 50})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return len(ctx.captured_queries), response
+
+    def test_list_query_count_does_not_grow_with_rows(self):
+        self._create_appointments(2)
+        small_count, small_response = self._count_list_queries()
+
+        self._create_appointments(8)
+        large_count, large_response = self._count_list_queries()
+
+        self.assertGreater(len(large_response.data['results']), len(small_response.data['results']))
+        self.assertEqual(small_count, large_count)
+
+    def test_list_includes_doctor_and_patient_details(self):
+        self._create_appointments(1)
+        _, response = self._count_list_queries()
+        row = response.data['results'][0]
+        self.assertEqual(row['doctor_details']['last_name'], 'Count')
+        self.assertEqual(row['patient_details']['user_details']['first_name'], 'Patient')
+
+    def test_detail_uses_single_query(self):
+        self._create_appointments(1)
+        appointment = Appointment.objects.get()
+        url = reverse('appointment-detail', kwargs={'pk': appointment.pk})
+        # The first request resolves and caches the receptionist's identity
+        self.client.get(url)
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+from unittest import mock
+from django.test import override_settings
+from .models import ReminderDelivery
+from .reminders import BaseReminderBackend
+
+class FailingReminderBackend(BaseReminderBackend):
+    def send(self, reminder):
+        if reminder.message.startswith('Reminder for Fail'):
+            raise RuntimeError('mailbox unavailable')
+
+
+class SendAppointmentRemindersBatchingTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor_user = User.objects.create_user(
+            username='batch_doctor', password='testpass123', first_name='Batch', last_name='Doctor'
+        )
+        cls.doctor = Doctor.objects.create(
+            user=cls.doctor_user, first_name='Batch', last_name='Doctor',
+            specialization='General', department='OPD'
+        )
+        cls.tomorrow = django_timezone.localdate() + timedelta(days=1)
+        day_start = django_timezone.make_aware(datetime.combine(cls.tomorrow, datetime.min.time()))
+        for i in range(7):
+            user = User.objects.create_user(
+                username=f'batch_patient_{i}', password='testpass123',
+                first_name='Fail' if i == 0 else 'Batch', last_name=f'Patient{i}'
+            )
+            profile = PatientProfile.objects.create(user=user, date_of_birth='1999-01-01')
+            Appointment.objects.create(
+                patient=profile, doctor=cls.doctor, status='SCHEDULED',
+                appointment_datetime=day_start + timedelta(hours=8, minutes=15 * i)
+            )
+
+    def _run(self, *args):
+        out, err = StringIO(), StringIO()
+        call_command('send_appointment_reminders', f'--date={self.tomorrow.isoformat()}', *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_batches_log_every_reminder_once(self):
+        out, err = self._run('--batch-size=3', '--concurrency=2')
+        self.assertEqual(err, '')
+        self.assertEqual(out.count('SENT: '), 7)
+        self.assertEqual(SystemLog.objects.count(), 7)
+        self.assertIn('Throughput: 7 reminders', out)
+
+    def test_log_writes_are_batched(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self._run('--batch-size=10')
+        inserts = [q for q in ctx.captured_queries if 'INSERT' in q['sql'] and 'systemlog' in q['sql'].lower()]
+        self.assertEqual(len(inserts), 1)
+
+    def test_failed_deliveries_are_reported_and_not_logged(self):
+        with mock.patch(
+            'patient_app.management.commands.send_appointment_reminders.get_reminder_backend',
+            return_value=FailingReminderBackend(),
+        ):
+            out, err = self._run('--batch-size=4')
+        self.assertIn('mailbox unavailable', err)
+        self.assertEqual(SystemLog.objects.count(), 6)
+        # Not retried in the same run: the failure waits for its backoff
+        self.assertIn('1 delivery attempts failed', out)
+        failed = ReminderDelivery.objects.get(status='FAILED')
+        self.assertEqual(failed.attempts, 1)
+        self.assertEqual(failed.last_error, 'mailbox unavailable')
+        self.assertGreater(failed.next_attempt_at, django_timezone.now())
+
+    @override_settings(REMINDER_RETRY_BACKOFF=60, REMINDER_MAX_BACKOFF=3600)
+    def test_failed_deliveries_back_off_until_max_attempts(self):
+        def run_failing():
+            with mock.patch(
+                'patient_app.management.commands.send_appointment_reminders.get_reminder_backend',
+                return_value=FailingReminderBackend(),
+            ):
+                return self._run()
+
+        run_failing()
+        failed = ReminderDelivery.objects.get(status='FAILED')
+        self.assertLessEqual(failed.next_attempt_at - django_timezone.now(), timedelta(seconds=60))
+        out, _ = run_failing()
+        self.assertNotIn('delivery attempts failed', out)
+
+        # Due again: retried, with a longer wait after the second failure
+        ReminderDelivery.objects.filter(pk=failed.pk).update(next_attempt_at=django_timezone.now())
+        out, _ = run_failing()
+        self.assertIn('1 delivery attempts failed', out)
+        failed.refresh_from_db()
+        self.assertEqual(failed.attempts, 2)
+        self.assertGreater(failed.next_attempt_at - django_timezone.now(), timedelta(seconds=55))
+
+        ReminderDelivery.objects.filter(pk=failed.pk).update(next_attempt_at=django_timezone.now())
+        run_failing()
+        ReminderDelivery.objects.filter(pk=failed.pk).update(next_attempt_at=django_timezone.now())
+        out, _ = run_failing()
+        # --max-attempts (3) reached
+        self.assertNotIn('delivery attempts failed', out)
+        failed.refresh_from_db()
+        self.assertEqual(failed.attempts, 3)
+
+    def test_rerun_does_not_resend(self):
+        self._run()
+        out, _ = self._run()
+        self.assertEqual(out.count('SENT: '), 0)
+        self.assertEqual(SystemLog.objects.count(), 7)
+        self.assertEqual(ReminderDelivery.objects.filter(status='SENT').count(), 7)
+
+    def test_resumes_after_crash_and_skips_live_claims(self):
+        self._run('--dry-run')
+        appointments = list(Appointment.objects.order_by('appointment_datetime'))
+        # One reminder sent and one claim abandoned by a crashed run, one claim
+        # held by a run that is still going
+        ReminderDelivery.objects.create(appointment=appointments[0], status='SENT', attempts=1)
+        ReminderDelivery.objects.create(
+            appointment=appointments[1], status='CLAIMED', claimed_by='crashed', attempts=1,
+            claimed_at=django_timezone.now() - timedelta(hours=1)
+        )
+        ReminderDelivery.objects.create(
+            appointment=appointments[2], status='CLAIMED', claimed_by='running', attempts=1,
+            claimed_at=django_timezone.now()
+        )
+
+        out, _ = self._run()
+        self.assertEqual(out.count('SENT: '), 5)
+        self.assertNotIn(appointments[0].patient.user.last_name + ':', out)
+        self.assertIn(appointments[1].patient.user.last_name + ':', out)
+        self.assertEqual(ReminderDelivery.objects.get(appointment=appointments[2]).claimed_by, 'running')
+        self.assertEqual(ReminderDelivery.objects.filter(appointment__in=appointments).count(), 7)
+
+    def test_dry_run_writes_no_logs(self):
+        out, _ = self._run('--dry-run', '--batch-size=2')
+        self.assertEqual(out.count('[DRY RUN] Would send: '), 7)
+        self.assertEqual(SystemLog.objects.count(), 0)
+
+
+import threading
+from datetime import time
+from django.db import connections
+from django.test import TransactionTestCase, override_settings, skipUnlessDBFeature
+from rest_framework.test import APIClient
+from doctor_app.models import DoctorSchedule
+from rest_framework.exceptions import ValidationError
+from .serializers import AppointmentSerializer
+from .views import AppointmentViewSet
+
+
+def next_monday_at(hour, minute=0):
+    """Return an aware datetime on the next Monday after today at the given local time."""
+    today = django_timezone.localdate()
+    monday = today + timedelta(days=(-today.weekday() - 1) % 7 + 1)
+    return django_timezone.make_aware(datetime.combine(monday, time(hour, minute)))
+
+
+@override_settings(APPOINTMENT_SLOT_MINUTES=30, APPOINTMENT_SLOT_CAPACITY=1)
+class AppointmentBookingCapacityTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = Doctor.objects.create(
+            first_name='Busy', last_name='Doctor', specialization='Cardiology', department='Cardiology'
+        )
+        cls.unscheduled_doctor = Doctor.objects.create(
+            first_name='Free', last_name='Doctor', specialization='General', department='OPD'
+        )
+        # Monday 09:00-11:00, at most three appointments a day
+        DoctorSchedule.objects.create(
+            doctor=cls.doctor, day_of_week='monday', start_time=time(9), end_time=time(11), max_appointments=3
+        )
+        cls.patient_users = []
+        for i in range(4):
+            user = User.objects.create_user(username=f'booking_patient_{i}', password='password123')
+            PatientProfile.objects.create(user=user)
+            cls.patient_users.append(user)
+        cls.list_url = reverse('appointment-list')
+
+    def book(self, patient_user, appointment_datetime, doctor=None):
+        self.client.force_authenticate(user=patient_user)
+        return self.client.post(self.list_url, {
+            'doctor': (doctor or self.doctor).pk,
+            'appointment_datetime': appointment_datetime.isoformat(),
+        }, format='json')
+
+    def test_taken_slot_is_rejected(self):
+        self.assertEqual(self.book(self.patient_users[0], next_monday_at(9)).status_code, status.HTTP_201_CREATED)
+
+        response = self.book(self.patient_users[1], next_monday_at(9, 15))
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('appointment_datetime', response.data)
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_cancelled_appointment_frees_its_slot(self):
+        Appointment.objects.create(
+            patient=self.patient_users[0].patientprofile, doctor=self.doctor,
+            appointment_datetime=next_monday_at(9), status='CANCELLED'
+        )
+
+        response = self.book(self.patient_users[1], next_monday_at(9))
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def test_day_capacity_is_enforced(self):
+        for user, minute in zip(self.patient_users, [0, 30, 60]):
+            response = self.book(user, next_monday_at(9) + timedelta(minutes=minute))
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        response = self.book(self.patient_users[3], next_monday_at(10, 30))
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_time_outside_schedule_is_rejected(self):
+        self.assertEqual(self.book(self.patient_users[0], next_monday_at(12)).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            self.book(self.patient_users[0], next_monday_at(9) + timedelta(days=1)).status_code,
+            status.HTTP_400_BAD_REQUEST,
+        )
+
+    def test_doctor_without_schedule_still_prevents_double_booking(self):
+        first = self.book(self.patient_users[0], next_monday_at(16), doctor=self.unscheduled_doctor)
+        second = self.book(self.patient_users[1], next_monday_at(16, 10), doctor=self.unscheduled_doctor)
+
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_reschedule_into_taken_slot_is_rejected(self):
+        self.book(self.patient_users[0], next_monday_at(9))
+        self.book(self.patient_users[1], next_monday_at(10))
+        appointment = Appointment.objects.get(patient__user=self.patient_users[1])
+        url = reverse('appointment-detail', kwargs={'pk': appointment.pk})
+
+        response = self.client.patch(url, {'appointment_datetime': next_monday_at(9).isoformat()}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.patch(url, {'appointment_datetime': next_monday_at(10, 5).isoformat()}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_reactivating_into_taken_slot_is_rejected(self):
+        cancelled = Appointment.objects.create(
+            patient=self.patient_users[0].patientprofile, doctor=self.doctor,
+            appointment_datetime=next_monday_at(9), status='Cancelled'
+        )
+        self.book(self.patient_users[1], next_monday_at(9, 10))
+
+        # Status is read-only in the API today; any path that sets it goes through perform_update
+        serializer = AppointmentSerializer(cancelled, data={}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.validated_data['status'] = 'SCHEDULED'
+        with self.assertRaises(ValidationError):
+            AppointmentViewSet().perform_update(serializer)
+        cancelled.refresh_from_db()
+        self.assertEqual(cancelled.status, 'Cancelled')
+
+
+@skipUnlessDBFeature('has_select_for_update')
+@override_settings(APPOINTMENT_SLOT_MINUTES=30, APPOINTMENT_SLOT_CAPACITY=2)
+class ConcurrentBookingStressTests(TransactionTestCase):
+    """
+    Fire many simultaneous bookings for one doctor from separate threads, each
+    with its own database connection, and check capacity is never exceeded.
+    Needs a database with row locks (PostgreSQL), so it is skipped on SQLite.
+    """
+    threads = 40
+
+    def setUp(self):
+        self.doctor = Doctor.objects.create(
+            first_name='Popular', last_name='Doctor', specialization='Cardiology', department='Cardiology'
+        )
+        DoctorSchedule.objects.create(
+            doctor=self.doctor, day_of_week='monday', start_time=time(9), end_time=time(12), max_appointments=5
+        )
+        self.patient_users = []
+        for i in range(self.threads):
+            user = User.objects.create_user(username=f'stress_patient_{i}', password='password123')
+            PatientProfile.objects.create(user=user)
+            self.patient_users.append(user)
+
+    def run_bookings(self, times):
+        barrier = threading.Barrier(len(self.patient_users))
+        statuses = []
+
+        def book(user, appointment_datetime):
+            client = APIClient()
+            client.force_authenticate(user=user)
+            try:
+                barrier.wait()
+                response = client.post(reverse('appointment-list'), {
+                    'doctor': self.doctor.pk, 'appointment_datetime': appointment_datetime.isoformat(),
+                }, format='json')
+                statuses.append(response.status_code)
+            finally:
+                connections.close_all()
+
+        workers = [
+            threading.Thread(target=book, args=(user, times[i % len(times)]))
+            for i, user in enumerate(self.patient_users)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return statuses
+
+    def test_one_slot_never_exceeds_slot_capacity(self):
+        statuses = self.run_bookings([next_monday_at(9)])
+
+        self.assertEqual(statuses.count(status.HTTP_201_CREATED), 2)
+        self.assertEqual(statuses.count(status.HTTP_400_BAD_REQUEST), self.threads - 2)
+        self.assertEqual(Appointment.objects.filter(doctor=self.doctor).count(), 2)
+
+    def test_whole_day_never_exceeds_max_appointments(self):
+        statuses = self.run_bookings([next_monday_at(9) + timedelta(minutes=30 * i) for i in range(6)])
+
+        self.assertEqual(statuses.count(status.HTTP_201_CREATED), 5)
+        self.assertEqual(Appointment.objects.filter(doctor=self.doctor).count(), 5)
+
+
+from django.utils.http import http_date
+
+from .serializers import MedicalRecordSerializer, PatientLabTestOrderSerializer
+
+
+class ConditionalGetTests(APITestCase):
+    """Record and lab order endpoints answer revalidation with 304 while nothing changed."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient_user = User.objects.create_user(username='cond_patient', password='password123')
+        cls.profile = PatientProfile.objects.create(user=cls.patient_user, date_of_birth='1990-01-01')
+        cls.record = MedicalRecord.objects.create(
+            patient=cls.profile, record_type='Consultation', description='Initial visit'
+        )
+        cls.order = PatientLabTestOrder.objects.create(patient=cls.profile, test_name='CBC')
+
+    def setUp(self):
+        self.client.force_authenticate(user=self.patient_user)
+
+    def assert_not_modified(self, url, serializer_class, **headers):
+        with mock.patch.object(serializer_class, 'to_representation') as to_representation:
+            response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        to_representation.assert_not_called()
+        return response
+
+    def test_unchanged_list_returns_not_modified(self):
+        for url, serializer_class in [
+            (reverse('medicalrecord-list'), MedicalRecordSerializer),
+            (reverse('patientlabtestorder-list'), PatientLabTestOrderSerializer),
+        ]:
+            first = self.client.get(url)
+            self.assertEqual(first.status_code, status.HTTP_200_OK)
+            self.assertNotIn('Last-Modified', first)
+            self.assert_not_modified(url, serializer_class, HTTP_IF_NONE_MATCH=first['ETag'])
+
+    def test_new_or_changed_rows_change_the_list_validators(self):
+        url = reverse('medicalrecord-list')
+        etag = self.client.get(url)['ETag']
+
+        MedicalRecord.objects.create(patient=self.profile, record_type='Follow-up', description='Second visit')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 2)
+
+        etag = response['ETag']
+        MedicalRecord.objects.filter(pk=self.record.pk).delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 1)
+
+        # A list is never answered from If-Modified-Since, which deletes would not move
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=http_date((django_timezone.now() + timedelta(minutes=1)).timestamp()))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_detail_is_validated_per_object(self):
+        url = reverse('patientlabtestorder-detail', kwargs={'pk': self.order.pk})
+        first = self.client.get(url)
+        etag = first['ETag']
+        self.assert_not_modified(url, PatientLabTestOrderSerializer, HTTP_IF_NONE_MATCH=etag)
+        self.assert_not_modified(url, PatientLabTestOrderSerializer, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+
+        self.order.status = 'SAMPLE_COLLECTED'
+        self.order.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], 'SAMPLE_COLLECTED')
+
+
+import hashlib
+import shutil
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+
+class DocumentStreamingTests(APITestCase):
+    """Documents are uploaded with a checksum and downloaded in full, by range or via the proxy."""
+
+    content = b'%PDF-1.4 ' + bytes(range(256)) * 4
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = User.objects.create_superuser(username='doc_admin', password='password123')
+        cls.patient_user = User.objects.create_user(username='doc_patient', password='password123')
+        cls.other_user = User.objects.create_user(username='doc_other', password='password123')
+        cls.profile = PatientProfile.objects.create(user=cls.patient_user, date_of_birth='1990-01-01')
+        PatientProfile.objects.create(user=cls.other_user, date_of_birth='1990-01-01')
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        self.enterContext(self.settings(MEDIA_ROOT=media_root, DOCUMENT_SENDFILE_MODE=''))
+        self.record = MedicalRecord.objects.create(
+            patient=self.profile, record_type='Imaging', description='Scan'
+        )
+        self.detail_url = reverse('medicalrecord-detail', kwargs={'pk': self.record.pk})
+        self.download_url = reverse('medicalrecord-document', kwargs={'pk': self.record.pk})
+
+    def upload(self, content):
+        self.client.force_authenticate(user=self.admin_user)
+        return self.client.patch(
+            self.detail_url, {'document': SimpleUploadedFile('scan.pdf', content)}, format='multipart'
+        )
+
+    def attach(self):
+        self.record.document.save('scan.pdf', ContentFile(self.content))
+        self.record.document_sha256 = hashlib.sha256(self.content).hexdigest()
+        self.record.save()
+
+    def test_upload_records_checksum_and_size(self):
+        response = self.upload(self.content)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.record.refresh_from_db()
+        self.assertEqual(self.record.document_sha256, hashlib.sha256(self.content).hexdigest())
+        self.assertEqual(self.record.document_size, len(self.content))
+        self.assertEqual(
+            response.data['document_url'],
+            'http://testserver' + reverse('medical-record-document', kwargs={'pk': self.record.pk}),
+        )
+
+    def test_oversized_upload_is_rejected(self):
+        with self.settings(DOCUMENT_MAX_UPLOAD_SIZE=16):
+            response = self.upload(self.content)
+
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.record.refresh_from_db()
+        self.assertFalse(self.record.document)
+
+    def test_full_and_ranged_downloads(self):
+        self.attach()
+        self.client.force_authenticate(user=self.patient_user)
+
+        response = self.client.get(self.download_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        etag = response['ETag']
+
+        response = self.client.get(self.download_url, HTTP_RANGE='bytes=9-18', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b''.join(response.streaming_content), self.content[9:19])
+        self.assertEqual(response['Content-Range'], f'bytes 9-18/{len(self.content)}')
+
+        response = self.client.get(self.download_url, HTTP_RANGE='bytes=-4')
+        self.assertEqual(b''.join(response.streaming_content), self.content[-4:])
+
+        response = self.client.get(self.download_url, HTTP_RANGE='bytes=9-18', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.get(self.download_url, HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+
+        response = self.client.get(self.download_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_proxy_mode_offloads_transfer_after_permission_check(self):
+        self.attach()
+        with self.settings(DOCUMENT_SENDFILE_MODE='x-accel-redirect', DOCUMENT_SENDFILE_PREFIX='/protected/'):
+            self.client.force_authenticate(user=self.other_user)
+            self.assertEqual(self.client.get(self.download_url).status_code, status.HTTP_403_FORBIDDEN)
+
+            self.client.force_authenticate(user=self.patient_user)
+            response = self.client.get(self.download_url, HTTP_ACCEPT='application/pdf')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected/{self.record.document.name}')
+        self.assertEqual(response.content, b'')
+
+    def test_missing_document_is_not_found(self):
+        self.client.force_authenticate(user=self.patient_user)
+        self.assertEqual(self.client.get(self.download_url).status_code, status.HTTP_404_NOT_FOUND)
+
+
+import os
+
+from django.core.files.storage import FileSystemStorage
+
+from .models import DocumentBlob
+from .storage import document_storage
+
+
+class ContentAddressedStorageTests(APITestCase):
+    """Identical documents are stored once, reference counted, collected and migrated."""
+
+    content = b'%PDF-1.4 shared protocol'
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='cas_patient', password='password123')
+        cls.profile = PatientProfile.objects.create(user=user, date_of_birth='1990-01-01')
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.enterContext(self.settings(MEDIA_ROOT=self.media_root))
+
+    def make_record(self, content=content):
+        record = MedicalRecord.objects.create(patient=self.profile, record_type='Protocol', description='Protocol')
+        record.document.save('protocol.pdf', ContentFile(content))
+        return record
+
+    def stored_files(self):
+        return [
+            os.path.join(directory, filename)
+            for directory, _, filenames in os.walk(os.path.join(self.media_root, 'cas')) for filename in filenames
+        ]
+
+    def test_identical_uploads_share_one_file(self):
+        first = self.make_record()
+        order = PatientLabTestOrder.objects.create(patient=self.profile, test_name='CBC')
+        order.result_document.save('result.PDF', ContentFile(self.content))
+
+        self.assertEqual(first.document.name, order.result_document.name)
+        self.assertTrue(first.document.name.endswith(hashlib.sha256(self.content).hexdigest() + '.pdf'))
+        self.assertEqual(len(self.stored_files()), 1)
+        self.assertEqual(DocumentBlob.objects.get().ref_count, 2)
+
+    def test_references_follow_replacements_and_deletes(self):
+        first = self.make_record()
+        second = self.make_record()
+        shared_name = first.document.name
+
+        second.document.save('other.pdf', ContentFile(b'different content'))
+        self.assertEqual(DocumentBlob.objects.get(name=shared_name).ref_count, 1)
+        self.assertEqual(DocumentBlob.objects.get(name=second.document.name).ref_count, 1)
+
+        first.delete()
+        self.assertEqual(DocumentBlob.objects.get(name=shared_name).ref_count, 0)
+
+    def test_gc_deletes_only_unreferenced_files(self):
+        kept = self.make_record()
+        dropped = self.make_record(b'temporary scan')
+        dropped_name = dropped.document.name
+        dropped.delete()
+
+        call_command('gc_documents', grace_hours=1, stdout=StringIO())
+        self.assertTrue(DocumentBlob.objects.filter(name=dropped_name).exists())  # still within the grace period
+
+        call_command('gc_documents', grace_hours=0, stdout=StringIO())
+        self.assertFalse(DocumentBlob.objects.filter(name=dropped_name).exists())
+        self.assertFalse(document_storage().exists(dropped_name))
+        self.assertTrue(document_storage().exists(kept.document.name))
+
+    def test_gc_recount_fixes_drifted_counts(self):
+        record = self.make_record()
+        DocumentBlob.objects.update(ref_count=0)
+
+        call_command('gc_documents', grace_hours=0, recount=True, stdout=StringIO())
+
+        self.assertEqual(DocumentBlob.objects.get(name=record.document.name).ref_count, 1)
+        self.assertTrue(document_storage().exists(record.document.name))
+
+    def test_migrate_documents_moves_legacy_files(self):
+        legacy_names = []
+        for _ in range(2):
+            name = FileSystemStorage(location=self.media_root).save('medical_records/old.pdf', ContentFile(self.content))
+            record = MedicalRecord.objects.create(patient=self.profile, record_type='Legacy', description='Old')
+            MedicalRecord.objects.filter(pk=record.pk).update(document=name)
+            legacy_names.append(name)
+
+        call_command('migrate_documents', delete_originals=True, stdout=StringIO())
+
+        names = set(MedicalRecord.objects.values_list('document', flat=True))
+        self.assertEqual(len(names), 1)
+        [name] = names
+        self.assertEqual(DocumentBlob.objects.get(name=name).ref_count, 2)
+        self.assertEqual(
+            set(MedicalRecord.objects.values_list('document_sha256', flat=True)),
+            {hashlib.sha256(self.content).hexdigest()},
+        )
+        self.assertFalse(any(os.path.exists(os.path.join(self.media_root, old)) for old in legacy_names))
@@ -1,11 +1,22 @@
 from django.shortcuts import render
+from django.db import transaction
 from rest_framework import viewsets, permissions, status
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from .models import PatientProfile, Appointment, MedicalRecord, PatientLabTestOrder
 from .serializers import PatientProfileSerializer, AppointmentSerializer, MedicalRecordSerializer, PatientLabTestOrderSerializer
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
-from hms.models import Doctor
+from archive.models import ArchivedRecord
+from archive.reads import ArchiveReadMixin
+from hms.conditional import ConditionalGetMixin
+from hms.pagination import TimeCursorPagination
+from hms.replicas import ReplicaReadMixin
+from hms.roles import get_role, resolve_identity
+from doctor_app.availability import INACTIVE_APPOINTMENT_STATUSES
+from .booking import BookingError, ensure_bookable
+from .documents import ChecksumUploadMixin, PassthroughRenderer, serve_document
 
 # Define custom permission classes
 class IsOwner(permissions.BasePermission):
@@ -32,34 +43,41 @@ class IsDoctorOrReceptionistRole(permissions.BasePermission):
     def has_permission(self, request, view):
         return request.user.is_authenticated
 
+# The object-level checks compare foreign key ids with the cached identity
+# (see hms.roles) instead of loading the user's profile rows
 class IsPatientOfRecord(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
-        if hasattr(request.user, 'patientprofile'):
-            return obj.patient == request.user.patientprofile
+        identity = resolve_identity(request.user)
+        if identity and identity.patient_profile_id is not None:
+            return obj.patient_id == identity.patient_profile_id
         return False
 
 class IsDoctorOfRecord(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
-        if hasattr(request.user, 'doctor'):
-            return obj.doctor == request.user.doctor
+        identity = resolve_identity(request.user)
+        if identity and identity.doctor_id is not None:
+            return obj.doctor_id == identity.doctor_id
         return False
 
 class IsPatientOwnerOfOrder(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
-        if hasattr(request.user, 'patientprofile'):
-            return obj.patient == request.user.patientprofile
+        identity = resolve_identity(request.user)
+        if identity and identity.patient_profile_id is not None:
+            return obj.patient_id == identity.patient_profile_id
         return False
 
 class IsDoctorWhoOrdered(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
-        if hasattr(request.user, 'doctor'):
-            return obj.ordered_by_doctor == request.user.doctor
+        identity = resolve_identity(request.user)
+        if identity and identity.doctor_id is not None:
+            return obj.ordered_by_doctor_id == identity.doctor_id
         return False
 
 # Create your views here.
 
 class PatientProfileViewSet(viewsets.ModelViewSet):
-    queryset = PatientProfile.objects.all()
+    # The linked hms.Patient is found through its unique user index in the same query
+    queryset = PatientProfile.objects.select_related('user__hms_patient')
     serializer_class = PatientProfileSerializer
     # permission_classes = [permissions.IsAdminUser] # Default to admin for all actions
 
@@ -75,31 +93,31 @@ class PatientProfileViewSet(viewsets.ModelViewSet):
             self.permission_classes = [IsAdministratorRole] # Default
         return [permission() for permission in self.permission_classes]
 
-class AppointmentViewSet(viewsets.ModelViewSet):
+class AppointmentViewSet(ReplicaReadMixin, ArchiveReadMixin, viewsets.ModelViewSet):
     serializer_class = AppointmentSerializer
+    pagination_class = TimeCursorPagination
+    cursor_ordering = ('-appointment_datetime', '-id')
+    archived_related = ('doctor', 'patient__user__hms_patient')
     # queryset = Appointment.objects.all() # Queryset will be filtered by get_queryset
     # permission_classes = [permissions.IsAuthenticated] # Placeholder, refine later
 
     def get_queryset(self):
-        user = self.request.user
-        if not user or not user.is_authenticated:
-            return Appointment.objects.none()
+        # Role-based filtering with doctor, patient profile and user loaded in
+        # the same query, so list and detail responses don't issue per-row lookups
+        return Appointment.objects.for_user(self.request.user)
 
-        if user.role == "ADMIN" or user.role == "RECEPTIONIST":
-            return Appointment.objects.all().order_by('-appointment_datetime') # Corrected ordering
-        elif user.role == "DOCTOR":
-            # Get the Doctor instance for this user
-            try:
-                doctor = Doctor.objects.get(user=user)
-                return Appointment.objects.filter(doctor=doctor).order_by('-appointment_datetime')
-            except Doctor.DoesNotExist:
-                return Appointment.objects.none()
-        elif user.role == "PATIENT":
-            # Assuming PatientProfile is linked to the user and Appointment has a 'patient' FK
-            if hasattr(user, 'patientprofile'):
-                return Appointment.objects.filter(patient=user.patientprofile).order_by('-appointment_datetime') # Corrected ordering
-            return Appointment.objects.none()
-        return Appointment.objects.none()
+    def get_archived_queryset(self):
+        # Same visibility as Appointment.objects.for_user
+        user = self.request.user
+        records = ArchivedRecord.objects.of(Appointment)
+        role = get_role(user)
+        if role == "ADMIN" or role == "RECEPTIONIST":
+            return records
+        if role == "DOCTOR":
+            return records.filter(doctor_id=resolve_identity(user).doctor_id)
+        if role == "PATIENT":
+            return records.filter(patient_id=user.pk)
+        return records.none()
 
     def get_permissions(self):
         if self.action == 'create':
@@ -121,15 +139,32 @@ class AppointmentViewSet(viewsets.ModelViewSet):
             self.permission_classes = [IsAdministratorRole] # Default
         return [permission() for permission in self.permission_classes]
 
+    def save_booking(self, serializer, **kwargs):
+        """
+        Save the appointment in the same transaction that locks the doctor and
+        checks slot and day capacity, so concurrent bookings cannot overbook.
+        """
+        instance = serializer.instance
+        doctor = serializer.validated_data.get('doctor', instance.doctor if instance else None)
+        appointment_datetime = serializer.validated_data.get(
+            'appointment_datetime', instance.appointment_datetime if instance else None
+        )
+        with transaction.atomic():
+            try:
+                ensure_bookable(doctor, appointment_datetime, exclude_pk=instance.pk if instance else None)
+            except BookingError as exc:
+                raise ValidationError({'appointment_datetime': [str(exc)]})
+            serializer.save(**kwargs)
+
     def perform_create(self, serializer):
         user = self.request.user
-        if user.role == "PATIENT":
+        if get_role(user) == "PATIENT":
             # Patients can only create appointments for themselves
-            if hasattr(user, 'patientprofile'):
+            identity = resolve_identity(user)
+            if identity.patient_profile_id is not None:
                 # Status will default to 'REQUESTED' as per model definition
-                serializer.save(patient=user.patientprofile)
+                self.save_booking(serializer, patient_id=identity.patient_profile_id)
             else:
-                from rest_framework.exceptions import ValidationError
                 raise ValidationError("Patient profile not found for the current user.")
         # Removed Admin/Receptionist block for creating 'REQUESTED' appointments via this specific patient-facing endpoint.
         # They would typically update a 'REQUESTED' appointment to 'SCHEDULED' or use a different interface.
@@ -138,6 +173,23 @@ class AppointmentViewSet(viewsets.ModelViewSet):
             from rest_framework.exceptions import PermissionDenied
             raise PermissionDenied("You do not have permission to request an appointment.")
 
+    def perform_update(self, serializer):
+        instance = serializer.instance
+        rescheduled = (
+            serializer.validated_data.get('doctor', instance.doctor) != instance.doctor
+            or serializer.validated_data.get('appointment_datetime', instance.appointment_datetime)
+            != instance.appointment_datetime
+        )
+        # A cancelled appointment that becomes active takes its slot back
+        reactivated = (
+            instance.status in INACTIVE_APPOINTMENT_STATUSES
+            and serializer.validated_data.get('status', instance.status) not in INACTIVE_APPOINTMENT_STATUSES
+        )
+        if rescheduled or reactivated:
+            self.save_booking(serializer)
+        else:
+            serializer.save()
+
     @action(detail=True, methods=['patch'], url_path='cancel')
     def cancel(self, request, pk=None):
         """
@@ -158,28 +210,34 @@ class AppointmentViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(appointment)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
-class MedicalRecordViewSet(viewsets.ModelViewSet):
+class MedicalRecordViewSet(ReplicaReadMixin, ChecksumUploadMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     serializer_class = MedicalRecordSerializer
+    pagination_class = TimeCursorPagination
+    cursor_ordering = ('-created_at', '-id')
     # queryset = MedicalRecord.objects.all() # Default queryset
 
     def get_queryset(self):
+        # Patient (with user and linked hms.Patient) and doctor rendered by the serializer
+        return self.get_role_queryset().select_related('doctor', 'patient__user__hms_patient')
+
+    def get_role_queryset(self):
         user = self.request.user
         if not user or not user.is_authenticated:
             return MedicalRecord.objects.none()
 
         # For list actions, apply role-based filtering
         if self.action == 'list':
-            if user.role == "ADMIN":
+            role = get_role(user)
+            if role == "ADMIN":
                 return MedicalRecord.objects.all()
-            elif user.role == "DOCTOR":
-                try:
-                    doctor = Doctor.objects.get(user=user)
-                    return MedicalRecord.objects.filter(doctor=doctor)
-                except Doctor.DoesNotExist:
-                    return MedicalRecord.objects.none()
-            elif user.role == "PATIENT":
-                if hasattr(user, 'patientprofile'):
-                    return MedicalRecord.objects.filter(patient=user.patientprofile)
+            identity = resolve_identity(user)
+            if role == "DOCTOR":
+                if identity.doctor_id is not None:
+                    return MedicalRecord.objects.filter(doctor_id=identity.doctor_id)
+                return MedicalRecord.objects.none()
+            elif role == "PATIENT":
+                if identity.patient_profile_id is not None:
+                    return MedicalRecord.objects.filter(patient_id=identity.patient_profile_id)
                 return MedicalRecord.objects.none()
             return MedicalRecord.objects.none()
         else:
@@ -195,7 +253,7 @@ class MedicalRecordViewSet(viewsets.ModelViewSet):
             self.permission_classes = [IsDoctorRole | IsAdministratorRole]
         elif self.action == 'list':
             self.permission_classes = [permissions.IsAuthenticated] # Queryset handles filtering
-        elif self.action == 'retrieve':
+        elif self.action in ['retrieve', 'document']:
             # Admin, or associated Doctor, or associated Patient
             self.permission_classes = [IsAdministratorRole | IsDoctorOfRecord | IsPatientOfRecord]
         elif self.action in ['update', 'partial_update']:
@@ -209,15 +267,14 @@ class MedicalRecordViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         user = self.request.user
+        role = get_role(user)
         # Set the doctor field to the creating doctor
-        if user.role == "DOCTOR":
-            try:
-                doctor = Doctor.objects.get(user=user)
-                serializer.save(doctor=doctor)
-            except Doctor.DoesNotExist:
-                from rest_framework.exceptions import ValidationError
+        if role == "DOCTOR":
+            doctor_id = resolve_identity(user).doctor_id
+            if doctor_id is None:
                 raise ValidationError("Doctor profile not found for the current user.")
-        elif user.role == "ADMIN":
+            serializer.save(doctor_id=doctor_id)
+        elif role == "ADMIN":
             # Admin might need to specify the doctor if not themselves
             # For now, let's assume admin can create records, doctor field might be optional or set via payload
             serializer.save()
@@ -225,7 +282,15 @@ class MedicalRecordViewSet(viewsets.ModelViewSet):
             from rest_framework.exceptions import PermissionDenied
             raise PermissionDenied("You do not have permission to create medical records.")
 
-class PatientLabTestOrderViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['get'], renderer_classes=[JSONRenderer, PassthroughRenderer])
+    def document(self, request, pk=None):
+        """Download the record's document (Range requests supported)."""
+        record = self.get_object()
+        if not record.document:
+            raise NotFound("This medical record has no document.")
+        return serve_document(request, record.document, record.document_sha256)
+
+class PatientLabTestOrderViewSet(ReplicaReadMixin, ArchiveReadMixin, ChecksumUploadMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     """
     API endpoint for managing patient lab test orders.
     - Admins: Full CRUD.
@@ -233,26 +298,47 @@ class PatientLabTestOrderViewSet(viewsets.ModelViewSet):
     - Patients: Can list/retrieve their own orders.
     """
     serializer_class = PatientLabTestOrderSerializer
+    pagination_class = TimeCursorPagination
+    cursor_ordering = ('-order_datetime', '-id')
+    archived_related = ('ordered_by_doctor', 'patient__user__hms_patient')
 
     def get_queryset(self):
+        # Patient (with user and linked hms.Patient) and doctor rendered by the serializer
+        return self.get_role_queryset().select_related('ordered_by_doctor', 'patient__user__hms_patient')
+
+    def get_archived_queryset(self):
+        # Same visibility as the list branch of get_role_queryset
+        user = self.request.user
+        records = ArchivedRecord.objects.of(PatientLabTestOrder)
+        role = get_role(user)
+        if role == "ADMIN":
+            return records
+        identity = resolve_identity(user)
+        if role == "DOCTOR" and identity.doctor_id is not None:
+            return records.filter(doctor_id=identity.doctor_id)
+        if role == "PATIENT" and identity.patient_profile_id is not None:
+            return records.filter(patient_id=identity.patient_profile_id)
+        return records.none()
+
+    def get_role_queryset(self):
         user = self.request.user
         if not user or not user.is_authenticated:
             return PatientLabTestOrder.objects.none()
 
         # For list actions, apply role-based filtering
         if self.action == 'list':
-            if user.role == "ADMIN":
+            role = get_role(user)
+            if role == "ADMIN":
                 return PatientLabTestOrder.objects.all()
-            elif user.role == "DOCTOR":
-                try:
-                    doctor = Doctor.objects.get(user=user)
-                    # Doctors can see orders they created
-                    return PatientLabTestOrder.objects.filter(ordered_by_doctor=doctor)
-                except Doctor.DoesNotExist:
-                    return PatientLabTestOrder.objects.none()
-            elif user.role == "PATIENT":
-                if hasattr(user, 'patientprofile'):
-                    return PatientLabTestOrder.objects.filter(patient=user.patientprofile)
+            identity = resolve_identity(user)
+            if role == "DOCTOR":
+                # Doctors can see orders they created
+                if identity.doctor_id is not None:
+                    return PatientLabTestOrder.objects.filter(ordered_by_doctor_id=identity.doctor_id)
+                return PatientLabTestOrder.objects.none()
+            elif role == "PATIENT":
+                if identity.patient_profile_id is not None:
+                    return PatientLabTestOrder.objects.filter(patient_id=identity.patient_profile_id)
                 return PatientLabTestOrder.objects.none()
             # For other roles like RECEPTIONIST, return none for list action by default
             return PatientLabTestOrder.objects.none()
@@ -271,7 +357,7 @@ class PatientLabTestOrderViewSet(viewsets.ModelViewSet):
             # Other authenticated roles (like Receptionist) will get an empty list due to get_queryset
             # If a 403 is strictly needed for Receptionist list, add specific role check here.
             self.permission_classes = [IsAdministratorRole | IsDoctorRole | IsPatientRole ]
-        elif self.action == 'retrieve':
+        elif self.action in ['retrieve', 'result_document']:
             # User must be authenticated, and then be Admin, or the Doctor who ordered, or the Patient who owns the order
             self.permission_classes = [permissions.IsAuthenticated, (IsAdministratorRole | IsDoctorWhoOrdered | IsPatientOwnerOfOrder)]
         elif self.action in ['update', 'partial_update']:
@@ -286,16 +372,24 @@ class PatientLabTestOrderViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         user = self.request.user
-        if user.role == "DOCTOR":
-            try:
-                doctor = Doctor.objects.get(user=user)
-                serializer.save(ordered_by_doctor=doctor)
-            except Doctor.DoesNotExist:
-                from rest_framework.exceptions import ValidationError
+        role = get_role(user)
+        if role == "DOCTOR":
+            doctor_id = resolve_identity(user).doctor_id
+            if doctor_id is None:
                 raise ValidationError("Doctor profile not found for the current user.")
-        elif user.role == "ADMIN" or user.role == "RECEPTIONIST":
+            serializer.save(ordered_by_doctor_id=doctor_id)
+        elif role == "ADMIN" or role == "RECEPTIONIST":
             # Admin may create on behalf of a doctor
             serializer.save()
         else:
             from rest_framework.exceptions import PermissionDenied
             raise PermissionDenied("You do not have permission to create lab test orders.")
+
+    @action(detail=True, methods=['get'], url_path='result-document',
+            renderer_classes=[JSONRenderer, PassthroughRenderer])
+    def result_document(self, request, pk=None):
+        """Download the order's result document (Range requests supported)."""
+        order = self.get_object()
+        if not order.result_document:
+            raise NotFound("This lab test order has no result document.")
+        return serve_document(request, order.result_document, order.result_document_sha256)
@@ -4,7 +4,11 @@ from patient_app.models import PatientProfile
 
 class Receptionist(models.Model):
     """
-    Receptionist profile model linked to a Django User
+    Receptionist profile model linked to a Django User.
+
+    Deprecated: hms.Receptionist is the single receptionist record and is the
+    only one written on registration. Existing rows are copied over by the
+    hms merge_identities migration and command.
     """
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='receptionist')
     contact_number = models.CharField(max_length=15, blank=True, null=True)
@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+from django.utils.module_loading import autodiscover_modules
+
+
+class TaskQueueConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'task_queue'
+
+    def ready(self):
+        # Register the @task handlers defined in each app's tasks module
+        autodiscover_modules('tasks')
@@ -0,0 +1,85 @@
+import multiprocessing
+import signal
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from task_queue.worker import Worker
+
+
+def _run_worker_process(batch_size, poll_interval, once, stop_event):
+    # Workers started with "spawn" need the app registry first
+    django.setup()
+    # Ctrl-C reaches the whole process group; let the parent decide when to stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    Worker(batch_size=batch_size, poll_interval=poll_interval).run(once=once, stop_event=stop_event)
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs background task workers that execute queued tasks (notifications, audit logging, '
+        'reporting) from the database. Stop with Ctrl-C or SIGTERM; running tasks are finished first.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=1, help='Number of worker processes (default: 1).')
+        parser.add_argument('--batch-size', type=int, default=1, help='Tasks each worker claims at a time (default: 1).')
+        parser.add_argument(
+            '--poll-interval', type=float,
+            help='Seconds an idle worker waits before looking for new tasks (default: settings.TASK_QUEUE_POLL_INTERVAL).'
+        )
+        parser.add_argument('--once', action='store_true', help='Exit once no task is due instead of waiting for more.')
+
+    def handle(self, *args, **options):
+        concurrency = options['concurrency']
+        if concurrency < 1:
+            raise CommandError('--concurrency must be at least 1.')
+
+        if concurrency == 1:
+            stop_event = multiprocessing.Event()
+            previous_handlers = self.handle_signals(stop_event)
+            try:
+                Worker(
+                    batch_size=options['batch_size'], poll_interval=options['poll_interval'], stdout=self.stdout
+                ).run(once=options['once'], stop_event=stop_event)
+            finally:
+                self.restore_signals(previous_handlers)
+            return
+
+        # Forked children must not share the parent's database connections
+        connections.close_all()
+        stop_event = multiprocessing.Event()
+        processes = [
+            multiprocessing.Process(
+                target=_run_worker_process,
+                args=(options['batch_size'], options['poll_interval'], options['once'], stop_event),
+                name=f'task-worker-{index}',
+            )
+            for index in range(concurrency)
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(f"Started {concurrency} workers (pids {', '.join(str(p.pid) for p in processes)}).")
+        previous_handlers = self.handle_signals(stop_event)
+        try:
+            for process in processes:
+                process.join()
+        finally:
+            self.restore_signals(previous_handlers)
+
+        failed = [process.name for process in processes if process.exitcode]
+        if failed:
+            raise CommandError(f"Workers exited with errors: {', '.join(failed)}")
+        self.stdout.write(self.style.SUCCESS('All workers stopped.'))
+
+    def handle_signals(self, stop_event):
+        def stop(signum, frame):
+            self.stdout.write('Stopping workers after their current task...')
+            stop_event.set()
+
+        return {signum: signal.signal(signum, stop) for signum in (signal.SIGINT, signal.SIGTERM)}
+
+    def restore_signals(self, previous_handlers):
+        for signum, handler in previous_handlers.items():
+            signal.signal(signum, handler)
@@ -0,0 +1,67 @@
+"""
+Task handler registration and enqueueing.
+
+Decorate a module-level function in an app's ``tasks`` module with @task and
+call ``func.enqueue(*args, **kwargs)`` from request code. The call is stored as
+a Task row in the current transaction, so it is only picked up by a worker if
+the surrounding changes commit, and the request returns without waiting for
+it. Arguments must be JSON serializable; pass primary keys rather than model
+instances.
+
+With settings.TASK_QUEUE_EAGER the handler instead runs in-process once the
+transaction commits, which is convenient in development without a worker.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+registry = {}
+
+
+class TaskHandler:
+    def __init__(self, func, name, priority, max_attempts):
+        self.func = func
+        self.name = name
+        self.priority = priority
+        self.max_attempts = max_attempts
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def enqueue(self, *args, **kwargs):
+        """Queue a call with the handler's default priority."""
+        return enqueue(self.name, args=args, kwargs=kwargs)
+
+    def __repr__(self):
+        return f"<TaskHandler {self.name}>"
+
+
+def task(name=None, priority=0, max_attempts=3):
+    """Register a function as a task handler."""
+    def decorator(func):
+        handler = TaskHandler(func, name or f'{func.__module__}.{func.__name__}', priority, max_attempts)
+        registry[handler.name] = handler
+        return handler
+    return decorator
+
+
+def enqueue(name, args=(), kwargs=None, priority=None, delay=None):
+    """Queue a call of the named handler; returns the Task row (None in eager mode)."""
+    from .models import Task
+
+    handler = registry.get(name)
+    if handler is None:
+        raise LookupError(f"No task handler registered as '{name}'")
+    if settings.TASK_QUEUE_EAGER:
+        transaction.on_commit(lambda: handler.func(*args, **(kwargs or {})))
+        return None
+    return Task.objects.create(
+        name=name,
+        args=list(args),
+        kwargs=kwargs or {},
+        priority=handler.priority if priority is None else priority,
+        max_attempts=handler.max_attempts,
+        run_at=timezone.now() + (delay or timedelta()),
+    )
@@ -0,0 +1,109 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.management import call_command
+from django.test import TransactionTestCase
+from django.utils import timezone
+
+from hms.models import Doctor
+from patient_app.models import Appointment, PatientProfile
+from .models import Task
+from .registry import enqueue, task
+from .worker import Worker
+
+calls = []
+
+
+@task(name='task_queue.tests.record_call')
+def record_call(label):
+    calls.append(label)
+
+
+@task(name='task_queue.tests.always_fails', max_attempts=2)
+def always_fails():
+    raise RuntimeError('handler failed')
+
+
+class TaskQueueTests(TransactionTestCase):
+    # The worker manages its own transactions and connections, as it does outside tests
+    def setUp(self):
+        calls.clear()
+        self.worker = Worker(worker_id='test-worker')
+
+    def test_enqueued_task_runs_once(self):
+        queued = record_call.enqueue('hello')
+        self.assertEqual((queued.status, queued.args), (Task.PENDING, ['hello']))
+
+        self.worker.run(once=True)
+
+        queued.refresh_from_db()
+        self.assertEqual(calls, ['hello'])
+        self.assertEqual((queued.status, queued.attempts), (Task.SUCCEEDED, 1))
+        self.assertIsNotNone(queued.finished_at)
+
+    def test_higher_priority_runs_first_and_delayed_tasks_wait(self):
+        enqueue('task_queue.tests.record_call', args=['low'], priority=-5)
+        enqueue('task_queue.tests.record_call', args=['high'], priority=5)
+        enqueue('task_queue.tests.record_call', args=['later'], priority=10, delay=timedelta(hours=1))
+
+        self.worker.run(once=True)
+
+        self.assertEqual(calls, ['high', 'low'])
+        self.assertEqual(Task.objects.get(args=['later']).status, Task.PENDING)
+
+    def test_failures_are_retried_with_backoff_then_given_up(self):
+        queued = always_fails.enqueue()
+
+        self.worker.run_batch()
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Task.PENDING, 1))
+        self.assertGreater(queued.run_at, timezone.now())
+        self.assertIn('handler failed', queued.last_error)
+        self.assertEqual(self.worker.run_batch(), 0)  # not due yet
+
+        Task.objects.filter(pk=queued.pk).update(run_at=timezone.now())
+        self.worker.run_batch()
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Task.FAILED, 2))
+
+    def test_tasks_of_a_dead_worker_are_taken_over(self):
+        queued = record_call.enqueue('orphan')
+        Task.objects.filter(pk=queued.pk).update(
+            status=Task.RUNNING, locked_by='dead-worker', locked_at=timezone.now() - timedelta(hours=1), attempts=1
+        )
+
+        self.worker.run(once=True)
+
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Task.SUCCEEDED, 2))
+        self.assertEqual(calls, ['orphan'])
+
+    def test_run_workers_command_drains_the_queue(self):
+        for label in ('a', 'b', 'c'):
+            record_call.enqueue(label)
+
+        call_command('run_workers', '--once', '--batch-size=2', stdout=StringIO())
+
+        self.assertEqual(sorted(calls), ['a', 'b', 'c'])
+        self.assertFalse(Task.objects.exclude(status=Task.SUCCEEDED).exists())
+
+    def test_appointment_status_change_notifies_patient_in_background(self):
+        user = User.objects.create_user(username='queue_patient', email='patient@example.com', password='pw')
+        profile = PatientProfile.objects.create(user=user, date_of_birth='1990-01-01')
+        doctor = Doctor.objects.create(first_name='Queue', last_name='Doc', specialization='GP', department='OPD')
+        appointment = Appointment.objects.create(
+            patient=profile, doctor=doctor, appointment_datetime=timezone.now() + timedelta(days=1)
+        )
+        self.assertFalse(Task.objects.exists())  # creating the appointment does not notify
+
+        appointment.status = 'CANCELLED'
+        appointment.save()
+        self.assertEqual(len(mail.outbox), 0)
+
+        self.worker.run(once=True)
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['patient@example.com'])
+        self.assertIn('cancelled', mail.outbox[0].subject)
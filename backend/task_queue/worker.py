@@ -0,0 +1,116 @@
+"""
+The worker loop run by ``manage.py run_workers``: claim due tasks, run their
+handlers outside the claim transaction, record the outcome, and back off
+failed calls exponentially (with jitter) until they run out of attempts.
+"""
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Task
+from .registry import registry
+
+# Succeeded tasks older than settings.TASK_QUEUE_RETENTION_DAYS are purged this often
+PURGE_INTERVAL = 3600
+
+
+def retry_delay(attempts):
+    """Exponential backoff from TASK_QUEUE_RETRY_BACKOFF seconds, capped and jittered."""
+    delay = min(settings.TASK_QUEUE_RETRY_BACKOFF * 2 ** (attempts - 1), settings.TASK_QUEUE_MAX_BACKOFF)
+    return timedelta(seconds=delay / 2 + random.uniform(0, delay / 2))
+
+
+class Worker:
+    def __init__(self, worker_id=None, batch_size=1, poll_interval=None, stdout=None):
+        self.worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+        self.batch_size = batch_size
+        self.poll_interval = settings.TASK_QUEUE_POLL_INTERVAL if poll_interval is None else poll_interval
+        self.stdout = stdout
+        self.last_purge = 0.0
+
+    def run(self, once=False, stop_event=None):
+        """Process tasks until stop_event is set, or until nothing is due when once is True."""
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            self.purge_finished()
+            processed = self.run_batch()
+            if not processed:
+                if once:
+                    return
+                stop_event.wait(self.poll_interval)
+
+    def run_batch(self):
+        close_old_connections()
+        claimed = self.claim()
+        for task in claimed:
+            self.execute(task)
+        return len(claimed)
+
+    def claim(self):
+        now = timezone.now()
+        claimable = Q(status=Task.PENDING, run_at__lte=now) | Q(
+            status=Task.RUNNING, locked_at__lt=now - timedelta(seconds=settings.TASK_QUEUE_LEASE_SECONDS)
+        )
+        with transaction.atomic():
+            ids = list(
+                Task.objects.select_for_update(skip_locked=True)
+                .filter(claimable)
+                .order_by('-priority', 'run_at', 'id')
+                .values_list('id', flat=True)[:self.batch_size]
+            )
+            if ids:
+                Task.objects.filter(id__in=ids).update(
+                    status=Task.RUNNING, locked_by=self.worker_id, locked_at=now, attempts=F('attempts') + 1
+                )
+        return list(Task.objects.filter(id__in=ids).order_by('-priority', 'run_at', 'id')) if ids else []
+
+    def execute(self, task):
+        handler = registry.get(task.name)
+        if handler is None:
+            self.finish(task, Task.FAILED, f"No task handler registered as '{task.name}'")
+            return
+        if task.attempts > task.max_attempts:
+            # Claimed again after its worker died on the last attempt
+            self.finish(task, Task.FAILED, task.last_error or 'Worker lease expired')
+            return
+
+        try:
+            handler.func(*task.args, **task.kwargs)
+        except Exception:
+            error = traceback.format_exc()
+            if task.attempts >= task.max_attempts:
+                self.finish(task, Task.FAILED, error)
+            else:
+                self.finish(task, Task.PENDING, error, run_at=timezone.now() + retry_delay(task.attempts))
+            self.log(f"{task} attempt {task.attempts}/{task.max_attempts} failed: {error.splitlines()[-1]}")
+        else:
+            self.finish(task, Task.SUCCEEDED)
+
+    def finish(self, task, status, error='', run_at=None):
+        changes = {'status': status, 'last_error': error, 'locked_by': '', 'locked_at': None}
+        if run_at is not None:
+            changes['run_at'] = run_at
+        if status in (Task.SUCCEEDED, Task.FAILED):
+            changes['finished_at'] = timezone.now()
+        # Only update the row if this worker still holds it (the lease may have expired)
+        Task.objects.filter(pk=task.pk, locked_by=self.worker_id, status=Task.RUNNING).update(**changes)
+
+    def purge_finished(self):
+        if time.monotonic() - self.last_purge < PURGE_INTERVAL and self.last_purge:
+            return
+        self.last_purge = time.monotonic()
+        cutoff = timezone.now() - timedelta(days=settings.TASK_QUEUE_RETENTION_DAYS)
+        Task.objects.filter(status=Task.SUCCEEDED, finished_at__lt=cutoff).delete()
+
+    def log(self, message):
+        if self.stdout is not None:
+            self.stdout.write(message)
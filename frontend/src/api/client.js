@@ -442,4 +442,25 @@ apiClient.interceptors.response.use(
   }
 );
 
+// List endpoints backed by cursor pagination return {next, previous, results}.
+// Fetch every page of such a list by following `next` until it is null, and
+// resolve with the last response whose data is all the rows as one array.
+// Unpaginated payloads (and mock data) are passed through unchanged.
+export const getAllResults = async (url, config) => {
+  let response = await apiClient.get(url, config);
+  if (!response.data || !Array.isArray(response.data.results)) {
+    return response;
+  }
+  const results = [...response.data.results];
+  while (response.data.next) {
+    response = await apiClient.get(response.data.next);
+    if (!response.data || !Array.isArray(response.data.results)) {
+      // Never return a partial list as if it were complete
+      throw new Error(`Unexpected page while fetching ${url}`);
+    }
+    results.push(...response.data.results);
+  }
+  return { ...response, data: results };
+};
+
 export default apiClient; 
\ No newline at end of file
@@ -1,6 +1,6 @@
 import React, { useEffect, useState, useRef } from 'react';
 import { Link, useNavigate } from 'react-router-dom';
-import apiClient from '../api/client';
+import apiClient, { getAllResults } from '../api/client';
 import AuthService from '../services/AuthService';
 import Modal from '../components/Modal';
 import AppointmentForm from '../components/forms/AppointmentForm';
@@ -96,10 +96,11 @@ export default function DoctorDashboard() {
           return { data: [] };
         });
         
-        const labTestsResponse = await apiClient.get('/lab-tests/').catch(err => {
-          console.error("Error fetching lab tests:", err);
-          return { data: [] };
-        });
+        const labTestsResponse = await getAllResults('/lab-tests/')
+          .catch(err => {
+            console.error("Error fetching lab tests:", err);
+            return { data: [] };
+          });
         
         // Set the fetched data to state
         setDoctors(doctorsResponse.data || []);
@@ -1,6 +1,6 @@
 import { useEffect, useState, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
-import apiClient from '../api/client';
+import apiClient, { getAllResults } from '../api/client';
 import AuthService from '../services/AuthService';
 import Modal from '../components/Modal';
 import DoctorForm from '../components/forms/DoctorForm';
@@ -109,7 +109,7 @@ export default function HMSDashboard() {
         
         // Fetch both patient data sources
         const patientProfilesPromise = apiClient.get('/patients/');
-        const hmsPatientPromise = apiClient.get('/hms-patients/');
+        const hmsPatientPromise = getAllResults('/hms-patients/');
         
         // Wait for both requests to complete
         const [patientProfilesResponse, hmsPatientResponse] = await Promise.all([
@@ -216,7 +216,7 @@ export default function HMSDashboard() {
       
       try {
         console.log('Fetching appointments data...');
-        const appointmentsResponse = await apiClient.get('/appointments/');
+        const appointmentsResponse = await getAllResults('/appointments/');
         console.log('Appointments data:', appointmentsResponse.data);
         
         const sanitizedAppointments = Array.isArray(appointmentsResponse.data)
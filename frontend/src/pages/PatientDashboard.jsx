@@ -1,6 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
-import apiClient from '../api/client';
+import apiClient, { getAllResults } from '../api/client';
 import Modal from '../components/Modal';
 import AppointmentForm from '../components/forms/AppointmentForm';
 import ConfirmDialog from '../components/ConfirmDialog';
@@ -63,15 +63,15 @@ const PatientDashboard = () => {
         setProfile(patientProfile);
         
         // Fetch patient appointments
-        const appointmentsResponse = await apiClient.get('/appointments/');
+        const appointmentsResponse = await getAllResults('/appointments/');
         setAppointments(appointmentsResponse.data || []);
         
         // Fetch medical records
-        const medicalRecordsResponse = await apiClient.get('/medical-records/');
+        const medicalRecordsResponse = await getAllResults('/medical-records/');
         setMedicalRecords(medicalRecordsResponse.data || []);
         
         // Fetch lab test orders
-        const labTestsResponse = await apiClient.get('/lab-tests/');
+        const labTestsResponse = await getAllResults('/lab-tests/');
         setLabTests(labTestsResponse.data || []);
         
         // Fetch doctors for appointment scheduling
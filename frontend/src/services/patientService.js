@@ -1,4 +1,4 @@
-import apiClient from '../api/client';
+import apiClient, { getAllResults } from '../api/client';
 
 // Patient profile services
 export const getPatientProfile = async () => {
@@ -39,7 +39,7 @@ export const updatePatientProfile = async (profileId, profileData) => {
 // Appointment services
 export const getPatientAppointments = async () => {
   try {
-    const response = await apiClient.get('/appointments/');
+    const response = await getAllResults('/appointments/');
     return response.data || [];
   } catch (error) {
     console.error('Error fetching patient appointments:', error);
@@ -70,7 +70,7 @@ export const cancelAppointment = async (appointmentId) => {
 // Medical records services
 export const getPatientMedicalRecords = async () => {
   try {
-    const response = await apiClient.get('/medical-records/');
+    const response = await getAllResults('/medical-records/');
     return response.data || [];
   } catch (error) {
     console.error('Error fetching medical records:', error);
@@ -81,7 +81,7 @@ export const getPatientMedicalRecords = async () => {
 // Lab test services
 export const getPatientLabTests = async () => {
   try {
-    const response = await apiClient.get('/lab-tests/');
+    const response = await getAllResults('/lab-tests/');
     return response.data || [];
   } catch (error) {
     console.error('Error fetching lab tests:', error);